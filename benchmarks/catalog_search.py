@@ -0,0 +1,76 @@
+"""
+Compare searching backups with the catalog and by reading every backup's index.
+
+Creates a folder of backups of a synthetic index, changing a few files in each backup,
+builds the catalog, then times looking up a file by full path and by name with
+search_backup and with scan_backups.
+
+    python benchmarks/catalog_search.py --backups 200 --entries 10000
+"""
+
+import os
+import tarfile
+from argparse import ArgumentParser
+from hashlib import md5
+
+from common import quiet_logging, temp_dir, timed
+
+from backpy.backpy import scan_backups, search_backup
+from backpy.backup import rebuild_catalog
+from backpy.file_index import FileIndex
+from backpy.file_table import FileTable
+
+ROOT = "/home/user/documents"
+
+
+def file_path(i):
+    return "%s/d%03d/file%07d.txt" % (ROOT, i // 100, i)
+
+
+def make_backups(folder, backups, entries, changes=10):
+    """Create backup tarfiles of an index where a few files change each time."""
+    index = FileIndex(ROOT, reading=True)
+    index.__files__ = FileTable((file_path(i), md5(b"%d" % i).hexdigest()) for i in range(entries))
+    index.__dirs__.update(os.path.dirname(file_path(i)) for i in range(0, entries, 100))
+    temp_index = os.path.join(folder, "temp.index")
+    for b in range(backups):
+        for c in range(changes):
+            i = (b * changes + c) % entries
+            index.__files__[file_path(i)] = md5(b"%d:%d" % (b, i)).hexdigest()
+        index.write_index(temp_index, packed=False)
+        with tarfile.open(os.path.join(folder, "2020%010d_backup.tar.gz" % b), "w:gz") as tar:
+            tar.add(temp_index, ".index")
+    os.remove(temp_index)
+
+
+def search(func, folder, filename, exact_match):
+    files = []
+    folders = []
+    func(folder, filename, files, folders, exact_match)
+    return len(files)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--backups", type=int, default=200)
+    parser.add_argument("--entries", type=int, default=10000, help="files in each index")
+    args = parser.parse_args()
+
+    quiet_logging()
+    with temp_dir() as folder:
+        make_backups(folder, args.backups, args.entries)
+        seconds, _ = timed(rebuild_catalog, folder, repeat=1)
+        print("catalog built from %d backups in %.2fs" % (args.backups, seconds))
+        print("search           scan time  catalog time  versions found")
+        for label, filename, exact_match in (
+            ("full path", file_path(5), True),
+            ("name only", os.path.basename(file_path(5)), False),
+        ):
+            scan_seconds, scan_found = timed(search, scan_backups, folder, filename, exact_match)
+            catalog_seconds, found = timed(search, search_backup, folder, filename, exact_match)
+            assert found == scan_found
+            print("%-15s  %8.2fs  %11.3fs  %14d" % (label, scan_seconds, catalog_seconds, found))
+
+
+if __name__ == "__main__":
+    main()
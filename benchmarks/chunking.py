@@ -0,0 +1,104 @@
+"""
+Measure chunking throughput and how much of an edited file is stored again.
+
+Creates a file of random data and versions of it with localised edits: bytes
+overwritten, bytes inserted and bytes removed at a few places. Each version is split
+with Chunker, and with fixed size blocks for comparison, and the chunks not already seen
+in earlier versions are counted as stored.
+
+    python benchmarks/chunking.py --size 256 --versions 10 --edits 3 --bits 18
+"""
+
+import io
+import random
+from argparse import ArgumentParser
+from hashlib import sha256
+
+from common import quiet_logging, rate, timed
+
+from backpy.chunker import CHUNK_BITS, MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, Chunker
+from backpy.helpers import format_size
+
+
+def make_versions(size, versions, edits, seed=0):
+    """Create a file's contents and versions of it, each with a few edits to the last."""
+    rng = random.Random(seed)
+    data = bytearray(rng.randbytes(size))
+    result = [bytes(data)]
+    for _ in range(1, versions):
+        for _ in range(edits):
+            pos = rng.randrange(len(data))
+            kind = rng.choice(("overwrite", "insert", "remove"))
+            if kind == "overwrite":
+                end = pos + 4096
+                data[pos:end] = rng.randbytes(4096)
+            elif kind == "insert":
+                data[pos:pos] = rng.randbytes(rng.randrange(1, 4096))
+            else:
+                end = pos + rng.randrange(1, 4096)
+                del data[pos:end]
+        result.append(bytes(data))
+    return result
+
+
+def fixed_chunks(data, size):
+    view = memoryview(data)
+    return [bytes(view[i:][:size]) for i in range(0, len(data), size)]
+
+
+def stored(versions, split):
+    """Get the total size of the chunks of all versions and the size of unique chunks."""
+    seen = set()
+    total = 0
+    unique = 0
+    for data in versions:
+        for chunk in split(data):
+            key = sha256(chunk).digest()
+            total += len(chunk)
+            if key not in seen:
+                seen.add(key)
+                unique += len(chunk)
+    return total, unique, len(seen)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--size", type=int, default=256, help="file size in MB")
+    parser.add_argument("--versions", type=int, default=10)
+    parser.add_argument("--edits", type=int, default=3, help="edits in each version")
+    parser.add_argument("--bits", type=int, default=CHUNK_BITS)
+    parser.add_argument("--min-size", type=int, default=MIN_CHUNK_SIZE // 1024, help="in KB")
+    args = parser.parse_args()
+
+    quiet_logging()
+    versions = make_versions(args.size * 1024 * 1024, args.versions, args.edits)
+    chunker = Chunker(args.min_size * 1024, args.bits, MAX_CHUNK_SIZE)
+
+    def split(data):
+        return list(chunker.chunks(io.BytesIO(data)))
+
+    seconds, chunks = timed(split, versions[0])
+    print(
+        "chunking %s at %s, %d chunks averaging %s"
+        % (
+            format_size(len(versions[0])),
+            rate(len(versions[0]), seconds),
+            len(chunks),
+            format_size(len(versions[0]) / len(chunks)),
+        )
+    )
+    average = len(versions[0]) // len(chunks)
+    print("method                total      stored   chunks  saved")
+    for label, func in (
+        ("content defined", split),
+        ("fixed size", lambda data: fixed_chunks(data, average)),
+    ):
+        total, unique, count = stored(versions, func)
+        print(
+            "%-15s  %10s  %10s  %7d  %4.1fx"
+            % (label, format_size(total), format_size(unique), count, total / unique)
+        )
+
+
+if __name__ == "__main__":
+    main()
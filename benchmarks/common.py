@@ -0,0 +1,72 @@
+"""Shared helpers for the backpy benchmarks."""
+
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from backpy.helpers import delete_temp_files, format_size
+from backpy.logger import LOG_NAME
+
+
+def quiet_logging():
+    """Stop backpy logging to the console while timing."""
+    logging.getLogger(LOG_NAME).disabled = True
+
+
+def make_tree(root, num_files, file_size, files_per_dir=100, seed=None):
+    """
+    Create a synthetic source tree of random files.
+    :param root: Directory to create the files in.
+    :param num_files: Number of files to create.
+    :param file_size: Size of each file in bytes.
+    :param files_per_dir: Number of files in each sub folder.
+    :param seed: Bytes to start each file with, so files are not all identical.
+    :return: List of file paths created.
+    """
+    paths = []
+    block = os.urandom(min(file_size, 1024 * 1024)) if file_size else b""
+    for i in range(num_files):
+        folder = os.path.join(root, "d%04d" % (i // files_per_dir))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        path = os.path.join(folder, "f%06d.bin" % i)
+        with open(path, "wb") as f:
+            remaining = file_size
+            f.write((seed or b"") + str(i).encode())
+            while remaining > 0:
+                f.write(block[:remaining])
+                remaining -= len(block)
+        paths.append(path)
+    return paths
+
+
+@contextmanager
+def temp_dir():
+    """Create a temporary directory and delete it afterwards."""
+    path = tempfile.mkdtemp(prefix="backpy_bench_")
+    try:
+        yield path
+    finally:
+        delete_temp_files(path)
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    """
+    Run a function several times.
+    :return: Best time in seconds and the result of the last run.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def rate(nbytes, seconds):
+    """Format a throughput as a string."""
+    return "%s/s" % format_size(nbytes / seconds if seconds else 0)
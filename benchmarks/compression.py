@@ -0,0 +1,110 @@
+"""
+Compare the backup archive codecs on a mix of files.
+
+Creates a corpus of text, already compressed (random) and sparse binary files, or uses
+the files in --source, and times writing them to a tarfile with each codec in the same
+way as a backup does. Prints the throughput and the size of the archive compared to the
+files, so a codec can be chosen for each backup destination with --compression.
+
+    python benchmarks/compression.py --size 64 --codecs none gz:1 gz:6 gz bz2 xz:0 xz
+"""
+
+import os
+import random
+import tarfile
+from argparse import ArgumentParser
+
+from common import quiet_logging, rate, temp_dir, timed
+
+from backpy.backup import ARCHIVE_FORMATS
+from backpy.helpers import format_size, parse_compression
+
+WORDS = (
+    "backup restore index folder file hash archive source destination config skip "
+    "the of and to in is that for it with as was on be at by this had not are but from"
+).split()
+
+
+def make_corpus(root, size):
+    """
+    Create a third each of text, random and sparse binary files.
+    :param root: Directory to create the files in.
+    :param size: Total size of the files in bytes.
+    """
+    part = size // 3
+    rng = random.Random(0)
+    text_dir = os.path.join(root, "text")
+    os.makedirs(text_dir)
+    for i in range(max(part // (256 * 1024), 1)):
+        with open(os.path.join(text_dir, "log%04d.txt" % i), "w") as f:
+            written = 0
+            while written < 256 * 1024:
+                line = "%06d %s\n" % (rng.randrange(10**6), " ".join(rng.choices(WORDS, k=12)))
+                f.write(line)
+                written += len(line)
+    # random data stands in for photos, videos and other already compressed files
+    random_dir = os.path.join(root, "random")
+    os.makedirs(random_dir)
+    for i in range(max(part // (1024 * 1024), 1)):
+        with open(os.path.join(random_dir, "photo%04d.jpg" % i), "wb") as f:
+            f.write(rng.randbytes(1024 * 1024))
+    sparse_dir = os.path.join(root, "sparse")
+    os.makedirs(sparse_dir)
+    for i in range(max(part // (1024 * 1024), 1)):
+        with open(os.path.join(sparse_dir, "data%04d.db" % i), "wb") as f:
+            for _ in range(256):
+                f.write(bytes(3072) + rng.randbytes(1024))
+
+
+def write_archive(path, source, compression):
+    """Write all files in a folder to a tarfile, as Backup.write_to_disk does."""
+    codec, level = compression
+    _, mode, level_arg = ARCHIVE_FORMATS[codec]
+    options = {level_arg: level} if level is not None else {}
+    with tarfile.open(path, mode, **options) as tar:
+        tar.add(source, "files")
+    return os.path.getsize(path)
+
+
+def folder_size(root):
+    return sum(
+        os.path.getsize(os.path.join(folder, name))
+        for folder, _, names in os.walk(root)
+        for name in names
+    )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--size", type=int, default=64, help="corpus size in MB")
+    parser.add_argument("--source", help="folder of files to use instead of the corpus")
+    parser.add_argument(
+        "--codecs", nargs="+", default=["none", "gz:1", "gz:6", "gz", "bz2", "xz:0", "xz"]
+    )
+    args = parser.parse_args()
+
+    quiet_logging()
+    with temp_dir() as folder:
+        source = args.source
+        if source is None:
+            source = os.path.join(folder, "corpus")
+            make_corpus(source, args.size * 1024 * 1024)
+        total = folder_size(source)
+        print("%s of files" % format_size(total))
+        print("codec    throughput     archive    ratio")
+        for codec in args.codecs:
+            compression = parse_compression(codec)
+            if compression is None:
+                print("%-7s  unknown codec" % codec)
+                continue
+            path = os.path.join(folder, "backup" + ARCHIVE_FORMATS[compression[0]][0])
+            seconds, size = timed(write_archive, path, source, compression, repeat=1)
+            os.remove(path)
+            print(
+                "%-7s  %10s  %10s  %6.1f%%"
+                % (codec, rate(total, seconds), format_size(size), 100.0 * size / total)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measure the size of deltas of an edited file and the time to restore through a chain.
+
+Creates a file of random data and versions of it with a few localised edits each, as in
+benchmarks/chunking.py, and backs up each version as a delta against the one before,
+with a full copy after every --depth deltas as Backup.write_to_disk does. Prints the
+space used compared to full copies, and the time to rebuild the last version by
+applying each delta in its chain.
+
+    python benchmarks/delta.py --size 256 --versions 10 --edits 3 --depth 5
+"""
+
+import io
+from argparse import ArgumentParser
+
+from chunking import make_versions
+from common import quiet_logging, rate, timed
+
+from backpy.delta import apply_delta, signature, write_delta
+from backpy.helpers import format_size
+
+
+def write_deltas(versions, depth):
+    """
+    Back up each version as a delta of the one before, or in full after depth deltas.
+    :return: List of (delta or None for a full copy, stored size) for each version.
+    """
+    stored = []
+    base = None
+    for data in versions:
+        f = io.BytesIO(data)
+        if base is None or len(stored) % (depth + 1) == 0:
+            stored.append((None, len(data)))
+            base = signature(f)
+            continue
+        out = io.BytesIO()
+        base = write_delta(f, base, out)
+        stored.append((out.getvalue(), out.tell()))
+    return stored
+
+
+def rebuild(versions, stored):
+    """Rebuild the last version from the last full copy and the deltas after it."""
+    full = max(i for i, (delta, _) in enumerate(stored) if delta is None)
+    data = versions[full]
+    for delta, _ in stored[full:][1:]:
+        out = io.BytesIO()
+        apply_delta(io.BytesIO(delta), io.BytesIO(data), out)
+        data = out.getvalue()
+    return data, len(stored) - 1 - full
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--size", type=int, default=256, help="file size in MB")
+    parser.add_argument("--versions", type=int, default=10)
+    parser.add_argument("--edits", type=int, default=3, help="edits in each version")
+    parser.add_argument("--depth", type=int, default=5, help="deltas before a full copy")
+    args = parser.parse_args()
+
+    quiet_logging()
+    versions = make_versions(args.size * 1024 * 1024, args.versions, args.edits)
+    total = sum(len(data) for data in versions)
+    seconds, stored = timed(write_deltas, versions, args.depth, repeat=1)
+    size = sum(length for _, length in stored)
+    print("%d versions, %s in full" % (len(versions), format_size(total)))
+    print(
+        "deltas  %s in %.1fs (%s), %.1f%% of full copies"
+        % (format_size(size), seconds, rate(total, seconds), 100.0 * size / total)
+    )
+    seconds, (data, depth) = timed(rebuild, versions, stored, repeat=1)
+    assert data == versions[-1]
+    print("restore %d deltas in %.1fs (%s)" % (depth, seconds, rate(len(data) * depth, seconds)))
+
+
+if __name__ == "__main__":
+    main()
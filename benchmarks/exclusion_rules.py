@@ -0,0 +1,67 @@
+"""
+Benchmark matching paths against exclusion rules.
+
+Compares checking each fnmatch rule in turn, as FileIndex used to, with the compiled
+ExclusionRules matcher, on synthetic paths and a set of typical global skips.
+
+    python benchmarks/exclusion_rules.py --paths 200000 --rules 40
+"""
+
+import fnmatch
+import random
+from argparse import ArgumentParser
+
+from common import timed
+
+from backpy.exclusions import ExclusionRules
+from backpy.helpers import is_windows
+
+RULE_TEMPLATES = ["*.%s", "*/%s/*", "/home/user/%s*", "*%s[0-9].log", "*~%s"]
+WORDS = ["cache", "tmp", "jpg", "build", "node_modules", "logs", "iso", "bak", "git", "venv"]
+
+
+def make_rules(count):
+    return [
+        RULE_TEMPLATES[i % len(RULE_TEMPLATES)] % WORDS[i % len(WORDS)] + "x" * (i // 50)
+        for i in range(count)
+    ]
+
+
+def make_paths(count):
+    rnd = random.Random(1)
+    paths = []
+    for _ in range(count):
+        parts = [rnd.choice(WORDS + ["docs", "src", "photos", "music"]) for _ in range(4)]
+        paths.append("/home/user/%s.%s" % ("/".join(parts), rnd.choice(WORDS)))
+    return paths
+
+
+def fnmatch_loop(paths, rules):
+    match_func = fnmatch.fnmatch if is_windows() else fnmatch.fnmatchcase
+    return sum(1 for p in paths if any(match_func(p, rule) for rule in rules))
+
+
+def compiled(paths, rules):
+    matcher = ExclusionRules(rules)
+    return sum(1 for p in paths if matcher.matches(p))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--paths", type=int, default=100000)
+    parser.add_argument("--rules", type=int, default=40)
+    args = parser.parse_args()
+    rules = make_rules(args.rules)
+    paths = make_paths(args.paths)
+
+    loop_time, expected = timed(fnmatch_loop, paths, rules)
+    compiled_time, actual = timed(compiled, paths, rules)
+    assert expected == actual, "matchers disagree"
+    print("%d paths, %d rules, %d matched" % (len(paths), len(rules), actual))
+    print("fnmatch loop  %10.0f paths/s" % (len(paths) / loop_time))
+    print("compiled      %10.0f paths/s" % (len(paths) / compiled_time))
+    print("speedup       %10.1fx" % (loop_time / compiled_time))
+
+
+if __name__ == "__main__":
+    main()
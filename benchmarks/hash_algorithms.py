@@ -0,0 +1,50 @@
+"""
+Benchmark get_file_hash throughput for each hash algorithm.
+
+Hashes one large file and a folder of small files with every algorithm in
+HASH_ALGORITHMS. Files are read once before timing, so the figures are for a warm
+page cache and show the cost of the algorithm rather than the disk.
+
+    python benchmarks/hash_algorithms.py --large-size 268435456 --small-files 5000
+"""
+
+from argparse import ArgumentParser
+
+from common import make_tree, rate, temp_dir, timed
+
+from backpy.helpers import HASH_ALGORITHMS, get_file_hash
+
+
+def hash_all(paths, algorithm):
+    for path in paths:
+        get_file_hash(path, algorithm=algorithm)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--large-size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--small-files", type=int, default=2000)
+    parser.add_argument("--small-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    with temp_dir() as large_root, temp_dir() as small_root:
+        large = make_tree(large_root, 1, args.large_size)
+        small = make_tree(small_root, args.small_files, args.small_size)
+        hash_all(large + small, "crc32")
+        print("algorithm  large file    small files   small files/s")
+        for algorithm in HASH_ALGORITHMS:
+            large_time, _ = timed(hash_all, large, algorithm)
+            small_time, _ = timed(hash_all, small, algorithm)
+            print(
+                "%-9s  %11s  %12s  %13.0f"
+                % (
+                    algorithm,
+                    rate(args.large_size, large_time),
+                    rate(args.small_files * args.small_size, small_time),
+                    args.small_files / small_time,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
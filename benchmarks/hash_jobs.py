@@ -0,0 +1,48 @@
+"""
+Benchmark FileIndex.gen_index with different numbers of hashing jobs.
+
+Creates a synthetic tree and indexes it with 1 to N jobs. The tree is read once
+before timing, so the figures show hashing scaling with a warm page cache; run on
+a cold cache (e.g. after dropping caches) to include disk throughput.
+
+    python benchmarks/hash_jobs.py --files 2000 --size 1048576 --max-jobs 8
+"""
+
+import os
+from argparse import ArgumentParser
+
+from common import make_tree, quiet_logging, rate, temp_dir, timed
+
+from backpy.file_index import FileIndex
+
+
+def index_tree(root, jobs):
+    index = FileIndex(root, jobs=jobs)
+    index.gen_index()
+    return index
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=1024 * 1024, help="bytes per file")
+    parser.add_argument("--max-jobs", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+    quiet_logging()
+
+    with temp_dir() as root:
+        make_tree(root, args.files, args.size)
+        total = args.files * args.size
+        baseline, expected = timed(index_tree, root, 1)
+        print("jobs  seconds  throughput  speedup")
+        jobs = 1
+        while jobs <= args.max_jobs:
+            seconds, index = timed(index_tree, root, jobs)
+            assert index.files() == expected.files(), "index order changed"
+            speedup = baseline / seconds
+            print("%4d  %7.3f  %10s  %6.2fx" % (jobs, seconds, rate(total, seconds), speedup))
+            jobs *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compare loading text and packed index files with synthetic entries.
+
+Writes an index of each size in both formats, then loads each one in a fresh process
+and reports the load time, the file size and how much the peak resident memory grew
+while loading. Indexes are also written in a separate process, as a new process starts
+with the peak memory of the one that started it. Entries are spread over folders of 100
+files with md5 digests. Unix only, as peak memory is read with the resource module.
+
+    python benchmarks/index_format.py --sizes 100000 1000000 2000000
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from hashlib import md5
+
+from common import quiet_logging, temp_dir
+
+from backpy.file_index import FileIndex
+from backpy.file_table import FileTable
+from backpy.helpers import format_size
+
+FORMATS = ("text", "packed")
+
+
+def entries(count):
+    """Generate synthetic (path, digest) tuples."""
+    for i in range(count):
+        path = "/home/user/documents/d%03d/d%03d/file%07d.txt" % (i // 100000, i // 100 % 1000, i)
+        yield path, md5(path.encode()).hexdigest()
+
+
+def index_paths(folder, count):
+    """Get a dict of format name to index path for the given number of entries."""
+    return {name: os.path.join(folder, "%s_%d.index" % (name, count)) for name in FORMATS}
+
+
+def write_indexes(folder, count):
+    """Write an index with synthetic entries in each format."""
+    quiet_logging()
+    index = FileIndex("/home/user/documents")
+    index.__files__ = FileTable(entries(count))
+    index.__dirs__.update(os.path.dirname(f) for f in index.files())
+    for name, path in index_paths(folder, count).items():
+        index.write_index(path, packed=name == "packed")
+
+
+def peak_rss():
+    """Get the peak resident memory of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, mac reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def load(path):
+    """Read an index and print the seconds taken and the growth in peak memory."""
+    quiet_logging()
+    before = peak_rss()
+    start = time.perf_counter()
+    index = FileIndex("/home/user/documents")
+    index.read_index(path)
+    seconds = time.perf_counter() - start
+    print(seconds, peak_rss() - before, len(index.files()))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--load", help="load one index file and print the results")
+    parser.add_argument("--write", nargs=2, help="write indexes of COUNT entries to FOLDER")
+    args = parser.parse_args()
+    if args.load:
+        load(args.load)
+        return
+    if args.write:
+        write_indexes(args.write[0], int(args.write[1]))
+        return
+
+    quiet_logging()
+    print("   entries  format   file size  load time  peak memory growth")
+    with temp_dir() as folder:
+        for count in args.sizes:
+            subprocess.check_call([sys.executable, __file__, "--write", folder, str(count)])
+            paths = index_paths(folder, count)
+            for name in FORMATS:
+                output = subprocess.check_output(
+                    [sys.executable, __file__, "--load", paths[name]], universal_newlines=True
+                )
+                seconds, growth, loaded = output.split()
+                assert int(loaded) == count
+                print(
+                    "%10d  %-6s  %10s  %8.2fs  %18s"
+                    % (
+                        count,
+                        name,
+                        format_size(os.path.getsize(paths[name])),
+                        float(seconds),
+                        format_size(int(growth)),
+                    )
+                )
+            for path in paths.values():
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
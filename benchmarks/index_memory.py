@@ -0,0 +1,71 @@
+"""
+Measure the memory used by the file list of an index with synthetic entries.
+
+Compares a plain dict of path to hex digest, as the index used to store files, with
+the FileTable used now, and the time taken to build each. Entries are spread over
+folders of 100 files, three levels deep, with md5 digests.
+
+    python benchmarks/index_memory.py --sizes 100000 1000000 5000000
+"""
+
+import gc
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from hashlib import md5
+
+from backpy.file_table import FileTable
+from backpy.helpers import format_size
+
+
+def entries(count):
+    """Generate synthetic (path, digest) tuples."""
+    for i in range(count):
+        path = "/home/user/documents/d%03d/d%03d/file%07d.txt" % (i // 100000, i // 100 % 1000, i)
+        yield path, md5(path.encode()).hexdigest()
+
+
+def measure(build, count):
+    """
+    Build a file list from synthetic entries.
+    :return: Memory held by the file list, and seconds taken to build it without tracing.
+    """
+    gc.collect()
+    tracemalloc.start()
+    # paths are created while tracing, as the index holds the only copy of each path
+    result = build(entries(count))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    items = list(entries(count))
+    gc.collect()
+    start = time.perf_counter()
+    build(items)
+    return size, time.perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    print("   entries  dict size  table size  bytes per entry  dict build  table build")
+    for count in args.sizes:
+        dict_size, dict_seconds = measure(dict, count)
+        table_size, table_seconds = measure(FileTable, count)
+        print(
+            "%10d  %9s  %10s  %7d / %5d  %9.2fs  %10.2fs"
+            % (
+                count,
+                format_size(dict_size),
+                format_size(table_size),
+                dict_size // count,
+                table_size // count,
+                dict_seconds,
+                table_seconds,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
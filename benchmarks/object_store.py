@@ -0,0 +1,89 @@
+"""
+Compare storing near identical sources in tarfiles and in a shared object store.
+
+Creates one source tree and copies of it with a few files changed in each, then times
+writing every copy to its own gzip tarfile, as a full backup does, and adding every copy
+to one ObjectStore, as backups with a shared store do. Prints the time and the space used.
+
+    python benchmarks/object_store.py --sources 10 --files 500 --size 65536 --changed 5
+"""
+
+import os
+import shutil
+import tarfile
+from argparse import ArgumentParser
+
+from common import make_tree, quiet_logging, rate, temp_dir, timed
+
+from backpy.helpers import format_size
+from backpy.object_store import ObjectStore
+
+
+def make_sources(root, sources, files, size, changed):
+    """Create a source tree and copies of it with some files changed in each copy."""
+    paths = []
+    first = os.path.join(root, "source00")
+    make_tree(first, files, size)
+    paths.append(first)
+    for i in range(1, sources):
+        path = os.path.join(root, "source%02d" % i)
+        shutil.copytree(first, path)
+        for j in range(changed):
+            name = os.path.join(path, "d0000", "f%06d.bin" % ((i * changed + j) % files))
+            with open(name, "r+b") as f:
+                f.write(os.urandom(64))
+        paths.append(path)
+    return paths
+
+
+def write_tarfiles(folder, sources):
+    os.makedirs(folder)
+    for i, source in enumerate(sources):
+        with tarfile.open(os.path.join(folder, "%02d_backup.tar.gz" % i), "w:gz") as tar:
+            tar.add(source, "files")
+
+
+def write_store(folder, sources):
+    store = ObjectStore(folder)
+    try:
+        for source in sources:
+            for dirpath, _, names in os.walk(source):
+                for name in names:
+                    store.add_file(os.path.join(dirpath, name))
+    finally:
+        store.close()
+
+
+def folder_size(root):
+    return sum(
+        os.path.getsize(os.path.join(folder, name))
+        for folder, _, names in os.walk(root)
+        for name in names
+    )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sources", type=int, default=10)
+    parser.add_argument("--files", type=int, default=500, help="files in each source")
+    parser.add_argument("--size", type=int, default=64 * 1024, help="size of each file")
+    parser.add_argument("--changed", type=int, default=5, help="files changed in each copy")
+    args = parser.parse_args()
+
+    quiet_logging()
+    with temp_dir() as folder:
+        sources = make_sources(folder, args.sources, args.files, args.size, args.changed)
+        total = sum(folder_size(source) for source in sources)
+        print("%d sources, %s of files" % (len(sources), format_size(total)))
+        print("storage     time  throughput        size")
+        for label, func in (("tarfiles", write_tarfiles), ("store", write_store)):
+            dest = os.path.join(folder, label)
+            seconds, _ = timed(func, dest, sources, repeat=1)
+            print(
+                "%-8s  %5.1fs  %10s  %10s"
+                % (label, seconds, rate(total, seconds), format_size(folder_size(dest)))
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compare writing gzip backup archives with tarfile and with ParallelGzipWriter.
+
+Creates a folder of partly compressible files and times writing it to a .tar.gz with
+tarfile's own single threaded gzip and with ParallelGzipWriter for each number of jobs.
+Throughput should scale with jobs up to the number of cores, for an archive about 1%
+bigger as each block is compressed without the history of the blocks before it.
+
+    python benchmarks/parallel_gzip.py --size 256 --level 6 --jobs 1 2 4 8
+"""
+
+import os
+import random
+import tarfile
+from argparse import ArgumentParser
+
+from common import quiet_logging, rate, temp_dir, timed
+
+from backpy.helpers import format_size
+from backpy.parallel_gzip import BLOCK_SIZE, ParallelGzipWriter
+
+
+def make_files(root, size):
+    """Create 4 MB files of repeated random words, which compress to about a third."""
+    rng = random.Random(0)
+    words = [rng.randbytes(rng.randrange(2, 10)).hex().encode() for _ in range(2000)]
+    os.makedirs(root)
+    for i in range(max(size // (4 * 1024 * 1024), 1)):
+        with open(os.path.join(root, "file%04d.txt" % i), "wb") as f:
+            f.write(b" ".join(rng.choices(words, k=4 * 1024 * 1024 // 12))[: 4 * 1024 * 1024])
+
+
+def write_tarfile(path, source, level):
+    with tarfile.open(path, "w:gz", compresslevel=level) as tar:
+        tar.add(source, "files")
+    return os.path.getsize(path)
+
+
+def write_parallel(path, source, level, jobs, block_size):
+    writer = ParallelGzipWriter(path, level, jobs, block_size)
+    with tarfile.open(mode="w", fileobj=writer) as tar:
+        tar.add(source, "files")
+    writer.close()
+    return os.path.getsize(path)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--size", type=int, default=256, help="size of files in MB")
+    parser.add_argument("--level", type=int, default=6)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE // 1024, help="in KB")
+    args = parser.parse_args()
+
+    quiet_logging()
+    print("%d cores" % os.cpu_count())
+    with temp_dir() as folder:
+        source = os.path.join(folder, "files")
+        make_files(source, args.size * 1024 * 1024)
+        total = sum(os.path.getsize(os.path.join(source, name)) for name in os.listdir(source))
+        path = os.path.join(folder, "backup.tar.gz")
+        print("writer       jobs  throughput     archive")
+        seconds, size = timed(write_tarfile, path, source, args.level, repeat=1)
+        print("tarfile         1  %10s  %10s" % (rate(total, seconds), format_size(size)))
+        for jobs in args.jobs:
+            seconds, size = timed(
+                write_parallel,
+                path,
+                source,
+                args.level,
+                jobs,
+                args.block_size * 1024,
+                repeat=1,
+            )
+            print("parallel  %7d  %10s  %10s" % (jobs, rate(total, seconds), format_size(size)))
+
+
+if __name__ == "__main__":
+    main()
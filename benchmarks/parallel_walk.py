@@ -0,0 +1,60 @@
+"""
+Benchmark FileIndex.walk with different numbers of directory readers.
+
+Creates a synthetic tree of small files and walks it with 1 to N readers. Local
+directory reads are too quick to show the effect of network round trips, so a fixed
+delay can be added to every directory read to simulate a network drive.
+
+    python benchmarks/parallel_walk.py --files 20000 --latency 0.005 --max-walkers 32
+"""
+
+import os
+import time
+from argparse import ArgumentParser
+
+from common import make_tree, quiet_logging, temp_dir, timed
+
+from backpy.file_index import FileIndex
+
+
+def slow_scandir(latency):
+    """Wrap os.scandir to wait before each directory read."""
+    scandir = os.scandir
+
+    def wrapper(path):
+        time.sleep(latency)
+        return scandir(path)
+
+    return wrapper
+
+
+def walk_tree(root, walkers):
+    index = FileIndex(root, walkers=walkers)
+    return [f for f, st in index.walk()]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--files-per-dir", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per folder read")
+    parser.add_argument("--max-walkers", type=int, default=16)
+    args = parser.parse_args()
+    quiet_logging()
+
+    with temp_dir() as root:
+        make_tree(root, args.files, 0, args.files_per_dir)
+        if args.latency:
+            os.scandir = slow_scandir(args.latency)
+        baseline, expected = timed(walk_tree, root, 1)
+        print("walkers  seconds  speedup")
+        walkers = 1
+        while walkers <= args.max_walkers:
+            seconds, files = timed(walk_tree, root, walkers)
+            assert files == expected, "walk order changed"
+            print("%7d  %7.3f  %6.2fx" % (walkers, seconds, baseline / seconds))
+            walkers *= 2
+
+
+if __name__ == "__main__":
+    main()
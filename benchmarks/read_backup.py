@@ -0,0 +1,83 @@
+"""
+Compare reading backup indexes from the tarfile and from the index copy next to it.
+
+Creates a folder of backups, each holding a synthetic index of the given size, and
+times reading all of them with read_backup when the index is only in the tarfile,
+when a plain copy is kept next to it and when a gzip compressed copy is kept.
+
+    python benchmarks/read_backup.py --backups 100 --entries 10000
+"""
+
+import gzip
+import os
+import shutil
+import tarfile
+from argparse import ArgumentParser
+from hashlib import md5
+
+from common import quiet_logging, temp_dir, timed
+
+from backpy.backup import all_backups, index_path, read_backup
+from backpy.file_index import FileIndex
+from backpy.file_table import FileTable
+
+
+def make_backups(folder, backups, entries):
+    """Create backup tarfiles containing a synthetic index."""
+    index = FileIndex("/home/user/documents", reading=True)
+    index.__files__ = FileTable(
+        ("/home/user/documents/d%03d/file%07d.txt" % (i // 100, i), md5(b"%d" % i).hexdigest())
+        for i in range(entries)
+    )
+    temp_index = os.path.join(folder, "temp.index")
+    index.write_index(temp_index, packed=False)
+    payload = os.path.join(folder, "payload")
+    with open(payload, "wb") as f:
+        f.write(os.urandom(1024 * 1024))
+    for i in range(backups):
+        path = os.path.join(folder, "2020%010d_backup.tar.gz" % i)
+        with tarfile.open(path, "w:gz") as tar:
+            tar.add(temp_index, ".index")
+            tar.add(payload, "payload")
+    os.remove(temp_index)
+    os.remove(payload)
+
+
+def read_all(folder):
+    for name in all_backups(folder):
+        read_backup(os.path.join(folder, name))
+
+
+def set_copies(folder, mode):
+    """Remove, or write plain or compressed, index copies next to each backup."""
+    for name in all_backups(folder):
+        path = os.path.join(folder, name)
+        copy = index_path(path)
+        if os.path.exists(copy):
+            os.remove(copy)
+        if mode == "none":
+            continue
+        with tarfile.open(path, "r:gz") as tar:
+            src = tar.extractfile(".index")
+            with gzip.open(copy, "wb") if mode == "gz" else open(copy, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--backups", type=int, default=100)
+    parser.add_argument("--entries", type=int, default=10000, help="files in each index")
+    args = parser.parse_args()
+
+    quiet_logging()
+    with temp_dir() as folder:
+        make_backups(folder, args.backups, args.entries)
+        print("index read from   total time  per backup")
+        for mode, label in (("none", "tarfile"), ("plain", "plain copy"), ("gz", "gzip copy")):
+            set_copies(folder, mode)
+            seconds, _ = timed(read_all, folder)
+            print("%-15s  %9.2fs  %9.1fms" % (label, seconds, 1000 * seconds / args.backups))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,20 @@
 """backpy backup application."""
 
-from . import backpy, backup, file_index, helpers, logger
+from . import (
+    backpy,
+    backup,
+    catalog,
+    chunker,
+    delta,
+    exclusions,
+    file_index,
+    file_table,
+    hash_cache,
+    helpers,
+    logger,
+    object_store,
+    packed_index,
+    parallel_gzip,
+    path_tree,
+    watcher,
+)
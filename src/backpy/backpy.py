@@ -28,90 +28,54 @@ POSSIBILITY OF SUCH DAMAGE.
 import logging
 import os
 import re
-import tarfile
 from argparse import ArgumentParser
 from contextlib import closing
 from datetime import datetime
 from importlib.metadata import version
 
-from .backup import TEMP_DIR, Backup
+from .backup import (
+    TEMP_DIR,
+    Backup,
+    all_backups,
+    latest_backup,
+    open_catalog,
+    read_backup,
+    rebuild_catalog,
+)
 from .file_index import FileIndex
+from .hash_cache import HashCache
 from .helpers import (
+    COMPRESSION_KEY,
     CONFIG_FILE,
     DEFAULT_KEY,
+    DELTA_DEPTH_KEY,
     SKIP_KEY,
+    STORAGE_KEY,
     VERSION_KEY,
-    delete_temp_files,
+    WATCH_INTERVAL_KEY,
+    get_config_compression,
+    get_config_delta_depth,
+    get_config_int,
     get_config_key,
+    get_config_storage,
     get_config_version,
     handle_arg_spaces,
     list_contains,
     make_directory,
+    parse_compression,
+    parse_delta_depth,
+    parse_storage,
     string_contains,
     string_equals,
     update_config_file,
 )
 from .logger import LOG_NAME, set_up_logging
+from .object_store import STORE_NAME
+from .watcher import DEFAULT_WATCH_INTERVAL, Journal, watch
 
 LOG = logging.getLogger(LOG_NAME)
 
 
-def read_backup(path):
-    """
-    Read a backup from disk and return as a Backup object.
-    :param path: Path of backup tarfile.
-    :return: Opened Backup object.
-    """
-    LOG.debug("Reading backup %s", path)
-    timestamp = os.path.basename(path).split("_")[0]
-    temp_path = os.path.join(TEMP_DIR, ".%sindex" % timestamp)
-    try:
-        with closing(tarfile.open(path, "r:*")) as tar:
-            tar.extract(".index", temp_path)
-    except (OSError, tarfile.TarError):  # pragma: no cover
-        LOG.exception("Could not read backup")
-
-    index = FileIndex(temp_path, reading=True)
-    index.read_index(os.path.join(temp_path, ".index"))
-    # delete temp index now we've read it
-    delete_temp_files(temp_path)
-    return Backup(os.path.dirname(path), index, timestamp=timestamp)
-
-
-def all_backups(path, reverse_order=True):
-    """
-    Find all the backups in a directory.
-    :param path: Directory to search for backup tarfiles.
-    :param reverse_order: Whether to return backup paths in reverse order.
-    :return: A list of file paths.
-    """
-    LOG.debug("Finding previous backups.")
-    backups = []
-    if os.path.isabs(path) is None:
-        path = os.path.join(os.path.curdir, path)
-    if os.path.exists(path):
-        files = os.listdir(path)
-        for f in files:
-            if os.path.basename(f).endswith(".tar.gz"):
-                backups.append(f)
-        backups.sort(reverse=reverse_order)
-    return backups
-
-
-def latest_backup(path):
-    """
-    Find the newest backup in a directory.
-    :param path: Directory to search for backup tarfiles.
-    :return: Backup object of the newest backup in the directory or None if no backups found.
-    """
-    backups = all_backups(path)
-    if not backups:
-        return None
-    last_backup = backups[0]
-    LOG.info("Reading latest backup (%s) for comparison", last_backup)
-    return read_backup(os.path.join(path, last_backup))
-
-
 def get_config_index(dirlist, src, dest):
     """
     Find the entry in the config file with the given source and destination.
@@ -325,6 +289,81 @@ def delete_global_skip(path, skips):
     LOG.warning("Global skip %s not found in list", skips)
 
 
+def set_dest_setting(path, key, value, dest=None):
+    """
+    Set a setting for backups to a destination folder in the config file, replacing any
+    earlier value for the same destination.
+    :param path: Path to config file.
+    :param key: Key of setting, e.g. compression.
+    :param value: Value to set.
+    :param dest: Destination directory to set the value for, or None to set it for every
+    destination without its own value.
+    """
+    LOG.debug("Setting %s %s for %s", key, value, dest or "all destinations")
+    if dest is not None:
+        if not os.path.isabs(dest):
+            LOG.warning("Relative path used for destination dir, adding current dir")
+            dest = os.path.abspath(dest)
+        dest = os.path.normpath(dest)
+    entries = []
+    for entry in get_config_key(path, key):
+        folder = entry.rpartition(",")[0]
+        if dest is None and not folder:
+            continue
+        if dest is not None and folder and string_equals(os.path.normpath(folder), dest):
+            continue
+        entries.append(entry)
+    entries.append(value if dest is None else "{0},{1}".format(dest, value))
+    update_config_file(path, key, entries)
+
+
+def set_compression(path, compression, dest=None):
+    """
+    Set the compression of new backups in the config file. Existing backups are not changed.
+    :param path: Path to config file.
+    :param compression: Codec with an optional level, e.g. gz:6, see parse_compression.
+    :param dest: Destination directory to set compression for, or None to set it for every
+    destination without its own setting.
+    """
+    if parse_compression(compression) is None:
+        LOG.error("Unknown compression %s", compression)
+        return
+    set_dest_setting(path, COMPRESSION_KEY, compression, dest)
+
+
+def set_storage(path, storage, dest=None):
+    """
+    Set how new backups are stored in the config file. Existing backups are not changed.
+    :param path: Path to config file.
+    :param storage: tar, store or store:path, see parse_storage.
+    :param dest: Destination directory to set storage for, or None to set it for every
+    destination without its own setting.
+    """
+    parsed = parse_storage(storage)
+    if parsed is None:
+        LOG.error("Unknown storage %s", storage)
+        return
+    if parsed[1] is not None and not os.path.isabs(parsed[1]):
+        LOG.warning("Relative path used for object store, adding current dir")
+        storage = "%s:%s" % (parsed[0], os.path.abspath(parsed[1]))
+    set_dest_setting(path, STORAGE_KEY, storage, dest)
+
+
+def set_delta_depth(path, depth, dest=None):
+    """
+    Set how many deltas of a large file can be backed up in a row before it is backed up
+    in full again, in the config file. 0 backs up every file in full.
+    :param path: Path to config file.
+    :param depth: Depth, see parse_delta_depth.
+    :param dest: Destination directory to set the depth for, or None to set it for every
+    destination without its own setting.
+    """
+    if parse_delta_depth(depth) is None:
+        LOG.error("Delta depth %s is not a whole number", depth)
+        return
+    set_dest_setting(path, DELTA_DEPTH_KEY, depth, dest)
+
+
 def add_skip(path, skips, add_regex=None):
     """
     Add skips to config file.
@@ -364,12 +403,17 @@ def add_skip(path, skips, add_regex=None):
     write_directory_list(path, dirs)
 
 
-def perform_backup(directories, timestamp=None, adb=False):
+def perform_backup(directories, timestamp=None, adb=False, jobs=None, rehash=False, walkers=None):
     """
     Run backup of selected directories.
     :param directories: List of directories to backup.
     :param timestamp: Used for unit testing. If not given, the current time will be used.
     :param adb: If true, use adb for backup.
+    :param jobs: Number of files to hash at once. If not given, the config file value is used.
+    :param rehash: If true, hash every file in full instead of using the hash cache or the
+    quick hashes from the last backup.
+    :param walkers: Number of directories to read at once. If not given, the config file
+    value is used.
     """
     if len(directories) < 2:
         LOG.error("Not enough directories to backup")
@@ -388,15 +432,30 @@ def perform_backup(directories, timestamp=None, adb=False):
         if not os.path.exists(dest):
             # make directory failed
             return
-    fi = FileIndex(src, skip, adb=adb)
-    fi.gen_index()
-    backup = Backup(dest, fi, latest_backup(dest), timestamp)
+    # files on a phone are not read when hashing, so do not need caching
+    cache = None if adb else HashCache(src, rehash)
+    journal = None if adb else Journal(src)
+    fi = FileIndex(
+        src, skip, adb=adb, jobs=jobs, hash_cache=cache, walkers=walkers, journal=journal
+    )
+    parent = latest_backup(dest)
+    # when rehashing, don't trust quick hashes from the last backup either
+    fi.gen_index(parent.get_index() if parent and not rehash else None)
+    compression = get_config_compression(CONFIG_FILE, dest)
+    storage, store = get_config_storage(CONFIG_FILE, dest)
+    if storage != "tar" and store is None:
+        store = os.path.join(dest, STORE_NAME)
+    delta_depth = get_config_delta_depth(CONFIG_FILE, dest)
+    backup = Backup(
+        dest, fi, parent, timestamp, compression, store, storage == "chunks", delta_depth
+    )
     backup.write_to_disk()
 
 
 def search_backup(path, filename, files, folders, exact_match=True):
     """
     Look through all the backups in path for filename, returning any files or folders that match.
+    Uses the catalog of the backup folder, so only the backups found are read.
     :param path: Path to backup folder.
     :param filename: Name of file to search for.
     :param files: List of file names.
@@ -404,6 +463,33 @@ def search_backup(path, filename, files, folders, exact_match=True):
     :param exact_match: If True, match the name exactly, if False, do a partial match.
     """
     LOG.debug("Searching %s (exact=%s)", path, exact_match)
+    found = None
+    catalog = open_catalog(path)
+    if catalog is not None:
+        with closing(catalog):
+            found = catalog.find(filename, exact_match)
+    if found is None:
+        scan_backups(path, filename, files, folders, exact_match)
+        return
+    file_backups, folder_backups = found
+    # read each backup once, even if it holds both a file and a folder that match
+    backups = {}
+    for name in file_backups + folder_backups:
+        if name not in backups:
+            backups[name] = read_backup(os.path.join(path, name))
+    files.extend(backups[name] for name in file_backups)
+    folders.extend(backups[name] for name in folder_backups)
+
+
+def scan_backups(path, filename, files, folders, exact_match=True):
+    """
+    Read every backup in path looking for filename, returning any files or folders that match.
+    :param path: Path to backup folder.
+    :param filename: Name of file to search for.
+    :param files: List of file names.
+    :param folders: List of folder names.
+    :param exact_match: If True, match the name exactly, if False, do a partial match.
+    """
     last_hash = None
     last_backup = None
     # we don't know if user has entered a file or a folder, so search both
@@ -590,6 +676,30 @@ def parse_args():  # pragma: no cover
         "-v", "--verbose", action="store_true", dest="verbose", help="Enable verbose logging."
     )
     parser.add_argument("--version", action="store_true", dest="show_version", help="Show version.")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        dest="jobs",
+        help="Number of files to hash at once during a backup. Overrides the jobs value "
+        "in the config file (default 1).",
+    )
+    parser.add_argument(
+        "--walkers",
+        metavar="N",
+        type=int,
+        dest="walkers",
+        help="Number of directories to read at once during a backup, which helps on network "
+        "drives. Overrides the walkers value in the config file (default 1).",
+    )
+    parser.add_argument(
+        "--rehash",
+        action="store_true",
+        dest="rehash",
+        help="Hash every file in full during a backup, instead of reusing the hashes of "
+        "files that have not changed since the last backup.",
+    )
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
         "-l",
@@ -698,9 +808,85 @@ def parse_args():  # pragma: no cover
         "to copying from /sdcard/, but can optionally specify source folder as "
         "a second argument.",
     )
+    group.add_argument(
+        "--watch",
+        action="store_true",
+        dest="watch",
+        help="Watches all source directories for changes until stopped, so the next backup "
+        "only needs to read the changed files. Uses inotify on Linux, otherwise checks "
+        "for changes every watch interval seconds from the config file (default %d)."
+        % DEFAULT_WATCH_INTERVAL,
+    )
+    group.add_argument(
+        "-z",
+        "--compression",
+        metavar="codec",
+        nargs="+",
+        dest="compression",
+        required=False,
+        help="Sets the compression of new backups: none, gz, bz2 or xz, optionally with a "
+        "level, e.g. gz:6 or xz:9. Applies to all destination directories, or just "
+        "the destination directory or entry index (see list) given after the codec. "
+        "See benchmarks/compression.py to compare codecs on your files.",
+    )
+    group.add_argument(
+        "--storage",
+        metavar="storage",
+        nargs="+",
+        dest="storage",
+        required=False,
+        help="Sets how new backups are stored: tar to add changed files to each backup's "
+        "tarfile, store to add them to an object store in the destination directory, "
+        "so identical contents are only stored once, or store:path to use an object "
+        "store shared with other destination directories. chunks or chunks:path are "
+        "the same as store, but large files are split into chunks so only the parts "
+        "that changed are stored again. Applies to all destination "
+        "directories, or just the destination directory or entry index (see list) "
+        "given after the storage.",
+    )
+    group.add_argument(
+        "--delta-depth",
+        metavar="depth",
+        nargs="+",
+        dest="delta_depth",
+        required=False,
+        help="Sets how many times in a row a large file that changed is backed up as a "
+        "delta against its last backed up version, rather than in full, so small edits "
+        "to big files only add the changed parts to the tarfile. Restoring applies each "
+        "delta in turn, so a file is backed up in full after this many deltas. 0, the "
+        "default, backs up every file in full. Applies to all destination directories, "
+        "or just the destination directory or entry index (see list) given after the "
+        "depth.",
+    )
+    group.add_argument(
+        "--rebuild-catalog",
+        action="store_true",
+        dest="rebuild_catalog",
+        help="Rebuilds the catalog used to search for files to restore in each backup "
+        "directory, from the backups in the directory.",
+    )
     return vars(parser.parse_args())
 
 
+def set_dest_setting_from_args(setter, args, backup_dirs):  # pragma: no cover
+    """
+    Set a destination setting from command line args.
+    :param setter: Function to set the value, e.g. set_compression.
+    :param args: Value, optionally followed by a destination directory or entry index.
+    :param backup_dirs: Entries from the config file.
+    """
+    value = args[0]
+    new_args = handle_arg_spaces(args[1:])
+    if not new_args:
+        setter(CONFIG_FILE, value)
+    elif not new_args[0].isdigit():
+        setter(CONFIG_FILE, value, new_args[0])
+    elif 0 < int(new_args[0]) <= len(backup_dirs):
+        setter(CONFIG_FILE, value, backup_dirs[int(new_args[0]) - 1][1])
+    else:
+        LOG.error("Index is invalid")
+
+
 def run_backpy():  # pragma: no cover
     """Run backpy from commandline args."""
     args = parse_args()
@@ -742,12 +928,26 @@ def run_backpy():  # pragma: no cover
     elif args["backup"]:
         for directory in backup_dirs:
             print("")
-            perform_backup(directory)
+            perform_backup(
+                directory, jobs=args["jobs"], rehash=args["rehash"], walkers=args["walkers"]
+            )
+    elif args["watch"]:
+        interval = get_config_int(CONFIG_FILE, WATCH_INTERVAL_KEY, DEFAULT_WATCH_INTERVAL)
+        watch([directory[0] for directory in backup_dirs], interval)
     elif args["adb"]:
         source = "/sdcard/"
         if len(args["adb"]) > 1:
             source = args["adb"][1]
-        perform_backup([source, args["adb"][0]], adb=True)
+        perform_backup([source, args["adb"][0]], adb=True, jobs=args["jobs"])
+    elif args["compression"]:
+        set_dest_setting_from_args(set_compression, args["compression"], backup_dirs)
+    elif args["storage"]:
+        set_dest_setting_from_args(set_storage, args["storage"], backup_dirs)
+    elif args["delta_depth"]:
+        set_dest_setting_from_args(set_delta_depth, args["delta_depth"], backup_dirs)
+    elif args["rebuild_catalog"]:
+        for directory in backup_dirs:
+            rebuild_catalog(directory[1])
     elif args["restore"] is not None:
         perform_restore(backup_dirs, args["restore"])
     elif args["temp_restore"] is not None:
@@ -25,27 +25,62 @@ POSSIBILITY OF SUCH DAMAGE.
 
 """
 
+import gzip
 import logging
 import os
+import re
+import shutil
+import sqlite3
+import stat
 import subprocess
 import tarfile
 import tempfile
-from contextlib import closing
+from contextlib import closing, contextmanager
+from copy import copy
 from datetime import datetime
 
+from .catalog import CATALOG_NAME, Catalog
+from .chunker import MIN_CHUNKED_FILE_SIZE, Chunker
+from .delta import (
+    MAX_DELTA_RATIO,
+    MIN_DELTA_FILE_SIZE,
+    apply_delta,
+    read_signatures,
+    signature,
+    write_delta,
+    write_signatures,
+)
 from .file_index import FileIndex
 from .helpers import (
     CONFIG_FILE,
+    DEFAULT_COMPRESSION,
+    DEFAULT_INDEX_COMPRESSION,
+    INDEX_COMPRESSION_KEY,
+    INDEX_COMPRESSIONS,
     delete_temp_files,
+    get_config_choice,
     get_file_hash,
-    get_filename_index,
-    get_folder_index,
     is_windows,
-    string_startswith,
 )
 from .logger import LOG_NAME
+from .object_store import ObjectStore
+from .parallel_gzip import ParallelGzipWriter
 
 TEMP_DIR = os.path.join(tempfile.gettempdir(), "backpy")
+# archive extension, tarfile write mode and level argument of each compression codec
+ARCHIVE_FORMATS = {
+    "none": (".tar", "w", None),
+    "gz": (".tar.gz", "w:gz", "compresslevel"),
+    "bz2": (".tar.bz2", "w:bz2", "compresslevel"),
+    "xz": (".tar.xz", "w:xz", "preset"),
+}
+# copy of the index kept next to each backup, so it can be read without opening the tarfile
+INDEX_EXTENSION = ".index"
+# signatures of the large files in a backup, which later backups make deltas against
+SIGNATURE_EXTENSION = ".sig"
+# file name of a backup without its archive extension, see Backup.get_tarpath
+BACKUP_STEM = re.compile(r"\d+_backup")
+GZIP_MAGIC = b"\x1f\x8b"
 LOG = logging.getLogger(LOG_NAME)
 
 
@@ -54,12 +89,32 @@ class Backup:
     Manages file handling during backup and restore.
     """
 
-    def __init__(self, path, index, parent=None, timestamp=None):
+    def __init__(
+        self,
+        path,
+        index,
+        parent=None,
+        timestamp=None,
+        compression=None,
+        store=None,
+        chunking=False,
+        delta_depth=0,
+    ):
         self.__path__ = path
         self.__timestamp__ = timestamp or self.get_timestamp()
+        self.__compression__ = compression or DEFAULT_COMPRESSION
+        # object store to add files to instead of the tarfile, when writing, and whether
+        # to split large files into chunks
+        self.__store__ = store
+        self.__chunker__ = Chunker() if chunking else None
+        # how many deltas of a file can be backed up in a row, or 0 to add files in full
+        self.__delta_depth__ = delta_depth
+        self.__signatures__ = {}
         self.__old_index__ = parent.__new_index__ if parent else None
+        self.__parent_tar__ = os.path.basename(parent.get_tarpath()) if parent else None
         self.__new_index__ = index
         self.__adb__ = index.__adb__
+        self.__jobs__ = index.__jobs__
 
     @staticmethod
     def get_timestamp():
@@ -75,7 +130,26 @@ class Backup:
 
     def get_tarpath(self):
         """Get the location of this backup zip on disk."""
-        return os.path.join(self.__path__, "%s_backup.tar.gz" % self.__timestamp__)
+        extension = ARCHIVE_FORMATS[self.__compression__[0]][0]
+        return os.path.join(self.__path__, "%s_backup%s" % (self.__timestamp__, extension))
+
+    def get_index_path(self):
+        """Get the location of the copy of this backup's index on disk."""
+        return index_path(self.get_tarpath())
+
+    def get_signature_path(self):
+        """Get the location of the signatures of the large files in this backup on disk."""
+        return signature_path(self.get_tarpath())
+
+    def get_store_path(self):
+        """
+        Get the location of the object store holding this backup's files.
+        :return: Path of the store, or None if the files are in the tarfile.
+        """
+        store = self.__new_index__.object_store()
+        if store is None:
+            return None
+        return os.path.normpath(os.path.join(self.__path__, store))
 
     def write_to_disk(self):
         """Add all new and modified files to the zip file for this backup."""
@@ -84,46 +158,42 @@ class Backup:
             return
 
         LOG.debug("Writing files to backup")
+        changes = self.__new_index__.compare(self.__old_index__)
+        LOG.debug("Changes since last backup: %s", changes)
+        # moved files are restored from the backup that already holds them
+        self.__new_index__.set_moves(changes.moved)
         added = 0
-        # use closing for python 2.6 compatibility
-        with closing(tarfile.open(self.get_tarpath(), "w:gz")) as tar:
+        if self.__store__ is not None:
+            # files go into the object store, so the tarfile only holds the index
+            added = self.store_files(changes.changed)
+            if added is None:
+                return
+        deltas = {}
+        if self.__store__ is None and self.__delta_depth__ and not self.__adb__:
+            # deltas are made before the index is written, as it lists them
+            deltas = self.write_deltas(changes.changed)
+        with self.open_archive() as tar:
             # write index
             path = os.path.join(TEMP_DIR, ".%s_index" % self.__timestamp__)
             self.__new_index__.write_index(path)
             tar.add(path, ".index")
-            # delete temp index now we've written it
-            delete_temp_files(path)
+            # keep a copy next to the tarfile, deleting the temp index once it's copied
+            write_index_copy(path, self.get_index_path())
             # write files
-            for fname in self.__new_index__.get_diff(self.__old_index__):
-                LOG.info("Adding %s...", fname)
-                if self.__adb__:  # pragma: no cover
-                    # pull files off phone into temp folder before backing up
-                    temp_path = os.path.join(TEMP_DIR, ".%s_adb" % self.__timestamp__)
-                    # replace file root with temp path
-                    temp_name = os.path.join(os.path.abspath(temp_path), fname.replace("/", os.sep))
-                    try:
-                        process = subprocess.Popen(
-                            ["adb", "pull", "-a", fname, temp_name],
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.STDOUT,
-                        )
-                        output, error = process.communicate()
-                        LOG.info(output.strip())
-                        if error:
-                            LOG.warning(error.strip())
-                        # add to tar using original name
-                        tar.add(temp_name, fname)
-                        added += 1
-                    except subprocess.CalledProcessError:
-                        LOG.warning("Could not pull %s from phone", fname)
-                    finally:
-                        delete_temp_files(temp_name)
+            if self.__store__ is None:
 
-                    # delete temp files
-                    delete_temp_files(temp_path)
-                else:
-                    tar.add(fname)
-                    added += 1
+                def add_to_tar(local_path, fname):
+                    if fname in deltas:
+                        # keep the file's name, times and permissions for the delta
+                        info = tar.gettarinfo(local_path, fname)
+                        info.size = os.path.getsize(deltas[fname])
+                        with open(deltas[fname], "rb") as delta:
+                            tar.addfile(info, delta)
+                    else:
+                        tar.add(local_path, fname)
+                    return True
+
+                added = self._add_files(changes.changed, add_to_tar)
 
             # backup current config file
             if self.__adb__:  # pragma: no cover
@@ -136,16 +206,223 @@ class Backup:
                 delete_temp_files(temp_config)
             else:
                 tar.add(CONFIG_FILE, ".backpy")
+        for delta in deltas.values():
+            delete_temp_files(delta)
 
-        # do not keep index if nothing added or removed
-        removed = self.__new_index__.get_missing(self.__old_index__)
-        if added or removed:
+        # do not keep index if nothing added, removed or moved
+        if added or changes.removed or changes.moved:
             LOG.info("%s files backed up", added)
-            LOG.info("%s files removed", len(removed))
+            if deltas:
+                LOG.info("%s files backed up as deltas", len(deltas))
+            LOG.info("%s files removed", len(changes.removed))
+            if changes.moved:
+                LOG.info("%s files moved or copied", len(changes.moved))
+            self.update_catalog(changes)
         else:
             delete_temp_files(self.get_tarpath())
+            delete_temp_files(self.get_index_path())
+            delete_temp_files(self.get_signature_path())
             LOG.warning("No files changed - nothing to back up")
 
+    def _add_files(self, filenames, add):
+        """
+        Add files to this backup, pulling them off the phone first for adb backups.
+        :param filenames: Full paths of files to add.
+        :param add: Function taking the path of a local copy of the file and its full path,
+        and returning True if the file was added.
+        :return: Number of files added.
+        """
+        added = 0
+        for fname in filenames:
+            LOG.info("Adding %s...", fname)
+            if self.__adb__:  # pragma: no cover
+                # pull files off phone into temp folder before backing up
+                temp_path = os.path.join(TEMP_DIR, ".%s_adb" % self.__timestamp__)
+                # replace file root with temp path
+                temp_name = os.path.join(os.path.abspath(temp_path), fname.replace("/", os.sep))
+                try:
+                    process = subprocess.Popen(
+                        ["adb", "pull", "-a", fname, temp_name],
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                    )
+                    output, error = process.communicate()
+                    LOG.info(output.strip())
+                    if error:
+                        LOG.warning(error.strip())
+                    # add using original name
+                    if add(temp_name, fname):
+                        added += 1
+                except subprocess.CalledProcessError:
+                    LOG.warning("Could not pull %s from phone", fname)
+                finally:
+                    delete_temp_files(temp_name)
+
+                # delete temp files
+                delete_temp_files(temp_path)
+            elif add(fname, fname):
+                added += 1
+        return added
+
+    def store_files(self, filenames):
+        """
+        Add files to the object store, skipping any whose contents are already stored, and
+        record their object keys in this backup's index.
+        :param filenames: Full paths of files to add.
+        :return: Number of files added, or None if the object store could not be opened.
+        """
+        objects = {}
+        chunks = {}
+        stats = {}
+        try:
+            with closing(ObjectStore(self.__store__)) as store:
+
+                def add_to_store(local_path, fname):
+                    try:
+                        st = os.stat(local_path)
+                    except OSError:
+                        # deleted or unreadable since it was indexed, so skip just this file
+                        LOG.warning("Could not add %s to object store", fname)
+                        return False
+                    stats[fname] = (stat.S_IMODE(st.st_mode), st.st_mtime)
+                    if self.__chunker__ and st.st_size > MIN_CHUNKED_FILE_SIZE:
+                        keys = store.add_chunks(local_path, self.__chunker__)
+                        if keys is not None:
+                            chunks[fname] = keys
+                        return keys is not None
+                    key = store.add_file(local_path)
+                    if key is not None:
+                        objects[fname] = key
+                    return key is not None
+
+                added = self._add_files(filenames, add_to_store)
+                LOG.info("%s new objects stored in %s", store.added(), self.__store__)
+        except (sqlite3.Error, OSError):
+            LOG.exception("Could not open object store %s", self.__store__)
+            return None
+        try:
+            location = os.path.relpath(self.__store__, self.__path__)
+        except ValueError:
+            # e.g. on a different drive
+            location = os.path.abspath(self.__store__)
+        self.__new_index__.set_objects(objects, location, chunks, stats)
+        return added
+
+    def write_deltas(self, filenames):
+        """
+        Write deltas of large files against their version in an earlier backup, keeping
+        those that save enough space, and save the signatures of all large files so later
+        backups can make deltas against them.
+        :param filenames: Full paths of files to back up.
+        :return: dict of file path to path of its delta in the temp folder, for files to
+        back up as deltas.
+        """
+        this_name = os.path.basename(self.get_tarpath())
+        older = [name for name in all_backups(self.__path__) if name < this_name]
+        deltas = {}
+        bases = {}
+        signatures = {}
+        for fname in filenames:
+            delta_path = os.path.join(TEMP_DIR, ".%s_delta%d" % (self.__timestamp__, len(deltas)))
+            try:
+                size = os.path.getsize(fname)
+                if size < MIN_DELTA_FILE_SIZE:
+                    continue
+                base = self.find_delta_base(fname, older)
+                depth = 0
+                with open(fname, "rb") as f:
+                    if base is None or base[1] >= self.__delta_depth__:
+                        sig = signature(f)
+                    else:
+                        with open(delta_path, "wb") as out:
+                            sig = write_delta(f, base[2], out)
+                            delta_size = out.tell()
+                        LOG.debug("Delta of %s is %d of %d bytes", fname, delta_size, size)
+                        if delta_size <= size * MAX_DELTA_RATIO:
+                            deltas[fname] = delta_path
+                            bases[fname] = base[0]
+                            depth = base[1] + 1
+                        else:
+                            delete_temp_files(delta_path)
+            except (IOError, OSError):
+                # the file is added in full instead, if it can be read by then
+                LOG.warning("Could not read %s to make a delta", fname)
+                if fname not in deltas:
+                    delete_temp_files(delta_path)
+                continue
+            signatures[fname] = (self.__new_index__.file_hash(fname), depth, sig)
+        self.__new_index__.set_deltas(bases)
+        if signatures:
+            try:
+                write_signatures(self.get_signature_path(), signatures)
+            except (IOError, OSError):  # pragma: no cover
+                # the backup is still complete, later backups just can't make deltas of it
+                LOG.warning("Could not write signatures %s", self.get_signature_path())
+        return deltas
+
+    def find_delta_base(self, filename, backups):
+        """
+        Find the version of a file in the last backup that added it, to make a delta against.
+        :param filename: Full path of file.
+        :param backups: File names of the backups before this one, newest first.
+        :return: Tuple of (backup file name, delta depth, signature) of the version, or None
+        if it is not the version in the last backup or there is no signature for it.
+        """
+        digest = self.__old_index__.file_hash(filename) if self.__old_index__ else None
+        if digest is None:
+            return None
+        for tar_name in backups:
+            if tar_name not in self.__signatures__:
+                self.__signatures__[tar_name] = load_signatures(
+                    os.path.join(self.__path__, tar_name)
+                )
+            entry = self.__signatures__[tar_name].get(filename)
+            if entry is not None:
+                return (tar_name,) + entry[1:] if entry[0] == digest else None
+        return None
+
+    @contextmanager
+    def open_archive(self):
+        """
+        Open this backup's tarfile for writing, compressed with the codec and level set in
+        the config file. gzip archives are compressed using a pool of threads if more than
+        one job is set.
+        :return: Context manager giving a TarFile.
+        """
+        codec, level = self.__compression__
+        _, mode, level_arg = ARCHIVE_FORMATS[codec]
+        LOG.debug("Compressing with %s, level %s", codec, level or "default")
+        if codec == "gz" and self.__jobs__ > 1:
+            # tarfile only writes to the file object, so it can be compressed in blocks
+            with closing(ParallelGzipWriter(self.get_tarpath(), level, self.__jobs__)) as f:
+                with closing(tarfile.open(mode="w", fileobj=f)) as tar:
+                    yield tar
+        else:
+            options = {level_arg: level} if level is not None else {}
+            # use closing for python 2.6 compatibility
+            with closing(tarfile.open(self.get_tarpath(), mode, **options)) as tar:
+                yield tar
+
+    def update_catalog(self, changes=None):
+        """
+        Add this backup to the catalog of its backup folder, or rebuild the catalog if
+        it is missing earlier backups.
+        :param changes: ChangeSet of this backup compared to its parent.
+        """
+        name = os.path.basename(self.get_tarpath())
+        try:
+            with closing(Catalog(self.__path__)) as catalog:
+                older = [b for b in all_backups(self.__path__, reverse_order=False) if b < name]
+                last = older[-1] if older else None
+                # the parent's index is only the catalog's newest state if it's the last backup
+                if catalog.backups() == older and last == self.__parent_tar__:
+                    catalog.add_backup(name, self.__new_index__, self.__old_index__, changes)
+                    return
+        except sqlite3.Error:
+            LOG.warning("Could not update catalog in %s", self.__path__)
+            return
+        rebuild_catalog(self.__path__)
+
     def contains_file(self, filename, exact_match=True):
         """
         Look for a specific file in the index.
@@ -178,24 +455,20 @@ class Backup:
         dest = os.path.dirname(folder)
         if not dest:
             # make sure dest and file are full paths
-            index = get_folder_index(folder, self.__new_index__.dirs())
-            if index is None:
+            fullname = self.__new_index__.find_folder(folder)
+            if fullname is None:
                 LOG.error("Cannot find folder to restore")
                 return
-            fullname = self.__new_index__.dirs()[index]
             dest = os.path.dirname(fullname)
         LOG.debug("Got dest dir %s", dest)
 
         # index destination dir
-        dest_index = FileIndex(fullname, adb=self.__adb__)
+        dest_index = FileIndex(fullname, adb=self.__adb__, algorithm=self.__new_index__.algorithm())
         dest_index.gen_index()
 
         # restore changed and missing files
-        for dest_file in self.__new_index__.files():
-            if string_startswith(fullname, dest_file) and (
-                dest_index.file_hash(dest_file) != self.__new_index__.file_hash(dest_file)
-                or dest_file not in dest_index.files()
-            ):
+        for dest_file in self.__new_index__.files_under(fullname):
+            if dest_index.file_hash(dest_file) != self.__new_index__.file_hash(dest_file):
                 self.restore_file(dest_file, restore_path)
 
     def restore_file(self, filename, restore_path=None):
@@ -210,11 +483,11 @@ class Backup:
         dest = os.path.dirname(filename)
         if not dest:
             # make sure dest and file are full paths
-            index = get_filename_index(filename, self.__new_index__.files())
-            if index is None:
+            matches = self.__new_index__.find_files(filename)
+            if not matches:
                 LOG.error("cannot find file to restore")
                 return
-            fullname = self.__new_index__.files()[index]
+            fullname = matches[0]
             dest = os.path.dirname(fullname)
         LOG.debug("Got dest dir %s", dest)
 
@@ -225,7 +498,8 @@ class Backup:
             root_path = restore_path
         dest_path = os.path.join(root_path, member_name)
         if os.path.exists(dest_path):
-            if get_file_hash(dest_path) == self.__new_index__.file_hash(fullname):
+            dest_hash = get_file_hash(dest_path, algorithm=self.__new_index__.algorithm())
+            if dest_hash == self.__new_index__.file_hash(fullname):
                 LOG.info("File unchanged, cancelling restore")
                 return
             else:
@@ -233,8 +507,26 @@ class Backup:
         else:
             LOG.debug("File not found")
 
-        LOG.info("restoring %s from %s", member_name, self.get_tarpath())
-        with closing(tarfile.open(self.get_tarpath(), "r:*")) as tar:
+        source, source_path = self, fullname
+        if self.__new_index__.moved_from(fullname):
+            # contents are in the backup the file was moved or copied from
+            source, source_path = self.find_moved_file(fullname)
+            if source is None:
+                LOG.error("Cannot find the backup holding %s", fullname)
+                return
+        keys = source.object_keys(source_path)
+        if keys is not None:
+            file_stat = source.get_index().object_stat(source_path)
+            source.extract_objects(keys, fullname, dest_path, file_stat)
+            return
+        if source.get_index().delta_base(source_path) is not None:
+            source.restore_delta(source_path, dest_path)
+            return
+        tar_path = source.get_tarpath()
+        source_name = self.get_member_name(source_path)[1]
+
+        LOG.info("restoring %s from %s", member_name, tar_path)
+        with closing(tarfile.open(tar_path, "r:*")) as tar:
             if self.__adb__:  # pragma: no cover
                 # extract files into temp folder before restoring to phone
                 file_info = tar.getmember(member_name)
@@ -266,13 +558,173 @@ class Backup:
                 delete_temp_files(temp_path)
             else:
                 try:
-                    LOG.debug("Extracting %s to %s", tar.getmember(member_name), root_path)
-                    tar.extractall(root_path, [tar.getmember(member_name)])
+                    member = tar.getmember(source_name)
+                    if source_name != member_name:
+                        # extract under the new name
+                        member = copy(member)
+                        member.name = member_name
+                    LOG.debug("Extracting %s to %s", member, root_path)
+                    tar.extractall(root_path, [member])
                     LOG.debug(os.listdir(root_path))
                 except KeyError:
                     # file may be in index but not backed up as it was unchanged from prev backup
                     LOG.info("%s not found in this backup", os.path.basename(member_name))
 
+    def object_keys(self, filename):
+        """
+        Get the keys of a file's contents in the object store holding this backup's files.
+        :param filename: Full path of file.
+        :return: List of object keys, one for a file stored whole or one for each chunk,
+        or None if the file was not added to an object store by this backup.
+        """
+        index = self.__new_index__
+        key = index.object_key(filename)
+        return [key] if key is not None else index.chunk_keys(filename)
+
+    def extract_objects(self, keys, filename, dest_path, file_stat=None):
+        """
+        Restore a file from the object store holding this backup's files.
+        :param keys: Object keys of the file contents, see object_keys.
+        :param filename: Full path of file when it was backed up.
+        :param dest_path: Path to restore the file to.
+        :param file_stat: Tuple of (permission bits, modified time) to set on the restored
+        file, or None to leave them as created, for backups that did not record them.
+        """
+        store_path = self.get_store_path()
+        LOG.info("restoring %s from %s", dest_path, store_path)
+        if not os.path.isdir(store_path):
+            LOG.error("Object store %s not found", store_path)
+            return
+        target = dest_path
+        if self.__adb__:  # pragma: no cover
+            # extract into temp folder before restoring to phone
+            target = os.path.join(TEMP_DIR, ".%s_adb" % self.__timestamp__, keys[0])
+        try:
+            with closing(ObjectStore(store_path)) as store:
+                extracted = store.extract_chunks(keys, target)
+        except sqlite3.Error:
+            LOG.exception("Could not open object store %s", store_path)
+            return
+        if extracted and file_stat is not None and not self.__adb__:
+            try:
+                os.chmod(target, file_stat[0])
+                os.utime(target, (file_stat[1], file_stat[1]))
+            except OSError:
+                LOG.warning("Could not set permissions and times of %s", target)
+        if self.__adb__ and extracted:  # pragma: no cover
+            try:
+                process = subprocess.Popen(
+                    ["adb", "push", target, filename],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                )
+                output, error = process.communicate()
+                LOG.info(output.strip())
+                if error:
+                    LOG.warning(error.strip())
+            finally:
+                delete_temp_files(os.path.dirname(target))
+
+    def restore_delta(self, filename, dest_path):
+        """
+        Restore a file backed up as a delta, by rebuilding the version it was made against
+        and applying the delta, for each delta back to a full copy of the file.
+        :param filename: Full path of file when it was backed up.
+        :param dest_path: Path to restore the file to.
+        """
+        LOG.info("restoring %s from %s", dest_path, self.get_tarpath())
+        temp_path = os.path.join(TEMP_DIR, ".%s_restore" % self.__timestamp__)
+        try:
+            info = self.rebuild_file(filename, temp_path)
+            digest = get_file_hash(temp_path, algorithm=self.__new_index__.algorithm())
+            if digest != self.__new_index__.file_hash(filename):
+                LOG.error("Restored %s does not match its backed up hash", filename)
+                return
+            folder = os.path.dirname(dest_path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            shutil.move(temp_path, dest_path)
+            os.chmod(dest_path, info.mode)
+            os.utime(dest_path, (info.mtime, info.mtime))
+        except (IOError, OSError, KeyError, ValueError, tarfile.TarError) as e:
+            LOG.error("Could not restore %s: %s", filename, e)
+        finally:
+            delete_temp_files(temp_path)
+
+    def rebuild_file(self, filename, path):
+        """
+        Write the contents of a file in this backup, applying it to the version it was made
+        against if it is a delta.
+        :param filename: Full path of file when it was backed up.
+        :param path: Path of file to write.
+        :return: TarInfo of the file in this backup.
+        :raise KeyError: If the file, or a version a delta was made against, is not found.
+        :raise ValueError: If a delta is damaged.
+        """
+        member_name = self.get_member_name(filename)[1]
+        base_name = self.__new_index__.delta_base(filename)
+        with closing(tarfile.open(self.get_tarpath(), "r:*")) as tar:
+            info = tar.getmember(member_name)
+            with closing(tar.extractfile(info)) as member, open(path, "wb") as out:
+                if base_name is None:
+                    shutil.copyfileobj(member, out)
+                    return info
+                LOG.debug("Applying delta of %s to the version in %s", filename, base_name)
+                base_path = path + ".base"
+                try:
+                    base = read_backup(os.path.join(self.__path__, base_name))
+                    base.rebuild_file(filename, base_path)
+                    with open(base_path, "rb") as base_file:
+                        apply_delta(member, base_file, out)
+                finally:
+                    delete_temp_files(base_path)
+        return info
+
+    def find_moved_file(self, filename):
+        """
+        Find the backup holding the contents of a file that was moved or copied before
+        this backup, following any earlier moves of the same contents.
+        :param filename: Full path of file.
+        :return: Tuple of the Backup holding the file and the path it was backed up as, or
+        (None, None) if it can't be found.
+        """
+        digest = self.__new_index__.file_hash(filename)
+        path = self.__new_index__.moved_from(filename)
+        this_name = os.path.basename(self.get_tarpath())
+        for tar_name in all_backups(self.__path__):
+            if tar_name >= this_name:
+                # only older backups can hold the contents
+                continue
+            backup = read_backup(os.path.join(self.__path__, tar_name))
+            index = backup.get_index()
+            if index.file_hash(path) != digest:
+                continue
+            if index.moved_from(path):
+                path = index.moved_from(path)
+            elif backup.has_member(path):
+                LOG.debug("Found %s as %s in %s", filename, path, tar_name)
+                return backup, path
+        return None, None
+
+    def has_member(self, filename):
+        """
+        Check if a file was added to this backup's tar file or object store.
+        :param filename: Full path of file.
+        :return: bool.
+        """
+        if self.object_keys(filename) is not None:
+            return True
+        _, member_name = self.get_member_name(filename)
+        try:
+            with closing(tarfile.open(self.get_tarpath(), "r:*")) as tar:
+                tar.getmember(member_name)
+            return True
+        except KeyError:
+            return False
+        except (OSError, tarfile.TarError):
+            LOG.warning("Could not read backup %s", self.get_tarpath())
+            return False
+
     @staticmethod
     def get_member_name(name):
         """
@@ -291,3 +743,184 @@ class Backup:
 
         LOG.debug("Returning %s, %s", root, member)
         return root, member
+
+
+def index_path(path):
+    """
+    Get the location of the index copy kept next to a backup.
+    :param path: Path of backup tarfile.
+    :return: Path of index file.
+    """
+    codec = backup_codec(path)
+    if codec:
+        path = path[: -len(ARCHIVE_FORMATS[codec][0])]
+    return path + INDEX_EXTENSION
+
+
+def signature_path(path):
+    """
+    Get the location of the signatures kept next to a backup.
+    :param path: Path of backup tarfile.
+    :return: Path of signature file.
+    """
+    return index_path(path)[: -len(INDEX_EXTENSION)] + SIGNATURE_EXTENSION
+
+
+def load_signatures(path):
+    """
+    Read the signatures of the large files in a backup, if it has any.
+    :param path: Path of backup tarfile.
+    :return: dict of file path to (file hash, delta depth, signature), see read_signatures.
+    """
+    sigs = signature_path(path)
+    if not os.path.exists(sigs):
+        return {}
+    try:
+        return read_signatures(sigs)
+    except (IOError, OSError, ValueError):
+        LOG.warning("Could not read signatures %s", sigs)
+        return {}
+
+
+def backup_codec(path):
+    """
+    Get the compression codec of a backup from its file name.
+    :param path: Path of backup tarfile.
+    :return: Codec name, one of ARCHIVE_FORMATS, or None if the file is not a backup.
+    """
+    name = os.path.basename(path)
+    for codec, (extension, _, _) in ARCHIVE_FORMATS.items():
+        stem = name[: -len(extension)]
+        if name.endswith(extension) and BACKUP_STEM.fullmatch(stem):
+            return codec
+    return None
+
+
+def write_index_copy(temp_path, path):
+    """
+    Move a written index next to its backup, compressing it if set in the config file.
+    :param temp_path: Path of index file to move.
+    :param path: Path to move it to.
+    """
+    compression = get_config_choice(
+        CONFIG_FILE, INDEX_COMPRESSION_KEY, INDEX_COMPRESSIONS, DEFAULT_INDEX_COMPRESSION
+    )
+    try:
+        if compression == "gz":
+            with open(temp_path, "rb") as src, gzip.open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            shutil.copyfile(temp_path, path)
+    except (IOError, OSError):  # pragma: no cover
+        # the backup is still complete, the index is just read from the tarfile instead
+        LOG.warning("Could not write index copy %s", path)
+        delete_temp_files(path)
+    delete_temp_files(temp_path)
+
+
+def read_backup(path):
+    """
+    Read a backup from disk and return as a Backup object. The index is read from the copy
+    next to the tarfile if there is one, or from the tarfile for older backups.
+    :param path: Path of backup tarfile.
+    :return: Opened Backup object.
+    """
+    LOG.debug("Reading backup %s", path)
+    timestamp = os.path.basename(path).split("_")[0]
+    # the index root is only a placeholder when reading
+    index = FileIndex(os.path.join(TEMP_DIR, ".%sindex" % timestamp), reading=True)
+    sidecar = index_path(path)
+    try:
+        if os.path.exists(sidecar):
+            with open(sidecar, "rb") as f:
+                compressed = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+                f.seek(0)
+                if compressed:
+                    with gzip.GzipFile(fileobj=f) as unzipped:
+                        index.read_index_file(unzipped)
+                else:
+                    index.read_index_file(f)
+        else:
+            with closing(tarfile.open(path, "r:*")) as tar:
+                with closing(tar.extractfile(".index")) as f:
+                    index.read_index_file(f)
+    except (OSError, KeyError, EOFError, tarfile.TarError):  # pragma: no cover
+        LOG.exception("Could not read backup")
+    compression = (backup_codec(path) or DEFAULT_COMPRESSION[0], None)
+    return Backup(os.path.dirname(path), index, timestamp=timestamp, compression=compression)
+
+
+def rebuild_catalog(path):
+    """
+    Create the catalog of a backup folder from scratch, by reading every backup.
+    :param path: Backup folder.
+    """
+    LOG.info("Rebuilding catalog for %s", path)
+    try:
+        with closing(Catalog(path)) as catalog:
+            catalog.clear()
+            previous = None
+            for name in all_backups(path, reverse_order=False):
+                index = read_backup(os.path.join(path, name)).get_index()
+                catalog.add_backup(name, index, previous)
+                previous = index
+    except sqlite3.Error:
+        LOG.warning("Could not rebuild catalog in %s, deleting it", path)
+        delete_temp_files(os.path.join(path, CATALOG_NAME))
+
+
+def open_catalog(path):
+    """
+    Open the catalog of a backup folder, rebuilding it if it does not list the same
+    backups as the folder, e.g. backups made by older versions of backpy.
+    :param path: Backup folder.
+    :return: Catalog, or None if there is no backup folder or the catalog can't be used.
+    """
+    if not os.path.isdir(path):
+        return None
+    backups = all_backups(path, reverse_order=False)
+    for attempt in range(2):
+        if attempt:
+            rebuild_catalog(path)
+        try:
+            catalog = Catalog(path)
+            if catalog.backups() == backups:
+                return catalog
+            catalog.close()
+        except sqlite3.Error:
+            LOG.warning("Could not read catalog in %s", path)
+    return None
+
+
+def all_backups(path, reverse_order=True):
+    """
+    Find all the backups in a directory.
+    :param path: Directory to search for backup tarfiles.
+    :param reverse_order: Whether to return backup paths in reverse order.
+    :return: A list of file paths.
+    """
+    LOG.debug("Finding previous backups.")
+    backups = []
+    if os.path.isabs(path) is None:
+        path = os.path.join(os.path.curdir, path)
+    if os.path.exists(path):
+        files = os.listdir(path)
+        for f in files:
+            if backup_codec(f):
+                backups.append(f)
+        backups.sort(reverse=reverse_order)
+    return backups
+
+
+def latest_backup(path):
+    """
+    Find the newest backup in a directory.
+    :param path: Directory to search for backup tarfiles.
+    :return: Backup object of the newest backup in the directory or None if no backups found.
+    """
+    backups = all_backups(path)
+    if not backups:
+        return None
+    last_backup = backups[0]
+    LOG.info("Reading latest backup (%s) for comparison", last_backup)
+    return read_backup(os.path.join(path, last_backup))
@@ -0,0 +1,216 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import logging
+import os
+import sqlite3
+
+from .helpers import decode_path, encode_path, get_folder_index, is_windows
+from .logger import LOG_NAME
+
+CATALOG_NAME = ".catalog.sqlite"
+CATALOG_VERSION = 1
+LOG = logging.getLogger(LOG_NAME)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS backups (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS paths (id INTEGER PRIMARY KEY, path BLOB NOT NULL, "
+    "is_dir INTEGER NOT NULL, path_key BLOB NOT NULL, name_key BLOB NOT NULL, "
+    "UNIQUE (path, is_dir))",
+    "CREATE INDEX IF NOT EXISTS paths_path_key ON paths (path_key)",
+    "CREATE INDEX IF NOT EXISTS paths_name_key ON paths (name_key)",
+    "CREATE TABLE IF NOT EXISTS versions (path_id INTEGER NOT NULL, "
+    "backup_id INTEGER NOT NULL, digest TEXT, PRIMARY KEY (path_id, backup_id)) WITHOUT ROWID",
+)
+
+
+def _key(path):
+    """Get the search key of a path, ignoring case for Windows."""
+    return encode_path(path.lower() if is_windows() else path)
+
+
+class Catalog:
+    """Searchable record of every backup in a backup folder, kept in an SQLite file in
+    the folder. A version is stored each time a file's digest changes, or it is removed,
+    and each time a folder is added or removed, so finding the backups that hold a file
+    does not need every backup's index to be read.
+    """
+
+    def __init__(self, folder):
+        self.__path__ = os.path.join(folder, CATALOG_NAME)
+        self.__db__ = sqlite3.connect(self.__path__)
+        version = self.__db__.execute("PRAGMA user_version").fetchone()[0]
+        if version != CATALOG_VERSION:
+            LOG.debug("Catalog %s is new or out of date, clearing", self.__path__)
+            self._create(drop=True)
+
+    def close(self):
+        """Close the catalog file."""
+        self.__db__.close()
+
+    def _create(self, drop=False):
+        """
+        Create the catalog tables.
+        :param drop: True to delete any existing tables first.
+        """
+        with self.__db__:
+            if drop:
+                for table in ("versions", "paths", "backups"):
+                    self.__db__.execute("DROP TABLE IF EXISTS %s" % table)
+            for statement in SCHEMA:
+                self.__db__.execute(statement)
+            self.__db__.execute("PRAGMA user_version = %d" % CATALOG_VERSION)
+
+    def clear(self):
+        """Remove all backups from the catalog."""
+        self._create(drop=True)
+
+    def backups(self):
+        """Get the names of the backups in the catalog, oldest first."""
+        return [row[0] for row in self.__db__.execute("SELECT name FROM backups ORDER BY name")]
+
+    def add_backup(self, name, index, previous=None, changes=None):
+        """
+        Add a backup to the catalog. Backups must be added oldest first.
+        :param name: File name of the backup tarfile.
+        :param index: FileIndex of the backup.
+        :param previous: FileIndex of the newest backup already in the catalog, if any.
+        :param changes: ChangeSet of index compared to previous, if already known, so
+        unchanged files are not compared again.
+        """
+        if previous is None:
+            candidates = index.files()
+            removed = []
+        elif changes is not None and index.algorithm() == previous.algorithm():
+            # files compared with the same hash algorithm are only unchanged if their
+            # digests match
+            candidates = changes.changed + [fname for fname, _ in changes.moved]
+            removed = changes.removed
+        else:
+            candidates = index.files()
+            removed = index.get_missing(previous)
+        rows = []
+        for fname in candidates:
+            digest = index.file_hash(fname)
+            if previous is None or previous.file_hash(fname) != digest:
+                rows.append((fname, 0, digest))
+        rows.extend((fname, 0, None) for fname in removed)
+        dirs = set(index.dirs())
+        old_dirs = set(previous.dirs()) if previous else set()
+        rows.extend((dirname, 1, "") for dirname in dirs - old_dirs)
+        rows.extend((dirname, 1, None) for dirname in old_dirs - dirs)
+        LOG.debug("Adding %s to catalog with %d changes", name, len(rows))
+        with self.__db__:
+            backup_id = self.__db__.execute(
+                "INSERT INTO backups (name) VALUES (?)", (name,)
+            ).lastrowid
+            self.__db__.executemany(
+                "INSERT OR IGNORE INTO paths (path, is_dir, path_key, name_key) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (encode_path(path), is_dir, _key(path), _key(os.path.basename(path)))
+                    for path, is_dir, _ in rows
+                ),
+            )
+            self.__db__.executemany(
+                "INSERT INTO versions (path_id, backup_id, digest) "
+                "SELECT id, ?, ? FROM paths WHERE path = ? AND is_dir = ?",
+                ((backup_id, digest, encode_path(path), is_dir) for path, is_dir, digest in rows),
+            )
+
+    def find(self, filename, exact_match=True):
+        """
+        Find the backups that hold a file or folder, matching it in the same way as
+        Backup.contains_file and Backup.contains_folder.
+        :param filename: Name of file or folder.
+        :param exact_match: If True, match the name exactly, if False, do a partial match.
+        :return: Tuple of the backups holding each version of the file, and the backups
+        holding the folder, as lists of backup names, newest first. None if the catalog
+        can't tell which file a partial match would find in each backup.
+        """
+        if exact_match:
+            file_ids = self._path_ids("path = ? AND is_dir = 0", encode_path(filename))
+            folder_ids = self._path_ids("path_key = ? AND is_dir = 1", _key(filename))
+        else:
+            file_ids = self._path_ids("name_key = ? AND is_dir = 0", _key(filename))
+            if len(file_ids) > 1:
+                # backups with more than one match use whichever comes first in the index
+                return None
+            folder_ids = [
+                path_id
+                for path_id, path in self.__db__.execute(
+                    "SELECT id, path FROM paths WHERE is_dir = 1"
+                )
+                if get_folder_index(filename, [decode_path(path)]) is not None
+            ]
+        file_backups = []
+        for path_id in file_ids:
+            # the oldest backup holding each version is the one where its digest changed
+            file_backups.extend(
+                row[0]
+                for row in self.__db__.execute(
+                    "SELECT b.name FROM versions v JOIN backups b ON b.id = v.backup_id "
+                    "WHERE v.path_id = ? AND v.digest IS NOT NULL ORDER BY b.name DESC",
+                    (path_id,),
+                )
+            )
+        return file_backups, self._folder_backups(folder_ids)
+
+    def _path_ids(self, where, value):
+        """Get the ids of the paths matching a condition."""
+        return [
+            row[0] for row in self.__db__.execute("SELECT id FROM paths WHERE " + where, (value,))
+        ]
+
+    def _folder_backups(self, folder_ids):
+        """
+        Get the backups holding any of the given folders.
+        :param folder_ids: Path ids of folders.
+        :return: List of backup names, newest first.
+        """
+        changes = {}
+        for path_id in folder_ids:
+            for name, digest in self.__db__.execute(
+                "SELECT b.name, v.digest FROM versions v JOIN backups b ON b.id = v.backup_id "
+                "WHERE v.path_id = ?",
+                (path_id,),
+            ):
+                changes.setdefault(name, []).append((path_id, digest is not None))
+        if not changes:
+            return []
+        present = set()
+        backups = []
+        for name in self.backups():
+            for path_id, exists in changes.get(name, ()):
+                if exists:
+                    present.add(path_id)
+                else:
+                    present.discard(path_id)
+            if present:
+                backups.append(name)
+        backups.reverse()
+        return backups
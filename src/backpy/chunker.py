@@ -0,0 +1,92 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+from hashlib import sha256
+
+# chunks are at least this big, except at the end of a file
+MIN_CHUNK_SIZE = 256 * 1024
+# number of bytes in a row that must be marked to end a chunk, which gives chunks of
+# about MIN_CHUNK_SIZE + 2 ** (CHUNK_BITS + 1) bytes, see benchmarks/chunking.py
+CHUNK_BITS = 18
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+# smaller files are stored whole
+MIN_CHUNKED_FILE_SIZE = 4 * 1024 * 1024
+READ_SIZE = 16 * 1024 * 1024
+# each byte value is marked or not by a fixed random table, which has to stay the same
+# for chunks from different backups to match
+_digest = sha256(b"backpy chunk boundaries").digest()
+MARKS = bytes((_digest[i // 8] >> (i % 8)) & 1 for i in range(256))
+
+
+class Chunker:
+    """Splits files into chunks at points chosen by their contents rather than their
+    offsets, so an edit only changes the chunks around it, even if it inserts or removes
+    bytes. A chunk ends after a run of CHUNK_BITS bytes that are all marked in a random
+    table of byte values, i.e. a rolling hash over a window of that many bytes that is
+    true when every byte maps to 1. This is found with bytes.translate and bytes.find, so
+    files are split at hundreds of MB/s rather than the few MB/s of a rolling hash
+    updated in Python for each byte.
+    """
+
+    def __init__(self, min_size=MIN_CHUNK_SIZE, bits=CHUNK_BITS, max_size=MAX_CHUNK_SIZE):
+        self.__min_size__ = min_size
+        self.__max_size__ = max(max_size, min_size)
+        self.__pattern__ = b"\x01" * bits
+
+    def chunks(self, f):
+        """
+        Split a file into chunks.
+        :param f: Binary file object to read.
+        :return: Generator of chunk bytes. Chunks are between the minimum and maximum
+        size, except the last chunk, which can be smaller.
+        """
+        data = bytearray()
+        marks = bytearray()
+        pos = 0
+        at_end = False
+        pattern = self.__pattern__
+        while True:
+            if not at_end and len(data) - pos < self.__max_size__:
+                # drop chunks already returned before reading more
+                del data[:pos]
+                del marks[:pos]
+                pos = 0
+                block = f.read(max(READ_SIZE, self.__max_size__))
+                if block:
+                    data += block
+                    marks += block.translate(MARKS)
+                    continue
+                at_end = True
+            if pos >= len(data):
+                return
+            limit = min(pos + self.__max_size__, len(data))
+            # the run of marked bytes must end at least the minimum size into the chunk
+            start = max(pos, pos + self.__min_size__ - len(pattern))
+            found = marks.find(pattern, start, limit)
+            end = found + len(pattern) if found >= 0 else limit
+            yield bytes(data[pos:end])
+            pos = end
@@ -0,0 +1,172 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import base64
+import struct
+from hashlib import blake2b
+
+from .chunker import Chunker
+
+# files smaller than this are always backed up in full
+MIN_DELTA_FILE_SIZE = 1024 * 1024
+# deltas are only kept if they are at most this fraction of the file's size
+MAX_DELTA_RATIO = 0.5
+# blocks matched between versions, split at content-defined points like chunks in the
+# object store, so blocks after an insertion or removal still match
+MIN_BLOCK_SIZE = 4 * 1024
+BLOCK_BITS = 13
+MAX_BLOCK_SIZE = 256 * 1024
+DELTA_MAGIC = b"BACKPY\x00D"
+SIGNATURE_SEPARATOR = "@@@"
+# a signature is the length and digest of each block of a file, in order
+BLOCK = struct.Struct(">I16s")
+COPY = struct.Struct(">QQ")
+LITERAL = struct.Struct(">I")
+COPY_SIZE = 1024 * 1024
+BLOCKS = Chunker(MIN_BLOCK_SIZE, BLOCK_BITS, MAX_BLOCK_SIZE)
+
+
+def _digest(block):
+    return blake2b(block, digest_size=16).digest()
+
+
+def signature(f):
+    """
+    Get the signature of a file, which deltas of later versions are made against.
+    :param f: Binary file object to read.
+    :return: Signature bytes.
+    """
+    return b"".join(BLOCK.pack(len(block), _digest(block)) for block in BLOCKS.chunks(f))
+
+
+def write_delta(f, base_signature, out):
+    """
+    Write the differences between a file and an earlier version of it, as blocks to copy
+    from the earlier version and new bytes.
+    :param f: Binary file object to read.
+    :param base_signature: Signature of the earlier version.
+    :param out: Binary file object to write the delta to.
+    :return: Signature of the file.
+    """
+    blocks = {}
+    offset = 0
+    for length, digest in BLOCK.iter_unpack(base_signature):
+        blocks.setdefault(digest, (offset, length))
+        offset += length
+    new_signature = bytearray()
+    copy = None
+    out.write(DELTA_MAGIC)
+    for block in BLOCKS.chunks(f):
+        digest = _digest(block)
+        new_signature += BLOCK.pack(len(block), digest)
+        match = blocks.get(digest)
+        if match is not None and match[1] == len(block):
+            if copy is not None and copy[0] + copy[1] == match[0]:
+                # the next block of the earlier version, so copy both at once
+                copy = (copy[0], copy[1] + match[1])
+                continue
+            if copy is not None:
+                out.write(b"C" + COPY.pack(*copy))
+            copy = match
+            continue
+        if copy is not None:
+            out.write(b"C" + COPY.pack(*copy))
+            copy = None
+        out.write(b"L" + LITERAL.pack(len(block)))
+        out.write(block)
+    if copy is not None:
+        out.write(b"C" + COPY.pack(*copy))
+    return bytes(new_signature)
+
+
+def apply_delta(delta, base, out):
+    """
+    Rebuild a file from a delta and the earlier version it was made against.
+    :param delta: Binary file object of the delta, see write_delta.
+    :param base: Binary file object of the earlier version. Must be seekable.
+    :param out: Binary file object to write the file to.
+    :raise ValueError: If the delta is damaged or does not match the earlier version.
+    """
+    if delta.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+        raise ValueError("Not a delta")
+    while True:
+        op = delta.read(1)
+        if not op:
+            return
+        if op == b"C":
+            offset, length = COPY.unpack(_read(delta, COPY.size))
+            base.seek(offset)
+            while length:
+                data = base.read(min(length, COPY_SIZE))
+                if not data:
+                    raise ValueError("Delta copies past the end of the earlier version")
+                out.write(data)
+                length -= len(data)
+        elif op == b"L":
+            (length,) = LITERAL.unpack(_read(delta, LITERAL.size))
+            out.write(_read(delta, length))
+        else:
+            raise ValueError("Unknown delta instruction %r" % op)
+
+
+def _read(f, size):
+    """Read exactly size bytes from a file."""
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Delta is truncated")
+    return data
+
+
+def read_signatures(path):
+    """
+    Read the signatures of the files in a backup.
+    :param path: Path of signature file.
+    :return: dict of file path to tuple of (file hash, delta depth, signature), where
+    depth is 0 for files backed up in full.
+    """
+    signatures = {}
+    with open(path) as f:
+        for line in f:
+            fname, digest, depth, sig = line.rstrip("\n").rsplit(SIGNATURE_SEPARATOR, 3)
+            signatures[fname] = (digest, int(depth), base64.b64decode(sig))
+    return signatures
+
+
+def write_signatures(path, signatures):
+    """
+    Write the signatures of the files in a backup.
+    :param path: Path of signature file.
+    :param signatures: dict of file path to tuple of (file hash, delta depth, signature).
+    """
+    with open(path, "w") as f:
+        for fname, (digest, depth, sig) in signatures.items():
+            f.write(
+                SIGNATURE_SEPARATOR.join(
+                    [fname, digest, str(depth), base64.b64encode(sig).decode("ascii")]
+                )
+                + "\n"
+            )
@@ -0,0 +1,125 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import fnmatch
+import os
+import re
+from bisect import bisect_right
+
+from .helpers import is_windows
+
+
+class ExclusionRules:
+    """fnmatch style exclusion rules, compiled into a single regular expression.
+    Matches the same paths as calling fnmatch.fnmatch (Windows) or fnmatch.fnmatchcase
+    (everything else) for each rule in turn.
+    """
+
+    def __init__(self, rules, ignore_case=None):
+        self.__rules__ = [rule for rule in rules if rule]
+        if ignore_case is None:
+            ignore_case = is_windows()
+        # like fnmatch.fnmatch on Windows, ignore case and slash direction
+        self.__ignore_case__ = ignore_case
+        rules = [self._normcase(rule) for rule in self.__rules__]
+        self.__regex__ = _compile(rules)
+        # if "folder/" matches a rule ending in *, so does everything in the folder
+        self.__prune_regex__ = _compile([rule for rule in rules if rule.endswith("*")])
+
+    def __bool__(self):
+        return bool(self.__rules__)
+
+    def _normcase(self, path):
+        return os.path.normcase(path).lower() if self.__ignore_case__ else path
+
+    def matches(self, path):
+        """
+        Checks if the path matches any of the rules.
+        :param path: Path to check.
+        :return: bool.
+        """
+        if self.__regex__ is None:
+            return False
+        return self.__regex__.match(self._normcase(os.fspath(path))) is not None
+
+    def prunes(self, path, sep=os.sep):
+        """
+        Checks if everything inside a folder matches one of the rules, so there is no need
+        to read the folder at all.
+        :param path: Path of folder.
+        :param sep: Path separator used inside the folder.
+        :return: bool.
+        """
+        if self.__prune_regex__ is None:
+            return False
+        return self.__prune_regex__.match(self._normcase(os.fspath(path) + sep)) is not None
+
+
+class PrefixList:
+    """A set of path prefixes, kept sorted so a path can be checked with a binary search."""
+
+    def __init__(self, prefixes):
+        # drop any prefix that starts with another one, then the only prefix that can
+        # match a path is the one sorted just before it
+        self.__prefixes__ = []
+        for prefix in sorted(set(prefixes)):
+            if prefix and not (self.__prefixes__ and prefix.startswith(self.__prefixes__[-1])):
+                self.__prefixes__.append(prefix)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Read a list of prefixes from a text file, one per line.
+        :param path: Path of the file. If it doesn't exist, the list is empty.
+        :return: PrefixList.
+        """
+        if not os.path.exists(path):
+            return cls([])
+        with open(path) as f:
+            return cls(line.strip() for line in f)
+
+    def __bool__(self):
+        return bool(self.__prefixes__)
+
+    def __len__(self):
+        return len(self.__prefixes__)
+
+    def matches(self, path):
+        """
+        Checks if the path starts with any of the prefixes.
+        :param path: Path to check.
+        :return: bool.
+        """
+        i = bisect_right(self.__prefixes__, path)
+        return i > 0 and path.startswith(self.__prefixes__[i - 1])
+
+
+def _compile(rules):
+    """Combine fnmatch patterns into one regular expression, or None if there are none."""
+    if not rules:
+        return None
+    return re.compile("|".join("(?:%s)" % fnmatch.translate(rule) for rule in rules))
@@ -25,48 +25,196 @@ POSSIBILITY OF SUCH DAMAGE.
 
 """
 
-import fnmatch
+import io
 import logging
 import os
 import re
+import stat
 import subprocess
-from pathlib import Path
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import md5
 
+from .exclusions import ExclusionRules, PrefixList
+from .file_table import FileTable, PathSet
 from .helpers import (
     CONFIG_FILE,
+    DEFAULT_HASH,
+    DEFAULT_INDEX_FORMAT,
+    DEFAULT_KEY,
+    DEFAULT_MMAP_THRESHOLD,
+    INDEX_FORMAT_KEY,
+    INDEX_FORMATS,
+    JOBS_KEY,
+    MMAP_KEY,
+    QUICK_MIN_SIZE,
     SKIP_KEY,
+    WALKERS_KEY,
+    HashStats,
+    case_key,
+    get_config_choice,
+    get_config_hash,
+    get_config_int,
     get_config_key,
     get_file_hash,
-    get_filename_index,
-    get_folder_index,
+    get_quick_hash,
     is_windows,
-    list_contains,
-    read_config_file,
+    iter_config_lines,
 )
 from .logger import LOG_NAME
+from .packed_index import MAGIC, read_packed, write_packed
+from .path_tree import PathTree
 
 ANDROID_SKIPS = os.path.join(os.path.expanduser("~"), ".androidSkipFolders")
+ANDROID_CACHE = re.compile(".*/cache")
+# hashes strong enough to trust that files with the same digest have the same contents
+MOVE_HASHES = ("md5", "sha256", "blake2b")
+# number of files each hashing job can have queued before the walk waits for results
+PENDING_PER_JOB = 64
+# number of folders each directory reader can queue before leaving the rest to the walk
+PENDING_PER_WALKER = 256
 LOG = logging.getLogger(LOG_NAME)
 
 
+def _is_dir(entry):
+    """Check if a directory entry is a folder or a link to one."""
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _object_entry(keys, file_stat):
+    """
+    Join the object keys of a file with its permission bits and modified time, for the
+    objects and chunks sections of an index.
+    :param keys: Object key, or comma separated keys of chunks.
+    :param file_stat: Tuple of (permission bits, modified time), or None if not known.
+    :return: Index entry.
+    """
+    if file_stat is None:
+        return keys
+    return "%s:%o:%.6f" % (keys, file_stat[0], file_stat[1])
+
+
+def _split_object_entry(entry):
+    """
+    Split an entry written by _object_entry.
+    :param entry: Index entry.
+    :return: Tuple of the keys and (permission bits, modified time), or None for entries
+    written before these were kept.
+    """
+    keys, _, file_stat = entry.partition(":")
+    try:
+        mode, mtime = file_stat.split(":")
+        return keys, (int(mode, 8), float(mtime))
+    except ValueError:
+        return keys, None
+
+
+def _is_current(built_for, source):
+    """
+    Check if a lookup built from a collection of files or folders is up to date. Files
+    and folders are only ever added, so a lookup is current if nothing has been added.
+    :param built_for: Tuple of the collection the lookup was built from and its size, or
+    None if not built yet.
+    :param source: Current collection.
+    :return: bool.
+    """
+    return built_for is not None and built_for[0] is source and built_for[1] == len(source)
+
+
+class ChangeSet:
+    """Differences between an index and the index of an earlier backup.
+    Paths are listed in the order of the index they come from. Unchanged files are only
+    counted, so large indexes are not copied.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.modified = []
+        self.removed = []
+        self.moved = []
+        self.unchanged = 0
+        self.changed = []
+
+    def __bool__(self):
+        return bool(self.changed or self.removed or self.moved)
+
+    def __str__(self):
+        return "%d added, %d modified, %d removed, %d moved, %d unchanged" % (
+            len(self.added),
+            len(self.modified),
+            len(self.removed),
+            len(self.moved),
+            self.unchanged,
+        )
+
+
 class FileIndex:
     """Information about the files and directories for a given path."""
 
-    def __init__(self, path, exclusion_rules=None, reading=False, adb=False):
+    def __init__(
+        self,
+        path,
+        exclusion_rules=None,
+        reading=False,
+        adb=False,
+        jobs=None,
+        hash_cache=None,
+        algorithm=None,
+        walkers=None,
+        journal=None,
+    ):
         if exclusion_rules is None:
             exclusion_rules = []
-        self.__files__ = {}
-        self.__dirs__ = {path}
+        self.__files__ = FileTable()
+        self.__quick__ = {}
+        self.__moves__ = {}
+        # object store keys of files backed up into an object store, or of their chunks
+        # for large files, and the store's location
+        self.__objects__ = {}
+        self.__chunks__ = {}
+        self.__store__ = None
+        # files backed up as deltas, and the backup holding the version each was made against
+        self.__deltas__ = {}
+        # file name lookup for partial matches, built when first needed
+        self.__names__ = None
+        self.__names_built_for__ = None
+        # folder tree and files in each folder, built when first needed
+        self.__tree__ = None
+        self.__tree_built_for__ = None
+        self.__folder_files__ = None
+        self.__folder_files_built_for__ = None
+        # an index being read gets all its folders from the index file
+        self.__dirs__ = PathSet() if reading else PathSet([path])
         self.__path__ = path
         self.__exclusion_rules__ = exclusion_rules or []
         self.__adb__ = adb
+        if jobs is None:
+            jobs = get_config_int(CONFIG_FILE, JOBS_KEY, 1)
+        self.__jobs__ = max(1, jobs)
+        if walkers is None:
+            walkers = get_config_int(CONFIG_FILE, WALKERS_KEY, 1)
+        self.__walkers__ = max(1, walkers)
+        self.__hash_cache__ = hash_cache
+        self.__hash__ = algorithm or get_config_hash(CONFIG_FILE)
+        self.__mmap_threshold__ = get_config_int(CONFIG_FILE, MMAP_KEY, DEFAULT_MMAP_THRESHOLD)
         # add global skips to exclusion rules
         global_skips = get_config_key(CONFIG_FILE, SKIP_KEY)
         if global_skips:
             self.__exclusion_rules__.extend(global_skips[0].split(","))
             LOG.debug("init exclusion rules = %s", self.__exclusion_rules__)
+        self.__matcher__ = ExclusionRules(self.__exclusion_rules__)
+        self.__rules__ = md5("\n".join(self.__exclusion_rules__).encode("utf-8")).hexdigest()
+        self.__journal__ = journal
+        self.__generated__ = None
+        self.__android_skips__ = PrefixList([])
         if adb:
             LOG.debug("New FileIndex for %s, adb=True", path)  # pragma: no cover
+            self.__android_skips__ = PrefixList.from_file(ANDROID_SKIPS)
         # suppress warning when reading an existing index
         if not reading and not self.is_valid(path):
             LOG.warning("Root dir %s does not exist or is excluded", path)
@@ -77,61 +225,319 @@ class FileIndex:
         :param f: File path to check.
         :return: bool.
         """
-        if self.__adb__:  # pragma: no cover
-            if re.match(".*/cache", f):
+        if self.__adb__:
+            if ANDROID_CACHE.match(f):
+                return False
+            if self.__android_skips__.matches(f):
+                LOG.debug("SKIPPING %s", f)
                 return False
-            if os.path.exists(ANDROID_SKIPS):
-                with open(ANDROID_SKIPS) as skip_list:
-                    for entry in skip_list:
-                        if f.startswith(entry.strip()):
-                            LOG.debug("SKIPPING %s", f)
-                            return False
         elif not os.path.exists(f):
             return False
-        if self.__exclusion_rules__:
-            for regex in self.__exclusion_rules__:
-                match_func = fnmatch.fnmatch if is_windows() else fnmatch.fnmatchcase
-                if match_func(f, regex):
-                    return False
+        return not self.is_excluded(f)
 
-        # Exclude Mac and Office temp files
-        if Path(f).name.startswith("._"):
-            return False
-        if Path(f).name.startswith("~"):
-            return False
+    def is_excluded(self, f):
+        """
+        Checks if the item matches an exclusion rule or is a temp file, without checking
+        that it exists.
+        :param f: File path to check.
+        :return: bool.
+        """
+        if self.__matcher__.matches(f):
+            return True
 
-        return True
+        # Exclude Mac and Office temp files
+        name = os.path.basename(f)
+        return name.startswith("._") or name.startswith("~")
 
-    def gen_index(self):
-        """Generates the file index for the current working directory."""
+    def gen_index(self, previous=None):
+        """
+        Generates the file index for the current working directory.
+        :param previous: Index of the last backup. Large files whose size, modified time
+        and quick hash all match this index are not hashed again.
+        """
         if self.__adb__:  # pragma: no cover
             LOG.info("Generating index of android device")
             self.adb_read_folder(self.__path__)
             return
 
-        LOG.info("Generating index of %s", self.__path__)
-        for dirname, dirnames, filenames in os.walk(self.__path__):
-            if not self.is_valid(dirname):
-                continue
-            for subdirname in dirnames:
-                fullpath = os.path.join(dirname, subdirname)
-                if self.is_valid(fullpath):
-                    self.__dirs__.add(fullpath)
+        LOG.info("Generating index of %s using %s", self.__path__, self.__hash__)
+        if previous is not None and previous.algorithm() != self.__hash__:
+            previous = None
+        self.__generated__ = time.time()
+        if self.__hash_cache__:
+            self.__hash_cache__.load(self.__hash__)
+        changed = self._journal_changes(previous)
+        if changed is None:
+            filenames = self.walk()
+        else:
+            LOG.info("%d paths changed since the last backup", len(changed))
+            filenames = self.walk_changes(previous, changed)
+        stats = HashStats()
+        start = time.perf_counter()
+        for fullname, digest, quick in self.hash_files(filenames, stats, previous):
+            if digest:
+                self.__files__[fullname] = digest
+                if quick:
+                    self.__quick__[fullname] = quick
+        stats.log(time.perf_counter() - start)
+        if self.__hash_cache__:
+            LOG.info("%d unchanged files found in hash cache", self.__hash_cache__.hits)
+            self.__hash_cache__.save()
+
+    def walk(self, top=None):
+        """
+        Walk the index path, adding valid directories to the index. Uses the file type and
+        stat details from each directory listing, so existing files are not checked again.
+        If more than one walker is set, directories are read by a pool of threads, but
+        files are still returned in the same order.
+        :param top: Folder to walk, if not the whole index path.
+        :return: Generator of (file path, os.stat_result) tuples of valid files, in walk order.
+        """
+        top = top or self.__path__
+        if not self.is_valid(top) or self.__matcher__.prunes(top):
+            return
+        if self.__walkers__ > 1:
+            yield from self._walk_parallel(top)
+            return
+        stack = [top]
+        while stack:
+            dirs, subdirs, files = self._scan_dir(stack.pop())
+            self.__dirs__.update(dirs)
+            yield from files
+            # visit sub folders depth first, in listing order
+            stack.extend(reversed(subdirs))
+
+    def _walk_parallel(self, top):
+        """
+        Walk the index path using a pool of directory readers. Each reader queues the sub
+        folders it finds as soon as it has listed them, so any idle reader can start on
+        them while the walk is still working through earlier folders.
+        :return: Generator of (file path, os.stat_result) tuples of valid files, in walk order.
+        """
+        pool = ThreadPoolExecutor(max_workers=self.__walkers__)
+        # limit how far readers can get ahead of the walk, so large trees are not held
+        # in memory while the files are hashed
+        slots = threading.BoundedSemaphore(self.__walkers__ * PENDING_PER_WALKER)
+        stack = [top]
+        try:
+            while stack:
+                item = stack.pop()
+                if isinstance(item, Future):
+                    dirs, subdirs, files = item.result()
+                    slots.release()
                 else:
-                    dirnames.remove(subdirname)
-                    LOG.debug("Skipping directory: %s", fullpath)
-            for filename in filenames:
-                fullname = os.path.join(dirname, filename)
-                if not self.is_valid(fullname):
-                    # logger.debug('skipping file: %s', fullname)  # noqa: E800
+                    # readers were too far ahead to queue this folder, so read it now
+                    dirs, subdirs, files = self._scan_tree(pool, slots, item)
+                self.__dirs__.update(dirs)
+                yield from files
+                stack.extend(reversed(subdirs))
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def _scan_tree(self, pool, slots, dirname):
+        """
+        Read a directory and queue reads of its sub folders while there is room.
+        :return: Tuple of valid folders, sub folders to visit as futures or paths, and
+        valid files.
+        """
+        dirs, subdirs, files = self._scan_dir(dirname)
+        children = []
+        for subdir in subdirs:
+            if slots.acquire(blocking=False):
+                try:
+                    children.append(pool.submit(self._scan_tree, pool, slots, subdir))
+                    continue
+                except RuntimeError:
+                    # walk has finished early and the pool is shut down
+                    slots.release()
+            children.append(subdir)
+        return dirs, children, files
+
+    def _scan_dir(self, dirname):
+        """
+        Read a single directory.
+        :return: Tuple of valid folders, sub folders to visit, and (file path,
+        os.stat_result) tuples of valid files, all in listing order.
+        """
+        dirs = []
+        subdirs = []
+        files = []
+        try:
+            with os.scandir(dirname) as it:
+                entries = list(it)
+        except OSError:
+            LOG.debug("Could not read directory: %s", dirname)
+            return dirs, subdirs, files
+        for entry in entries:
+            if not _is_dir(entry):
+                if self.is_excluded(entry.path):
                     continue
-                digest = get_file_hash(fullname)
-                if digest:
-                    self.__files__[fullname] = digest
+                try:
+                    files.append((entry.path, entry.stat()))
+                except OSError:
+                    # broken link or file deleted since the directory was read
+                    continue
+            elif self.is_excluded(entry.path):
+                LOG.debug("Skipping directory: %s", entry.path)
+            else:
+                dirs.append(entry.path)
+                # like os.walk, list links to folders but don't follow them, and
+                # don't read folders where every item would be skipped
+                if not entry.is_symlink() and not self.__matcher__.prunes(entry.path):
+                    subdirs.append(entry.path)
+        return dirs, subdirs, files
+
+    def walk_changes(self, previous, changed):
+        """
+        Fill the index from a previous index, then walk only the paths that have changed
+        since it was generated. Changed folders are walked in full, as files may have been
+        added to them before the watcher saw them.
+        :param previous: Index of the last backup.
+        :param changed: Iterable of paths created, modified, moved or deleted since the
+        previous index was generated.
+        :return: Generator of (file path, os.stat_result) tuples of changed files.
+        """
+        changed = set(changed)
+        # anything inside a changed folder may have been added, moved or deleted
+        in_changed = PrefixList([p + os.sep for p in changed])
+        in_root = PrefixList([self.__path__.rstrip(os.sep) + os.sep])
+        for d in previous.__dirs__:
+            if in_root.matches(d) and d not in changed and not in_changed.matches(d):
+                self.__dirs__.add(d)
+        for f, digest in previous.__files__.items():
+            if f not in changed and not in_changed.matches(f):
+                self.__files__[f] = digest
+                if f in previous.__quick__:
+                    self.__quick__[f] = previous.__quick__[f]
+                if self.__hash_cache__:
+                    # not read, so its cached digest would otherwise be dropped
+                    self.__hash_cache__.keep(f)
+
+        folders = []
+        files = []
+        for fullname in sorted(changed):
+            if not in_root.matches(fullname) or not self._is_walked(fullname):
+                continue
+            try:
+                st = os.stat(fullname)
+            except OSError:
+                # deleted, or a broken link
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                self.__dirs__.add(fullname)
+                if not os.path.islink(fullname):
+                    folders.append(fullname)
+            else:
+                files.append((fullname, st))
+        # changes inside changed folders are found by walking the folder
+        in_folders = PrefixList([f + os.sep for f in folders])
+        for fullname, st in files:
+            if not in_folders.matches(fullname):
+                yield fullname, st
+        for folder in folders:
+            if not in_folders.matches(folder):
+                yield from self.walk(folder)
+
+    def _is_walked(self, fullname):
+        """Check that a path inside the index path would not be skipped by a full walk."""
+        if self.is_excluded(fullname):
+            return False
+        root = self.__path__.rstrip(os.sep)
+        parent = os.path.dirname(fullname)
+        while len(parent) > len(root):
+            if self.is_excluded(parent) or self.__matcher__.prunes(parent):
+                return False
+            parent = os.path.dirname(parent)
+        return True
+
+    def _journal_changes(self, previous):
+        """
+        Get the paths changed since the previous index was generated.
+        :return: Set of paths, or None if the whole index path needs to be walked.
+        """
+        if previous is None or self.__journal__ is None:
+            return None
+        if previous.__rules__ != self.__rules__ or self.__path__ not in previous.__dirs__:
+            LOG.info("Skip rules changed since the last backup, reading all files")
+            return None
+        return self.__journal__.changes_since(previous.generated())
+
+    def hash_files(self, filenames, stats=None, previous=None):
+        """
+        Hash files, using the hash cache if there is one, and a pool of threads if more
+        than one job is set. Results are returned in the same order as the input, so the
+        index is always filled in walk order whatever the number of jobs.
+        :param filenames: Iterable of (file path, os.stat_result) tuples. The stat result can
+        be None if it is not already known.
+        :param stats: Optional HashStats to record throughput in.
+        :param previous: Optional index to reuse the hashes of unchanged large files from.
+        :return: Generator of (file path, hex digest, quick hash record) tuples.
+        """
+        cache = self.__hash_cache__
+        # hashlib and file reads release the GIL, so threads are enough to keep
+        # several disks or cores busy while the walk carries on
+        pool = ThreadPoolExecutor(max_workers=self.__jobs__) if self.__jobs__ > 1 else None
+        max_pending = self.__jobs__ * PENDING_PER_JOB if pool else 1
+        pending = deque()
+        try:
+            for fullname, st in filenames:
+                if st is None:
+                    try:
+                        st = os.stat(fullname)
+                    except OSError:
+                        pass
+                cached = cache.get(fullname, st) if cache else None
+                if cached is not None:
+                    # found in cache, so there is no need to add it again
+                    pending.append((fullname, cached, None))
+                elif pool:
+                    future = pool.submit(self._hash_file, fullname, st, stats, previous)
+                    pending.append((fullname, future, st))
+                else:
+                    pending.append((fullname, self._hash_file(fullname, st, stats, previous), st))
+                while len(pending) >= max_pending:
+                    yield self._resolve_hash(*pending.popleft())
+            while pending:
+                yield self._resolve_hash(*pending.popleft())
+        finally:
+            if pool:
+                pool.shutdown()
+
+    def _hash_file(self, fullname, st, stats, previous):
+        """
+        Hash a single file. Large files get a quick hash first, and if that, the size
+        and the modified time match the previous index, its hash is reused.
+        :return: Tuple of hex digest and quick hash record.
+        """
+        quick = None
+        if st is not None and st.st_size > QUICK_MIN_SIZE:
+            quick_hash = get_quick_hash(fullname, st.st_size, self.__hash__)
+            if quick_hash:
+                quick = "%d:%d:%s" % (st.st_size, st.st_mtime_ns, quick_hash)
+                if previous is not None and previous.quick_hash(fullname) == quick:
+                    digest = previous.file_hash(fullname)
+                    if digest:
+                        return digest, quick
+        digest = get_file_hash(
+            fullname,
+            stats=stats,
+            algorithm=self.__hash__,
+            mmap_threshold=self.__mmap_threshold__,
+        )
+        return digest, quick
+
+    def _resolve_hash(self, fullname, hashes, st):
+        """Wait for a queued hash and add it to the hash cache if needed."""
+        if isinstance(hashes, Future):
+            hashes = hashes.result()
+        digest, quick = hashes
+        if st is not None and self.__hash_cache__:
+            self.__hash_cache__.put(fullname, st, digest, quick)
+        return fullname, digest, quick
 
     def files(self):
         """Gets the current list of files."""
-        return list(self.__files__.keys())
+        return list(self.__files__)
 
     def dirs(self):
         """Gets the current list of directories."""
@@ -141,6 +547,14 @@ class FileIndex:
         """Get the list of items to skip."""
         return self.__exclusion_rules__
 
+    def algorithm(self):
+        """Get the name of the hash algorithm used for this index."""
+        return self.__hash__
+
+    def generated(self):
+        """Get the time this index was generated, as seconds since the epoch, if known."""
+        return self.__generated__
+
     def file_hash(self, f, exact_match=True):
         """
         Get the hash of the given file.
@@ -149,10 +563,130 @@ class FileIndex:
         :return: Hex string hash of file if found, else None.
         """
         if exact_match:
-            return self.__files__[f] if f in self.__files__ else None
+            return self.__files__.get(f)
         else:
-            index = get_filename_index(f, self.__files__)
-            return None if index is None else self.file_hash(self.files()[index])
+            paths = self.find_files(f)
+            return self.__files__.get(paths[0]) if paths else None
+
+    def find_files(self, name):
+        """
+        Get the files with the given name, in any folder, ignoring case for Windows.
+        :param name: File name without its folder.
+        :return: List of full paths of matching files, in index order.
+        """
+        return list(self._file_names().get(case_key(name), ()))
+
+    def _file_names(self):
+        """
+        Get the lookup of file name to full paths, building it when first needed or
+        when files have been added since it was built.
+        :return: dict of file name, in lower case for Windows, to list of full paths.
+        """
+        if not _is_current(self.__names_built_for__, self.__files__):
+            fold = is_windows()
+            names = {}
+            for path in self.__files__:
+                name = os.path.basename(path)
+                names.setdefault(name.lower() if fold else name, []).append(path)
+            self.__names__ = names
+            self.__names_built_for__ = (self.__files__, len(self.__files__))
+        return self.__names__
+
+    def moved_from(self, f):
+        """
+        Get the path a file was moved or copied from, if it was not backed up again
+        because its contents were already in the last backup.
+        :param f: File path to check.
+        :return: Path of the file in the last backup, or None if the file was not moved.
+        """
+        return self.__moves__.get(f)
+
+    def set_moves(self, moves):
+        """
+        Record files that have been moved or copied since the last backup.
+        :param moves: List of (new path, old path) tuples.
+        """
+        self.__moves__ = dict(moves)
+
+    def object_key(self, f):
+        """
+        Get the key of a file's contents in the object store of this backup.
+        :param f: File path to check.
+        :return: Object key, or None if the file was not added to an object store by this
+        backup.
+        """
+        entry = self.__objects__.get(f)
+        return None if entry is None else _split_object_entry(entry)[0]
+
+    def chunk_keys(self, f):
+        """
+        Get the keys of the chunks of a file in the object store of this backup.
+        :param f: File path to check.
+        :return: List of object keys in order, or None if the file was not added to an
+        object store in chunks by this backup.
+        """
+        entry = self.__chunks__.get(f)
+        return None if entry is None else _split_object_entry(entry)[0].split(",")
+
+    def object_stat(self, f):
+        """
+        Get the permission bits and modified time of a file added to an object store.
+        :param f: File path to check.
+        :return: Tuple of (permission bits, modified time), or None if the file was not added
+        to an object store by this backup or they were not recorded.
+        """
+        entry = self.__objects__.get(f, self.__chunks__.get(f))
+        return None if entry is None else _split_object_entry(entry)[1]
+
+    def object_store(self):
+        """
+        Get the location of the object store holding the files of this backup.
+        :return: Path of the store relative to the backup folder, or None if files are
+        backed up into tarfiles.
+        """
+        return self.__store__
+
+    def set_objects(self, objects, store, chunks=None, stats=None):
+        """
+        Record files that have been added to an object store by this backup.
+        :param objects: dict of file path to object key.
+        :param store: Path of the store relative to the backup folder.
+        :param chunks: dict of file path to list of object keys, for files added in chunks.
+        :param stats: dict of file path to (permission bits, modified time), restored with
+        the file's contents as the store only keeps contents.
+        """
+        stats = stats or {}
+        self.__objects__ = {f: _object_entry(k, stats.get(f)) for f, k in objects.items()}
+        self.__chunks__ = {
+            f: _object_entry(",".join(keys), stats.get(f)) for f, keys in (chunks or {}).items()
+        }
+        self.__store__ = store
+
+    def delta_base(self, f):
+        """
+        Get the backup holding the version of a file that it was backed up as a delta of.
+        :param f: File path to check.
+        :return: File name of the backup tarfile, or None if the file was not backed up as
+        a delta by this backup.
+        """
+        return self.__deltas__.get(f)
+
+    def set_deltas(self, deltas):
+        """
+        Record files that have been backed up as deltas by this backup.
+        :param deltas: dict of file path to file name of the backup holding the version
+        each delta was made against.
+        """
+        self.__deltas__ = dict(deltas)
+
+    def quick_hash(self, f):
+        """
+        Get the quick hash record of the given file.
+        :param f: File path to check.
+        :return: String of size, modified time and quick hash, or None if the file is not
+        in the index or is too small to have a quick hash.
+        """
+        return self.__quick__.get(f)
 
     def is_folder(self, f, exact_match=True):
         """
@@ -162,25 +696,116 @@ class FileIndex:
         :return: bool.
         """
         if exact_match:
-            return list_contains(f, self.__dirs__)
+            return f in self._path_tree()
         else:
-            return get_folder_index(f, self.__dirs__) is not None
+            return self.find_folder(f) is not None
 
-    def write_index(self, path=None):
+    def find_folder(self, name):
+        """
+        Find a folder by name, preferring folders with that name to folders with a parent
+        of that name.
+        :param name: Folder name without its parent folders.
+        :return: Full path of folder, or None if not found.
+        """
+        return self._path_tree().find(name)
+
+    def files_under(self, folder):
+        """
+        Get the files in a folder and all the folders below it.
+        :param folder: Full path of folder.
+        :return: Generator of full file paths.
+        """
+        folder_files = self._folder_files()
+        for key in self._path_tree().below(folder):
+            yield from folder_files.get(key, ())
+
+    def _path_tree(self):
+        """Get the tree of folders in the index, building it when first needed or when
+        folders have been added since it was built."""
+        if not _is_current(self.__tree_built_for__, self.__dirs__):
+            self.__tree__ = PathTree(self.__dirs__)
+            self.__tree_built_for__ = (self.__dirs__, len(self.__dirs__))
+        return self.__tree__
+
+    def _folder_files(self):
+        """
+        Get the lookup of folder to the files in it, building it when first needed or
+        when files have been added since it was built.
+        :return: dict of folder path, in lower case for Windows, to list of full paths.
+        """
+        if not _is_current(self.__folder_files_built_for__, self.__files__):
+            fold = is_windows()
+            folder_files = {}
+            for path in self.__files__:
+                folder = os.path.dirname(path)
+                folder_files.setdefault(folder.lower() if fold else folder, []).append(path)
+            self.__folder_files__ = folder_files
+            self.__folder_files_built_for__ = (self.__files__, len(self.__files__))
+        return self.__folder_files__
+
+    def write_index(self, path=None, packed=None):
         """
         Writes the current index to file.
         :param path: Path to index file. Uses self.__path__ / .index if not given.
+        :param packed: True to write a packed index, False for text. Uses the index format
+        from the config file if not given.
         """
         if path is None:
             path = os.path.join(self.__path__, ".index")
-        LOG.debug("Writing index to %s", path)
+        if packed is None:
+            index_format = get_config_choice(
+                CONFIG_FILE, INDEX_FORMAT_KEY, INDEX_FORMATS, DEFAULT_INDEX_FORMAT
+            )
+            packed = index_format == "packed"
+        LOG.debug("Writing %s index to %s", "packed" if packed else "text", path)
+        if packed:
+            header = {"adb": self.__adb__, "hash": self.__hash__}
+            if self.__generated__ is not None:
+                header["generated"] = repr(self.__generated__)
+                header["rules"] = self.__rules__
+            if self.__store__ is not None:
+                header["store"] = self.__store__
+            pairs = {
+                b"QUIK": self.__quick__,
+                b"MOVE": self.__moves__,
+                b"OBJS": self.__objects__,
+                b"CHNK": self.__chunks__,
+                b"DLTA": self.__deltas__,
+            }
+            write_packed(path, header, self.__dirs__, self.__files__, pairs)
+            return
         with open(path, "w+") as index:
             # BREAKING CHANGE: if you read this index with an old version
             # of backpy, you'll get a [adb=x] folder
             index.write("[adb={0}]\n".format(self.__adb__))
+            index.write("[hash={0}]\n".format(self.__hash__))
+            if self.__generated__ is not None:
+                index.write("[generated={0:.6f}]\n".format(self.__generated__))
+                index.write("[rules={0}]\n".format(self.__rules__))
+            if self.__store__ is not None:
+                index.write("[store={0}]\n".format(self.__store__))
             index.writelines(["%s\n" % s for s in self.__dirs__])
             index.write("# files\n")
             index.writelines(["%s@@@%s\n" % (f, self.file_hash(f)) for f in self.files()])
+            if self.__quick__:
+                # older versions of backpy ignore this section
+                index.write("[quick]\n")
+                index.writelines(["%s@@@%s\n" % (f, q) for f, q in self.__quick__.items()])
+            if self.__moves__:
+                # older versions of backpy ignore this section, so can't restore moved files
+                index.write("[moves]\n")
+                index.writelines(["%s@@@%s\n" % (f, m) for f, m in self.__moves__.items()])
+            if self.__objects__:
+                # older versions of backpy ignore this section, so can't restore these files
+                index.write("[objects]\n")
+                index.writelines(["%s@@@%s\n" % (f, k) for f, k in self.__objects__.items()])
+            if self.__chunks__:
+                index.write("[chunks]\n")
+                index.writelines(["%s@@@%s\n" % (f, k) for f, k in self.__chunks__.items()])
+            if self.__deltas__:
+                # older versions of backpy ignore this section, so restore the delta itself
+                index.write("[deltas]\n")
+                index.writelines(["%s@@@%s\n" % (f, b) for f, b in self.__deltas__.items()])
 
     def read_index(self, path=None):
         """
@@ -193,42 +818,204 @@ class FileIndex:
         if not os.path.exists(path):
             LOG.debug("Not found, returning")
             return
-        index = read_config_file(path)
-        for k, v in index.items():
-            if k == "adb":
-                self.__adb__ = v == "True"
-            elif k == "files":
-                for f in v:
-                    [fname, _hash] = f.split("@@@")
+        with open(path, "rb") as index:
+            self.read_index_file(index)
+
+    def read_index_file(self, index):
+        """
+        Read a file index from an open file, e.g. a member of a backup tarfile, and
+        populate file and directory lists.
+        :param index: Binary file object at the start of the index. Must be seekable.
+        """
+        packed = index.read(len(MAGIC)) == MAGIC
+        index.seek(0)
+        if packed:
+            self._read_packed(index)
+            return
+        text = io.TextIOWrapper(index)
+        try:
+            self._read_text(text)
+        finally:
+            # leave the file open for the caller
+            text.detach()
+
+    def _read_text(self, lines):
+        """
+        Read an index written in the text format.
+        :param lines: Iterable of index file lines.
+        """
+        # indexes written before the hash was recorded always used md5
+        self.__hash__ = DEFAULT_HASH
+        # older indexes can't be updated from the change journal
+        self.__rules__ = None
+        self.__generated__ = None
+        # items without a header, i.e. pre-1.5.0 style index, are folders then files
+        in_files = False
+        for key, value, is_param in iter_config_lines(lines):
+            if is_param:
+                self._read_index_param(key, value)
+            elif value is None:
+                continue
+            elif key == "files":
+                [fname, _hash] = value.split("@@@")
+                self.__files__[fname] = _hash
+            elif key == "dirs":
+                self.__dirs__.add(value)
+            elif key == "quick":
+                fname, quick = value.rsplit("@@@", 1)
+                self.__quick__[fname] = quick
+            elif key == "moves":
+                fname, _, source = value.partition("@@@")
+                self.__moves__[fname] = source
+            elif key == "objects":
+                fname, object_key = value.rsplit("@@@", 1)
+                self.__objects__[fname] = object_key
+            elif key == "chunks":
+                fname, chunks = value.rsplit("@@@", 1)
+                self.__chunks__[fname] = chunks
+            elif key == "deltas":
+                fname, base = value.rsplit("@@@", 1)
+                self.__deltas__[fname] = base
+            elif key == DEFAULT_KEY:
+                if value == "# files":
+                    in_files = True
+                elif in_files:
+                    # add file
+                    [fname, _hash] = value.split("@@@")
                     self.__files__[fname] = _hash
-            elif k == "dirs":
-                self.__dirs__.update(v)
-            elif k == "default":
-                # items without a header, i.e. pre-1.5.0 style index
-                in_files = False
-                for line in v:
-                    if line == "# files":
-                        in_files = True
-                        continue
-                    if in_files:
-                        # add file
-                        [fname, _hash] = line.split("@@@")
-                        self.__files__[fname] = _hash
-                    elif line not in self.__dirs__:
-                        # add directory
-                        self.__dirs__.add(line)
+                else:
+                    # add directory
+                    self.__dirs__.add(value)
+
+    def _read_index_param(self, key, value):
+        """
+        Set an index setting read from the [key=value] lines of an index file.
+        :param key: Setting name.
+        :param value: Setting value.
+        """
+        if key == "adb":
+            self.__adb__ = value == "True"
+        elif key == "hash":
+            self.__hash__ = value
+        elif key == "rules":
+            self.__rules__ = value
+        elif key == "store":
+            self.__store__ = value
+        elif key == "generated":
+            try:
+                self.__generated__ = float(value)
+            except ValueError:
+                self.__generated__ = None
+
+    def _read_packed(self, index):
+        """
+        Read an index written in the packed format.
+        :param index: Binary file object at the start of the index.
+        """
+        try:
+            header, dirs, files, pairs = read_packed(index)
+        except ValueError as e:
+            LOG.error("Could not read index %s: %s", getattr(index, "name", ""), e)
+            return
+        self.__hash__ = DEFAULT_HASH
+        self.__rules__ = None
+        self.__generated__ = None
+        for key, value in header.items():
+            self._read_index_param(key, value)
+        self.__dirs__.update(dirs)
+        if self.__files__:
+            for fname, _hash in files.items():
+                self.__files__[fname] = _hash
+        else:
+            # use the loaded table as is, rather than adding every file again
+            self.__files__ = files
+        self.__quick__.update(pairs[b"QUIK"])
+        self.__moves__.update(pairs[b"MOVE"])
+        self.__objects__.update(pairs[b"OBJS"])
+        self.__chunks__.update(pairs[b"CHNK"])
+        self.__deltas__.update(pairs[b"DLTA"])
+
+    def compare(self, index=None):
+        """
+        Compare this index to an older one in a single pass over each.
+        If the other index used a different hash algorithm, files are hashed again
+        with that algorithm so the digests can be compared.
+        :param index: Index to compare this index to. If not given, all files are added.
+        :return: ChangeSet of added, modified, removed and unchanged files.
+        """
+        changes = ChangeSet()
+        if index is None:
+            changes.added = self.files()
+            changes.changed = list(changes.added)
+            return changes
+        same_hash = index.algorithm() == self.__hash__
+        if not same_hash:
+            LOG.info("Previous index used %s, rehashing to compare", index.algorithm())
+        for f, digest in self.__files__.items():
+            other_hash = index.file_hash(f)
+            if other_hash is None:
+                changes.added.append(f)
+                changes.changed.append(f)
+            elif self._is_modified(f, digest, index, other_hash, same_hash):
+                changes.modified.append(f)
+                changes.changed.append(f)
+            else:
+                changes.unchanged += 1
+        changes.removed = self.get_missing(index)
+        if same_hash and changes.added and not self.__adb__ and self.__hash__ in MOVE_HASHES:
+            self._find_moves(changes, index)
+        return changes
+
+    def _find_moves(self, changes, index):
+        """
+        Move added files whose contents are already in the other index to the moved list,
+        as (new path, old path) tuples.
+        """
+        added = {self.__files__[f]: f for f in changes.added}
+        sources = {}
+        removed = set(changes.removed)
+        for f, digest in index.__files__.items():
+            # prefer files that have been moved to ones that have been copied
+            if digest in added and (digest not in sources or f in removed):
+                sources[digest] = f
+        if not sources:
+            return
+        still_added = []
+        for f in changes.added:
+            source = sources.get(self.__files__[f])
+            if source is None:
+                still_added.append(f)
+            else:
+                changes.moved.append((f, source))
+        moved = {f for f, _ in changes.moved}
+        changes.added = still_added
+        changes.changed = [f for f in changes.changed if f not in moved]
+
+    def _is_modified(self, f, digest, index, other_hash, same_hash):
+        """Check if a file in both indexes has changed."""
+        if same_hash:
+            # a different quick hash means the file has changed without comparing
+            # full hashes, but the same quick hash does not mean it is unchanged
+            quick = self.quick_hash(f)
+            other_quick = index.quick_hash(f)
+            if quick and other_quick and quick.split(":")[2] != other_quick.split(":")[2]:
+                return True
+            return digest != other_hash
+        # phone files can't be rehashed, so assume they have changed
+        return self.__adb__ or get_file_hash(f, algorithm=index.algorithm()) != other_hash
 
     def get_diff(self, index=None):
         """
-        Return a list of changed files.
+        Return a list of changed files, including files moved or copied from a file in the
+        other index.
         :param index: Index to compare this index to. If not given, all files are returned.
         :return: List of changed files.
         """
-        filelist = []
-        for f in self.files():
-            if index is None or self.file_hash(f) != index.file_hash(f):
-                filelist.append(f)
-        return filelist
+        changes = self.compare(index)
+        if not changes.moved:
+            return changes.changed
+        changed = set(changes.changed).union(f for f, _ in changes.moved)
+        return [f for f in self.files() if f in changed]
 
     def get_missing(self, index=None):
         """
@@ -238,7 +1025,7 @@ class FileIndex:
         """
         if not index:
             return []
-        return [x for x in index.files() if x not in self.files()]
+        return [x for x in index.files() if x not in self.__files__]
 
     def adb_read_folder(self, path):  # pragma: no cover
         """
@@ -285,11 +1072,18 @@ class FileIndex:
 
             if self.is_valid(fullname):
                 if f_permissions.startswith("d"):
-                    # folder - add to list and search subfolders
+                    # folder - add to list and search subfolders, unless everything in
+                    # them would be skipped
                     self.__dirs__.add(fullname)
-                    self.adb_read_folder(fullname)
+                    skip_contents = self.__android_skips__.matches(fullname + "/")
+                    if skip_contents or self.__matcher__.prunes(fullname, "/"):
+                        LOG.debug("SKIPPING contents of %s", fullname)
+                    else:
+                        self.adb_read_folder(fullname)
                 else:
                     # file - hash and add to list
-                    digest = get_file_hash(fullname, f_date + f_time, f_size)
+                    digest = get_file_hash(
+                        fullname, f_date + f_time, f_size, algorithm=self.__hash__
+                    )
                     if digest:
                         self.__files__[fullname] = digest
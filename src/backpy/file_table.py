@@ -0,0 +1,333 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from .helpers import decode_path, encode_path
+
+# slot number used for empty positions in the lookup table
+EMPTY = -1
+# saved table sizes: number of folder prefixes and digest width
+TABLE_META = struct.Struct("<QQ")
+
+
+def _split(path):
+    """Split a path into its folder, including the trailing separator, and name."""
+    folder, sep, name = path.rpartition(os.sep)
+    if os.altsep and os.altsep in name:
+        # e.g. phone paths on Windows
+        folder, sep, name = path.rpartition(os.altsep)
+    return folder + sep, name
+
+
+class FileTable:
+    """Compact mapping of file path to hex digest, in the order files were added.
+    Each folder path is stored once, file names are packed into one buffer, and digests
+    are packed into another as bytes instead of being kept as separate hex strings.
+    Files are found using an open addressing hash table of positions in these buffers,
+    so no Python objects are kept per file. Digests that can't be packed (e.g. from old
+    phone indexes) are kept as strings.
+    File names are hashed with crc32 rather than Python's per-process string hash, so the
+    buffers, including the hash table, can be saved and loaded again without rebuilding.
+    """
+
+    def __init__(self, items=None):
+        self.__folders__ = {}
+        self.__prefixes__ = []
+        self.__slot_folders__ = array("I")
+        self.__names__ = bytearray()
+        self.__name_ends__ = array("Q")
+        self.__hashes__ = array("q")
+        self.__table__ = array("q", [EMPTY]) * 8
+        self.__digests__ = bytearray()
+        self.__width__ = None
+        self.__empty__ = b""
+        self.__unpacked__ = {}
+        for path, digest in items or ():
+            self[path] = digest
+
+    def __len__(self):
+        return len(self.__name_ends__)
+
+    def __bool__(self):
+        return bool(self.__name_ends__)
+
+    def __contains__(self, path):
+        return self._slot(path) is not None
+
+    def __iter__(self):
+        prefixes = self.__prefixes__
+        names = self.__names__
+        start = 0
+        for folder, end in zip(self.__slot_folders__, self.__name_ends__):
+            yield prefixes[folder] + names[start:end].decode("utf-8", "surrogatepass")
+            start = end
+
+    def __getitem__(self, path):
+        slot = self._slot(path)
+        if slot is None:
+            raise KeyError(path)
+        return self._digest(slot)
+
+    def __setitem__(self, path, digest):
+        folder, name = _split(path)
+        number = self.__folders__.get(folder)
+        if number is None:
+            number = len(self.__prefixes__)
+            self.__folders__[folder] = number
+            self.__prefixes__.append(folder)
+        encoded = encode_path(name)
+        name_hash = zlib.crc32(encoded, number)
+        pos, slot = self._find(number, encoded, name_hash)
+        if slot is None:
+            slot = len(self.__name_ends__)
+            self.__table__[pos] = slot
+            self.__slot_folders__.append(number)
+            self.__names__.extend(encoded)
+            self.__name_ends__.append(len(self.__names__))
+            self.__hashes__.append(name_hash)
+            if self.__width__:
+                self.__digests__.extend(self.__empty__)
+            if 2 * slot > len(self.__table__):
+                self._resize()
+        self._set_digest(slot, digest)
+
+    def get(self, path, default=None):
+        """Get the digest of a file, or default if it is not in the table."""
+        slot = self._slot(path)
+        return default if slot is None else self._digest(slot)
+
+    def keys(self):
+        """Get an iterator of file paths."""
+        return iter(self)
+
+    def items(self):
+        """Get an iterator of (file path, digest) tuples."""
+        for slot, path in enumerate(self):
+            yield path, self._digest(slot)
+
+    def _slot(self, path):
+        """Get the position of a file in the table, or None if not found."""
+        folder, name = _split(path)
+        number = self.__folders__.get(folder)
+        if number is None:
+            return None
+        encoded = encode_path(name)
+        return self._find(number, encoded, zlib.crc32(encoded, number))[1]
+
+    def _find(self, number, encoded, name_hash):
+        """
+        Look up a file in the hash table.
+        :return: Tuple of table position and slot number, or table position of the first
+        empty space and None if the file is not in the table.
+        """
+        table = self.__table__
+        hashes = self.__hashes__
+        mask = len(table) - 1
+        pos = name_hash & mask
+        slot = table[pos]
+        while slot != EMPTY:
+            if (
+                hashes[slot] == name_hash
+                and self.__slot_folders__[slot] == number
+                and self._name(slot) == encoded
+            ):
+                return pos, slot
+            pos = (pos + 1) & mask
+            slot = table[pos]
+        return pos, None
+
+    def _name(self, slot):
+        """Get the encoded name at a position in the table."""
+        start = self.__name_ends__[slot - 1] if slot else 0
+        end = self.__name_ends__[slot]
+        return self.__names__[start:end]
+
+    def _resize(self):
+        """Double the size of the hash table, keeping it at most half full."""
+        table = array("q", [EMPTY]) * (2 * len(self.__table__))
+        mask = len(table) - 1
+        for slot, name_hash in enumerate(self.__hashes__):
+            pos = name_hash & mask
+            while table[pos] != EMPTY:
+                pos = (pos + 1) & mask
+            table[pos] = slot
+        self.__table__ = table
+
+    def _digest(self, slot):
+        """Get the digest at a position in the table."""
+        if slot in self.__unpacked__:
+            return self.__unpacked__[slot]
+        start = slot * self.__width__
+        end = start + self.__width__
+        return self.__digests__[start:end].hex()
+
+    def _set_digest(self, slot, digest):
+        """Pack a digest into the buffer, or keep it as a string if it would not unpack
+        to the same value."""
+        try:
+            packed = bytes.fromhex(digest)
+        except (TypeError, ValueError):
+            packed = None
+        if packed and self.__width__ is None:
+            # all digests from one hash algorithm are the same size
+            self.__width__ = len(packed)
+            self.__empty__ = bytes(self.__width__)
+            self.__digests__ = bytearray(len(self.__name_ends__) * self.__width__)
+        # hex strings with spaces or upper case letters would not unpack to the same value
+        if (
+            packed is None
+            or len(packed) != self.__width__
+            or 2 * len(packed) != len(digest)
+            or not (digest.islower() or digest.isdigit())
+        ):
+            self.__unpacked__[slot] = digest
+            return
+        if self.__unpacked__:
+            self.__unpacked__.pop(slot, None)
+        start = slot * self.__width__
+        end = start + self.__width__
+        self.__digests__[start:end] = packed
+
+    def sections(self):
+        """
+        Get the contents of the table as named buffers, for saving in a packed index.
+        :return: List of (4 byte tag, bytes) tuples.
+        """
+        return [
+            (b"FTMT", TABLE_META.pack(len(self.__prefixes__), self.__width__ or 0)),
+            (b"FTPF", join_strings(self.__prefixes__)),
+            (b"FTSF", _to_little_endian(self.__slot_folders__)),
+            (b"FTNM", bytes(self.__names__)),
+            (b"FTNE", _to_little_endian(self.__name_ends__)),
+            (b"FTHS", _to_little_endian(self.__hashes__)),
+            (b"FTTB", _to_little_endian(self.__table__)),
+            (b"FTDG", bytes(self.__digests__)),
+            (
+                b"FTUP",
+                join_strings(x for item in self.__unpacked__.items() for x in map(str, item)),
+            ),
+        ]
+
+    @classmethod
+    def from_sections(cls, sections):
+        """
+        Create a table from the buffers saved by sections().
+        :param sections: dict of tag to bytes.
+        :return: FileTable.
+        """
+        table = cls()
+        count, width = TABLE_META.unpack(sections[b"FTMT"])
+        table.__prefixes__ = split_strings(sections[b"FTPF"], count)
+        table.__folders__ = {prefix: i for i, prefix in enumerate(table.__prefixes__)}
+        table.__slot_folders__ = _from_little_endian("I", sections[b"FTSF"])
+        table.__names__ = _bytearray(sections[b"FTNM"])
+        table.__name_ends__ = _from_little_endian("Q", sections[b"FTNE"])
+        table.__hashes__ = _from_little_endian("q", sections[b"FTHS"])
+        table.__table__ = _from_little_endian("q", sections[b"FTTB"])
+        table.__digests__ = _bytearray(sections[b"FTDG"])
+        table.__width__ = width or None
+        table.__empty__ = bytes(width)
+        unpacked = split_strings(sections[b"FTUP"])
+        table.__unpacked__ = {int(k): v for k, v in zip(unpacked[::2], unpacked[1::2])}
+        if not (
+            len(table.__slot_folders__) == len(table.__name_ends__) == len(table.__hashes__)
+            and len(table.__digests__) == len(table.__name_ends__) * width
+            and len(table.__table__) >= 2 * len(table.__name_ends__)
+        ):
+            raise ValueError("File table buffers do not match")
+        return table
+
+
+class PathSet(FileTable):
+    """Compact set of paths, e.g. folders, stored the same way as the paths in a FileTable
+    but without digests."""
+
+    def __init__(self, paths=None):
+        super().__init__()
+        self.update(paths or ())
+
+    def add(self, path):
+        """Add a path to the set."""
+        self[path] = None
+
+    def update(self, paths):
+        """Add paths to the set."""
+        for path in paths:
+            self[path] = None
+
+    def _digest(self, slot):
+        return None
+
+    def _set_digest(self, slot, digest):
+        pass
+
+
+def _bytearray(data):
+    """Get a buffer as a bytearray, only copying it if needed."""
+    return data if isinstance(data, bytearray) else bytearray(data)
+
+
+def join_strings(strings):
+    """Encode strings as one null separated buffer."""
+    return encode_path("\0".join(strings))
+
+
+def split_strings(data, count=None):
+    """
+    Decode a null separated buffer.
+    :param data: Buffer from join_strings.
+    :param count: Number of strings expected, as an empty buffer could be no strings or
+    one empty string.
+    :return: List of strings.
+    """
+    if not data and not count:
+        return []
+    return decode_path(data).split("\0")
+
+
+def _to_little_endian(values):
+    """Get the bytes of an array in little endian order."""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode, data):
+    """Create an array from bytes in little endian order."""
+    values = array(typecode)
+    if len(data) % values.itemsize:
+        raise ValueError("Buffer is not a whole number of items")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
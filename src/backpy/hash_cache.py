@@ -0,0 +1,164 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import logging
+import os
+import time
+from hashlib import md5
+
+from .helpers import DATA_DIR, DEFAULT_HASH, make_directory
+from .logger import LOG_NAME
+
+CACHE_DIR = os.path.join(DATA_DIR, "hashes")
+CACHE_VERSION = "1"
+# files modified this recently may still be changing, so are never cached
+RACY_NS = 2 * 10**9
+LOG = logging.getLogger(LOG_NAME)
+
+
+def stat_key(st):
+    """
+    Get the cache key for a file's stat result.
+    :param st: os.stat_result of the file.
+    :return: String of device, inode, size, modified time and change time.
+    """
+    return "%d:%d:%d:%d:%d" % (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+class HashCache:
+    """Digests of files hashed by previous backups, keyed on the files' stat details.
+    A cached digest is only used if the device, inode, size, modified time and change
+    time of the file all match the values recorded when it was hashed.
+    """
+
+    def __init__(self, source, rehash=False, path=None):
+        self.__source__ = source
+        self.__rehash__ = rehash
+        self.__path__ = path or os.path.join(
+            CACHE_DIR, md5(os.path.normpath(source).encode("utf-8")).hexdigest()
+        )
+        self.__hash__ = DEFAULT_HASH
+        self.__old__ = None
+        self.__new__ = {}
+        self.hits = 0
+
+    def load(self, algorithm=DEFAULT_HASH):
+        """
+        Read the cache file for this source, unless rehashing everything.
+        :param algorithm: Hash algorithm being used. Cached digests from another
+        algorithm are ignored.
+        """
+        self.__hash__ = algorithm
+        self.__old__ = {}
+        if self.__rehash__:
+            LOG.info("Rehashing all files")
+            return
+        if not os.path.exists(self.__path__):
+            LOG.debug("No hash cache for %s", self.__source__)
+            return
+        LOG.debug("Reading hash cache %s", self.__path__)
+        try:
+            with open(self.__path__, "r", encoding="utf-8", errors="surrogateescape") as f:
+                if f.readline().strip() != "[version=%s]" % CACHE_VERSION:
+                    LOG.debug("Hash cache is out of date, ignoring")
+                    return
+                if f.readline().strip() != "[hash=%s]" % algorithm:
+                    LOG.debug("Hash cache used a different hash algorithm, ignoring")
+                    return
+                for line in f:
+                    try:
+                        fullname, key, digest, quick = line.rstrip("\n").rsplit("@@@", 3)
+                    except ValueError:
+                        continue
+                    self.__old__[fullname] = (key, digest, quick or None)
+        except OSError:
+            LOG.warning("Could not read hash cache %s", self.__path__)
+
+    def get(self, fullname, st):
+        """
+        Get the cached digest of a file.
+        :param fullname: Full path of file.
+        :param st: Current os.stat_result of the file.
+        :return: Tuple of hex string hash and quick hash record of file, or None if not
+        cached or the file has changed.
+        """
+        if self.__old__ is None:
+            self.load()
+        cached = self.__old__.get(fullname)
+        if cached is None or st is None:
+            return None
+        key = stat_key(st)
+        if cached[0] != key:
+            return None
+        self.__new__[fullname] = cached
+        self.hits += 1
+        return cached[1:]
+
+    def keep(self, fullname):
+        """
+        Keep the cached digest of a file that was not read during this backup, e.g. one
+        the change journal shows is unchanged, so it is still cached next time.
+        :param fullname: Full path of file.
+        """
+        if self.__old__ is None:
+            self.load()
+        cached = self.__old__.get(fullname)
+        if cached is not None:
+            self.__new__[fullname] = cached
+
+    def put(self, fullname, st, digest, quick=None):
+        """
+        Add a digest to the cache.
+        :param fullname: Full path of file.
+        :param st: os.stat_result of the file, taken before it was hashed.
+        :param digest: Hex string hash of file.
+        :param quick: Quick hash record of file, if it has one.
+        """
+        if st is None or not digest:
+            return
+        if time.time_ns() - st.st_mtime_ns < RACY_NS:
+            # file may have changed again since it was hashed without changing its
+            # modified time, so don't trust it next time
+            return
+        self.__new__[fullname] = (stat_key(st), digest, quick)
+
+    def save(self):
+        """Write the files seen during this backup back to the cache file."""
+        folder = os.path.dirname(self.__path__)
+        if not os.path.exists(folder):
+            make_directory(folder)
+        temp_path = "%s.tmp" % self.__path__
+        LOG.debug("Writing %d entries to hash cache %s", len(self.__new__), self.__path__)
+        try:
+            with open(temp_path, "w", encoding="utf-8", errors="surrogateescape") as f:
+                f.write("[version=%s]\n" % CACHE_VERSION)
+                f.write("[hash=%s]\n" % self.__hash__)
+                for fullname, (key, digest, quick) in self.__new__.items():
+                    f.write("%s@@@%s@@@%s@@@%s\n" % (fullname, key, digest, quick or ""))
+            os.replace(temp_path, self.__path__)
+        except OSError:
+            LOG.warning("Could not write hash cache %s", self.__path__)
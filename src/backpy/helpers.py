@@ -25,12 +25,14 @@ POSSIBILITY OF SUCH DAMAGE.
 
 """
 
-import io
 import logging
+import mmap
 import os
 import platform
-import re
-from hashlib import md5
+import threading
+import time
+import zlib
+from hashlib import blake2b, md5, sha256
 from shutil import rmtree
 
 from .logger import LOG_NAME
@@ -38,9 +40,56 @@ from .logger import LOG_NAME
 DEFAULT_KEY = "default"
 SKIP_KEY = "global skips"
 VERSION_KEY = "backpy version"
+JOBS_KEY = "jobs"
+WALKERS_KEY = "walkers"
+WATCH_INTERVAL_KEY = "watch interval"
+MMAP_KEY = "mmap threshold"
+HASH_KEY = "hash"
+INDEX_FORMAT_KEY = "index format"
+INDEX_COMPRESSION_KEY = "index compression"
+COMPRESSION_KEY = "compression"
+STORAGE_KEY = "storage"
+DELTA_DEPTH_KEY = "delta depth"
+DEFAULT_HASH = "md5"
+# text indexes can be read by any version of backpy, packed indexes load much faster
+INDEX_FORMATS = ("text", "packed")
+DEFAULT_INDEX_FORMAT = "text"
+# index files kept next to each backup can be compressed, they are always read either way
+INDEX_COMPRESSIONS = ("none", "gz")
+DEFAULT_INDEX_COMPRESSION = "none"
+# backup archive codecs and the levels they accept, see benchmarks/compression.py
+COMPRESSION_LEVELS = {
+    "none": range(0),
+    "gz": range(1, 10),
+    "bz2": range(1, 10),
+    "xz": range(0, 10),
+}
+COMPRESSION_ALIASES = {"gzip": "gz", "bzip2": "bz2", "lzma": "xz"}
+DEFAULT_COMPRESSION = ("gz", None)
+# backups are tarfiles of the changed files, or indexes of files added to an object store,
+# where large files can be split into chunks so only their changed parts are stored
+STORAGES = ("tar", "store", "chunks")
+DEFAULT_STORAGE = ("tar", None)
+# large files in tarfiles can be stored as deltas against their last backed up version, up
+# to this many deltas in a row before a full copy, or always in full if 0
+DEFAULT_DELTA_DEPTH = 0
 CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".backpy")
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".backpy.d")
+HASH_BUFFER_SIZE = 1024 * 1024
+QUICK_BLOCK_SIZE = 64 * 1024
+# smaller files are hashed in full, as a quick hash would read the whole file anyway
+QUICK_MIN_SIZE = 3 * QUICK_BLOCK_SIZE
+# files at least this big are memory mapped when hashing, or none if 0, see
+# benchmarks/mmap_hash.py. Off by default, as a mapped file that is truncated while it is
+# being hashed, e.g. a log rotated with copytruncate or a live database, kills backpy with
+# SIGBUS. Files that change size between being opened and mapped are read instead, but
+# the mapping can't guard against truncation once hashing has started.
+DEFAULT_MMAP_THRESHOLD = 0
 LOG = logging.getLogger(LOG_NAME)
 
+# one read buffer per thread, reused for every file hashed on that thread
+_hash_buffers = threading.local()
+
 
 def delete_temp_files(path):
     """
@@ -83,6 +132,34 @@ def make_directory(path):
         LOG.error("Could not create directory")
 
 
+def encode_path(path):
+    """
+    Encode a path so any name read from disk can be stored, including names that are not
+    valid UTF-8.
+    :param path: Path to encode.
+    :return: bytes.
+    """
+    return path.encode("utf-8", "surrogatepass")
+
+
+def decode_path(data):
+    """
+    Decode a path stored by encode_path.
+    :param data: bytes or buffer.
+    :return: Path.
+    """
+    return bytes(data).decode("utf-8", "surrogatepass")
+
+
+def case_key(s):
+    """
+    Get the form of a string used to compare it with others, ignoring case for Windows.
+    :param s: String to compare.
+    :return: String.
+    """
+    return s.lower() if is_windows() else s
+
+
 def string_equals(s1, s2):
     """
     Compare two strings, ignoring case for Windows.
@@ -90,10 +167,7 @@ def string_equals(s1, s2):
     :param s2: String to compare.
     :return: bool.
     """
-    if is_windows():
-        s1 = s1.lower()
-        s2 = s2.lower()
-    return s1 == s2
+    return case_key(s1) == case_key(s2)
 
 
 def string_contains(s1, s2):
@@ -105,10 +179,7 @@ def string_contains(s1, s2):
     """
     if not s1 or not s2:
         return False
-    if is_windows():
-        s1 = s1.lower()
-        s2 = s2.lower()
-    return s1 in s2
+    return case_key(s1) in case_key(s2)
 
 
 def string_startswith(s1, s2):
@@ -118,10 +189,7 @@ def string_startswith(s1, s2):
     :param s2: String to search in.
     :return: bool.
     """
-    if is_windows():
-        s1 = s1.lower()
-        s2 = s2.lower()
-    return s2.startswith(s1)
+    return case_key(s2).startswith(case_key(s1))
 
 
 def list_contains(s1, l2):
@@ -131,45 +199,55 @@ def list_contains(s1, l2):
     :param l2: List to search in.
     :return: bool.
     """
-    if is_windows():
-        s1 = s1.lower()
-        l2 = [item.lower() for item in l2]
-    return s1 in l2
+    if not is_windows():
+        return s1 in l2
+    s1 = s1.lower()
+    return any(item.lower() == s1 for item in l2)
 
 
 def get_filename_index(s1, l2):
     """
     Get index for filename in list, ignoring case for Windows and ignoring path.
+    For repeated lookups in an index, use FileIndex.find_files instead.
     :param s1: Name of file.
     :param l2: List to search in.
     :return: Index number of file or None if not found.
     """
-    if is_windows():
-        s1 = s1.lower()
-        l2 = [item.lower() for item in l2]
-    try:
-        return [os.path.basename(item) for item in l2].index(s1)
-    except ValueError:
-        return None
+    fold = is_windows()
+    s1 = s1.lower() if fold else s1
+    for i, item in enumerate(l2):
+        name = os.path.basename(item)
+        if (name.lower() if fold else name) == s1:
+            return i
+    return None
 
 
 def get_folder_index(s1, l2):
     """
     Get index for folder in list, ignoring case for Windows.
-    Returns longest path possible.
+    Returns longest path possible, i.e. folders named s1 are preferred to folders with a
+    parent named s1, and so on. For repeated lookups in an index, use
+    FileIndex.find_folder instead.
     :param s1: Name of folder.
     :param l2: List to search in.
     :return: Index number of folder or None if not found.
     """
-    if is_windows():
-        s1 = s1.lower()
-        l2 = [item.lower() for item in l2]
-    while l2 != [os.path.dirname(item) for item in l2]:
-        try:
-            return [os.path.basename(item) for item in l2].index(s1)
-        except ValueError:
-            l2 = [os.path.dirname(item) for item in l2]
-    return None
+    s1 = case_key(s1)
+    best = None
+    for i, item in enumerate(l2):
+        path = case_key(item)
+        # number of parents to remove before the folder name matches
+        level = 0
+        while best is None or level < best[0]:
+            if os.path.basename(path) == s1:
+                best = (level, i)
+                break
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+            level += 1
+    return None if best is None else best[1]
 
 
 def handle_arg_spaces(old_args):
@@ -209,30 +287,354 @@ def handle_arg_spaces(old_args):
     return old_args
 
 
-def get_file_hash(fullname, size=None, ctime=None):
+class HashStats:
+    """Running totals of files and bytes hashed, used to report hashing throughput."""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, nbytes, seconds):
+        """
+        Record one hashed file.
+        :param nbytes: Number of bytes read from the file.
+        :param seconds: Time taken to read and hash the file.
+        """
+        with self._lock:
+            self.files += 1
+            self.bytes += nbytes
+            self.seconds += seconds
+
+    def rate(self, elapsed=None):
+        """
+        Get the hashing throughput in bytes per second.
+        :param elapsed: Wall clock time to use instead of the summed per-file times,
+        e.g. when files were hashed on several threads.
+        """
+        seconds = self.seconds if elapsed is None else elapsed
+        return self.bytes / seconds if seconds else 0.0
+
+    def log(self, elapsed=None):
+        """
+        Log the totals and throughput.
+        :param elapsed: Wall clock time to report, see rate.
+        """
+        LOG.info(
+            "Hashed %d files (%s) in %.1fs, %s/s",
+            self.files,
+            format_size(self.bytes),
+            self.seconds if elapsed is None else elapsed,
+            format_size(self.rate(elapsed)),
+        )
+
+
+def format_size(nbytes):
+    """
+    Format a number of bytes as a human readable string.
+    :param nbytes: Number of bytes.
+    :return: String such as 1.5 MB.
+    """
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(nbytes) < 1024 or unit == "TB":
+            break
+        nbytes /= 1024.0
+    return "%.1f %s" % (nbytes, unit)
+
+
+class Checksum:
+    """Wrap a zlib checksum function so it can be used like a hashlib object.
+    Checksums are much faster than hashes, but are only good enough to spot that
+    a file has changed, not to identify its contents.
+    """
+
+    def __init__(self, name, func, start):
+        self.name = name
+        self._func = func
+        self._value = start
+
+    def update(self, data):
+        """Add data to the checksum."""
+        self._value = self._func(data, self._value)
+
+    def hexdigest(self):
+        """Get the checksum as a hex string."""
+        return "%08x" % (self._value & 0xFFFFFFFF)
+
+
+HASH_ALGORITHMS = {
+    "md5": md5,
+    "sha256": sha256,
+    "blake2b": blake2b,
+    "crc32": lambda: Checksum("crc32", zlib.crc32, 0),
+    "adler32": lambda: Checksum("adler32", zlib.adler32, 1),
+}
+
+
+def new_hash(algorithm=DEFAULT_HASH):
+    """
+    Create a new hash object.
+    :param algorithm: Name of the hash algorithm, one of HASH_ALGORITHMS.
+    :return: hashlib style object with update and hexdigest methods.
+    :raise ValueError: If the algorithm is not known.
+    """
+    try:
+        return HASH_ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError("Unknown hash algorithm %s" % algorithm)
+
+
+def get_config_hash(path):
+    """
+    Get the hash algorithm to use from the config file.
+    :param path: Path of config file.
+    :return: Name of hash algorithm, or the default if not set or not known.
+    """
+    return get_config_choice(path, HASH_KEY, HASH_ALGORITHMS, DEFAULT_HASH)
+
+
+def get_config_choice(path, key, choices, default):
+    """
+    Get a setting from the config file that must be one of a set of choices.
+    :param path: Path of config file.
+    :param key: Key to read.
+    :param choices: Allowed values.
+    :param default: Value to use if not set or not allowed.
+    :return: Value of the setting.
+    """
+    value = get_config_key(path, key)
+    if not value:
+        return default
+    if value[0] not in choices:
+        LOG.warning("Unknown %s %s, using %s", key, value[0], default)
+        return default
+    return value[0]
+
+
+def parse_compression(value):
+    """
+    Read a backup compression setting, i.e. a codec with an optional level like gz:6.
+    :param value: Setting from the config file or command line.
+    :return: Tuple of (codec, level), where level is None for the codec's default, or None
+    if the setting is not valid.
+    """
+    codec, _, level = value.strip().lower().partition(":")
+    codec = COMPRESSION_ALIASES.get(codec, codec)
+    if codec not in COMPRESSION_LEVELS:
+        return None
+    if not level:
+        return codec, None
+    try:
+        level = int(level)
+    except ValueError:
+        return None
+    if level not in COMPRESSION_LEVELS[codec]:
+        return None
+    return codec, level
+
+
+def parse_storage(value):
+    """
+    Read a backup storage setting: tar, store for an object store in the backup folder,
+    or store:path for an object store that can be shared by several backup folders.
+    chunks and chunks:path are the same as store, but large files are stored in chunks.
+    :param value: Setting from the config file or command line.
+    :return: Tuple of (storage, store path), where store path is None unless given, or
+    None if the setting is not valid.
+    """
+    storage, _, store = value.strip().partition(":")
+    storage = storage.lower()
+    if storage not in STORAGES or (store and storage == "tar"):
+        return None
+    return storage, store or None
+
+
+def parse_delta_depth(value):
     """
-    Return a string representing the md5 hash of the given file.
+    Read a delta depth setting, the number of deltas that can be applied in a row to restore
+    a file before it is backed up in full again.
+    :param value: Setting from the config file or command line.
+    :return: Depth, 0 to not store deltas, or None if the setting is not valid.
+    """
+    try:
+        depth = int(value)
+    except ValueError:
+        return None
+    return depth if depth >= 0 else None
+
+
+def get_config_dest_setting(path, key, dest, parse, default):
+    """
+    Get a setting for backups to a destination folder from the config file. Each entry
+    under the key is either "dest,value" for one destination, or just "value" for any
+    destination without its own entry.
+    :param path: Path of config file.
+    :param key: Key to read.
+    :param dest: Backup destination folder.
+    :param parse: Function to read a value, returning None if it is not valid.
+    :param default: Value to use if not set for the destination or for all destinations.
+    :return: Parsed value of the setting.
+    """
+    for entry in get_config_key(path, key):
+        folder, _, value = entry.rpartition(",")
+        if folder and not string_equals(os.path.normpath(folder), os.path.normpath(dest)):
+            continue
+        parsed = parse(value)
+        if parsed is None:
+            LOG.warning("Unknown %s %s, ignoring it", key, value)
+            continue
+        if folder:
+            return parsed
+        default = parsed
+    return default
+
+
+def get_config_compression(path, dest):
+    """
+    Get the compression to use for backups to a destination folder from the config file.
+    :param path: Path of config file.
+    :param dest: Backup destination folder.
+    :return: Tuple of (codec, level), see parse_compression.
+    """
+    return get_config_dest_setting(
+        path, COMPRESSION_KEY, dest, parse_compression, DEFAULT_COMPRESSION
+    )
+
+
+def get_config_storage(path, dest):
+    """
+    Get how backups to a destination folder are stored from the config file.
+    :param path: Path of config file.
+    :param dest: Backup destination folder.
+    :return: Tuple of (storage, store path), see parse_storage.
+    """
+    return get_config_dest_setting(path, STORAGE_KEY, dest, parse_storage, DEFAULT_STORAGE)
+
+
+def get_config_delta_depth(path, dest):
+    """
+    Get the delta depth for backups to a destination folder from the config file.
+    :param path: Path of config file.
+    :param dest: Backup destination folder.
+    :return: Depth, see parse_delta_depth.
+    """
+    return get_config_dest_setting(
+        path, DELTA_DEPTH_KEY, dest, parse_delta_depth, DEFAULT_DELTA_DEPTH
+    )
+
+
+def _get_hash_buffer():
+    """Get the read buffer for the current thread, creating it if needed."""
+    buf = getattr(_hash_buffers, "buf", None)
+    if buf is None:
+        buf = _hash_buffers.buf = bytearray(HASH_BUFFER_SIZE)
+    return buf
+
+
+def get_file_hash(
+    fullname, size=None, ctime=None, stats=None, algorithm=DEFAULT_HASH, mmap_threshold=0
+):
+    """
+    Return a string representing the hash of the given file.
     Use size and/or ctime args if file is on a phone and can't be read.
+    The file is read in binary chunks into a reusable buffer, so memory use does not
+    depend on the file size. Files of at least mmap_threshold bytes are memory mapped and
+    hashed in place instead, which saves copying each chunk.
     :param fullname: Full path of file.
     :param size: File size.
     :param ctime: File create time.
+    :param stats: Optional HashStats to add the number of bytes read to.
+    :param algorithm: Name of the hash algorithm to use, md5 by default.
+    :param mmap_threshold: Size in bytes above which files are memory mapped, 0 to never map.
     :return: Hex string hash of file.
     """
-    md5hash = None
+    hasher = None
     if size or ctime:
-        md5hash = md5(fullname.encode("latin1"))
+        hasher = new_hash(algorithm)
+        hasher.update(fullname.encode("latin1"))
         if size:
-            md5hash.update(str(size).encode("latin1"))
+            hasher.update(str(size).encode("latin1"))
         if ctime:
-            md5hash.update(str(ctime).encode("latin1"))
+            hasher.update(str(ctime).encode("latin1"))
     else:
+        start = time.perf_counter()
         try:
-            with io.open(fullname, encoding="latin1") as f:
-                md5hash = md5(f.read().encode("latin1", errors="ignore"))
-        except (IOError, MemoryError):
+            with open(fullname, "rb", buffering=0) as f:
+                hasher = new_hash(algorithm)
+                nbytes = None
+                file_size = os.fstat(f.fileno()).st_size
+                if mmap_threshold and file_size >= mmap_threshold:
+                    nbytes = _hash_mapped(f, hasher, file_size)
+                if nbytes is None:
+                    nbytes = _hash_buffered(f, hasher)
+        except (OSError, ValueError):
             LOG.warning("could not process file: %s", fullname)
+            hasher = None
+        if hasher and stats is not None:
+            stats.add(nbytes, time.perf_counter() - start)
 
-    return md5hash.hexdigest() if md5hash else None
+    return hasher.hexdigest() if hasher else None
+
+
+def _hash_buffered(f, hasher):
+    """
+    Hash an open file by reading it into this thread's buffer.
+    :return: Number of bytes read.
+    """
+    buf = _get_hash_buffer()
+    nbytes = 0
+    with memoryview(buf) as view:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+            nbytes += n
+    return nbytes
+
+
+def _hash_mapped(f, hasher, size):
+    """
+    Hash an open file by memory mapping it and passing the mapping straight to the hasher.
+    Note the file must not be truncated while it is being hashed, see
+    DEFAULT_MMAP_THRESHOLD.
+    :param size: Size of the file when it was opened.
+    :return: Number of bytes read, or None if the file changed size before it was mapped,
+    so should be read instead.
+    """
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if os.fstat(f.fileno()).st_size != size or len(mapped) != size:
+            LOG.debug("File changed size while opening, reading it instead")
+            return None
+        # not available on Windows
+        if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        hasher.update(mapped)
+        return len(mapped)
+
+
+def get_quick_hash(fullname, size, algorithm=DEFAULT_HASH):
+    """
+    Return a string representing the hash of the size and the first, middle and last
+    blocks of the given file. This is much cheaper than a full hash for large files, and
+    is enough to show that a file has changed, but not that it hasn't.
+    :param fullname: Full path of file.
+    :param size: File size.
+    :param algorithm: Name of the hash algorithm to use, md5 by default.
+    :return: Hex string hash, or None if the file can't be read.
+    """
+    hasher = new_hash(algorithm)
+    hasher.update(str(size).encode("latin1"))
+    try:
+        with open(fullname, "rb") as f:
+            for offset in (0, (size - QUICK_BLOCK_SIZE) // 2, size - QUICK_BLOCK_SIZE):
+                f.seek(max(offset, 0))
+                hasher.update(f.read(QUICK_BLOCK_SIZE))
+    except OSError:
+        LOG.warning("could not process file: %s", fullname)
+        return None
+    return hasher.hexdigest()
 
 
 def get_config_version(path):
@@ -247,6 +649,64 @@ def get_config_version(path):
     return 0
 
 
+def get_config_int(path, key, default=0):
+    """
+    Get a single integer value from the config file.
+    :param path: Path of config file.
+    :param key: Key to read.
+    :param default: Value to return if the key is not set or is not a number.
+    :return: int.
+    """
+    value = get_config_key(path, key)
+    if value:
+        try:
+            return int(value[0])
+        except ValueError:
+            LOG.warning("Config value for %s is not a number: %s", key, value[0])
+    return default
+
+
+def iter_config_file(path):
+    """
+    Read a backpy config file (.backpy, .index, etc.) one line at a time, without loading
+    the whole file.
+    :param path: Path to config file.
+    :return: Generator of (key, value, is_param) tuples, see iter_config_lines.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "r") as f:
+        yield from iter_config_lines(f)
+
+
+def iter_config_lines(lines):
+    """
+    Parse the lines of a backpy config file. Entries without a section header (i.e. old
+    config files) are in the Default section.
+    :param lines: Iterable of lines, e.g. an open text file.
+    :return: Generator of (key, value, is_param) tuples. Parameter lines like [key=value]
+    give (key, value, True). Section headers give (section, None, False), and each entry
+    in a section gives (section, entry, False).
+    """
+    section = DEFAULT_KEY
+    for line in lines:
+        line = line.strip()
+        # only lines starting with [ can be headers, so other lines skip the search for ]
+        if line[:1] == "[":
+            end = line.rfind("]")
+            if end > 0:
+                header_text = line[1:end]
+                if "=" in header_text:
+                    # handle parameters
+                    param, val = header_text.split("=", 1)
+                    yield param, val, True
+                else:
+                    section = header_text
+                    yield section, None, False
+                continue
+        yield section, line, False
+
+
 def read_config_file(path):
     """
     Read a backpy config file (.backpy, .index, etc.) and return as a dictionary
@@ -255,23 +715,14 @@ def read_config_file(path):
     :param path: Path to config file.
     :return: dict of file contents.
     """
-    this_key = "default"
-    items = {this_key: []}
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            for line in f.readlines():
-                header = re.match(r"\[(.*)]", line.strip())
-                if header:
-                    header_text = header.group(1)
-                    if "=" in header_text:
-                        # handle parameters
-                        param, val = header_text.split("=")
-                        items[param] = val
-                    else:
-                        this_key = header_text
-                        items[this_key] = []
-                    continue
-                items[this_key].append(line.strip())
+    items = {DEFAULT_KEY: []}
+    for key, value, is_param in iter_config_file(path):
+        if is_param:
+            items[key] = value
+        elif value is None:
+            items[key] = []
+        else:
+            items[key].append(value)
 
     return items
 
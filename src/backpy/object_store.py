@@ -0,0 +1,303 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import logging
+import os
+import sqlite3
+import zlib
+from hashlib import sha256
+
+from .logger import LOG_NAME
+
+# default location of the object store, inside the backup folder
+STORE_NAME = ".objects"
+STORE_DB = "objects.sqlite"
+STORE_VERSION = 1
+# a new pack file is started once the current one is this big
+PACK_SIZE = 256 * 1024 * 1024
+BLOCK_SIZE = 1024 * 1024
+# files up to this size are read once, bigger files are hashed before they are stored
+SMALL_OBJECT_SIZE = 4 * 1024 * 1024
+# objects are only compressed if a sample of them compresses by at least 10%
+SAMPLE_SIZE = 64 * 1024
+DEFAULT_LEVEL = 6
+# how each object is stored in its pack file
+RAW = 0
+ZLIB = 1
+LOG = logging.getLogger(LOG_NAME)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS objects (key BLOB PRIMARY KEY, pack INTEGER NOT NULL, "
+    "offset INTEGER NOT NULL, length INTEGER NOT NULL, size INTEGER NOT NULL, "
+    "codec INTEGER NOT NULL) WITHOUT ROWID",
+)
+
+
+def _compressible(block):
+    """Check if the start of an object compresses well enough to be worth compressing."""
+    sample = block[:SAMPLE_SIZE]
+    return bool(sample) and len(zlib.compress(sample, 1)) < 0.9 * len(sample)
+
+
+class ObjectStore:
+    """Content addressed store of file contents, so each distinct file is only stored
+    once however many paths, sources or backups it appears in. Objects are keyed by the
+    sha256 digest of their contents, whatever hash algorithm the index uses, as the key
+    alone decides whether contents are already stored. Objects are appended to pack files,
+    so backing up many small files doesn't create as many files in the store, and their
+    locations are kept in an SQLite file next to the packs. Objects are compressed with
+    zlib unless the start of the file doesn't compress.
+    """
+
+    def __init__(self, path, level=DEFAULT_LEVEL):
+        self.__path__ = path
+        self.__level__ = level
+        self.__pack__ = None
+        self.__pack_number__ = None
+        self.__added__ = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.__db__ = sqlite3.connect(os.path.join(path, STORE_DB))
+        version = self.__db__.execute("PRAGMA user_version").fetchone()[0]
+        if version > STORE_VERSION:
+            self.__db__.close()
+            raise sqlite3.DatabaseError(
+                "Object store version %d is newer than %d" % (version, STORE_VERSION)
+            )
+        with self.__db__:
+            for statement in SCHEMA:
+                self.__db__.execute(statement)
+            self.__db__.execute("PRAGMA user_version = %d" % STORE_VERSION)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def added(self):
+        """Get the number of objects added since the store was opened."""
+        return self.__added__
+
+    def close(self):
+        """Save the locations of the objects added and close the store."""
+        try:
+            if self.__pack__ is not None:
+                self.__pack__.close()
+                self.__pack__ = None
+            self.__db__.commit()
+        finally:
+            self.__db__.close()
+
+    def _find(self, key):
+        """
+        Find an object in the packs.
+        :param key: Object key.
+        :return: Tuple of pack number, offset, length, size and codec, or None if the object
+        is not in the store.
+        """
+        try:
+            packed_key = bytes.fromhex(key)
+        except ValueError:
+            return None
+        return self.__db__.execute(
+            "SELECT pack, offset, length, size, codec FROM objects WHERE key = ?", (packed_key,)
+        ).fetchone()
+
+    def _pack_path(self, number):
+        return os.path.join(self.__path__, "pack-%06d.pack" % number)
+
+    def _open_pack(self):
+        """Get the pack file to add objects to, starting a new one if it is full."""
+        if self.__pack__ is not None:
+            if self.__pack__.tell() < PACK_SIZE:
+                return self.__pack__
+            self.__pack__.close()
+            self.__pack_number__ += 1
+        else:
+            row = self.__db__.execute("SELECT MAX(pack) FROM objects").fetchone()
+            self.__pack_number__ = row[0] or 0
+            path = self._pack_path(self.__pack_number__)
+            if os.path.exists(path) and os.path.getsize(path) >= PACK_SIZE:
+                self.__pack_number__ += 1
+        # bytes left by an interrupted backup are kept, as nothing refers to them
+        self.__pack__ = open(self._pack_path(self.__pack_number__), "ab")
+        return self.__pack__
+
+    def add_file(self, path):
+        """
+        Add the contents of a file to the store, unless they are already stored.
+        :param path: Path of file to add.
+        :return: Object key, or None if the file could not be read.
+        """
+        try:
+            if os.path.getsize(path) <= SMALL_OBJECT_SIZE:
+                with open(path, "rb") as f:
+                    data = f.read()
+                key = sha256(data).hexdigest()
+                return key if key in self else self._write([data])
+            hasher = sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                    hasher.update(block)
+            key = hasher.hexdigest()
+            if key in self:
+                return key
+            with open(path, "rb") as f:
+                return self._write(iter(lambda: f.read(BLOCK_SIZE), b""))
+        except (IOError, OSError):
+            LOG.warning("Could not add %s to object store", path)
+            return None
+
+    def _write(self, blocks):
+        """
+        Append an object to the current pack file.
+        :param blocks: Iterable of the object's contents.
+        :return: Object key of the contents written. This is worked out again as they are
+        written, in case a file changed after it was first hashed.
+        """
+        pack = self._open_pack()
+        offset = pack.tell()
+        hasher = sha256()
+        compressor = None
+        codec = None
+        size = 0
+        for block in blocks:
+            if codec is None:
+                codec = ZLIB if self.__level__ and _compressible(block) else RAW
+                if codec == ZLIB:
+                    compressor = zlib.compressobj(self.__level__)
+            hasher.update(block)
+            size += len(block)
+            pack.write(compressor.compress(block) if compressor else block)
+        if compressor:
+            pack.write(compressor.flush())
+        key = hasher.hexdigest()
+        self.__added__ += 1
+        self.__db__.execute(
+            "INSERT OR IGNORE INTO objects (key, pack, offset, length, size, codec) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                bytes.fromhex(key),
+                self.__pack_number__,
+                offset,
+                pack.tell() - offset,
+                size,
+                codec or RAW,
+            ),
+        )
+        return key
+
+    def add_chunks(self, path, chunker):
+        """
+        Split a file into chunks and add each chunk to the store, unless it is already
+        stored.
+        :param path: Path of file to add.
+        :param chunker: Chunker to split the file with.
+        :return: List of object keys of the chunks in order, or None if the file could not
+        be read.
+        """
+        keys = []
+        try:
+            with open(path, "rb") as f:
+                for chunk in chunker.chunks(f):
+                    key = sha256(chunk).hexdigest()
+                    keys.append(key if key in self else self._write([chunk]))
+        except (IOError, OSError):
+            LOG.warning("Could not add %s to object store", path)
+            return None
+        return keys
+
+    def extract(self, key, path):
+        """
+        Write the contents of an object to a file.
+        :param key: Object key.
+        :param path: Path of file to write, replacing any existing file.
+        :return: True if the file was written and its contents match the key.
+        """
+        return self.extract_chunks([key], path)
+
+    def extract_chunks(self, keys, path):
+        """
+        Write the contents of several objects, e.g. the chunks of a file, to a file.
+        :param keys: Object keys in order.
+        :param path: Path of file to write, replacing any existing file.
+        :return: True if the file was written and the contents of each object match its key.
+        """
+        if self.__pack__ is not None:
+            self.__pack__.flush()
+        packs = {}
+        try:
+            folder = os.path.dirname(path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            with open(path, "wb") as f:
+                for key in keys:
+                    if not self._copy(key, f, packs):
+                        return False
+        except (IOError, OSError, zlib.error):
+            LOG.exception("Could not extract objects to %s", path)
+            return False
+        finally:
+            for pack in packs.values():
+                pack.close()
+        return True
+
+    def _copy(self, key, f, packs):
+        """
+        Write the contents of an object to an open file.
+        :param key: Object key.
+        :param f: Binary file object to write to.
+        :param packs: dict of pack number to open pack file, added to as packs are opened.
+        :return: True if the contents match the key.
+        """
+        found = self._find(key)
+        if found is None:
+            LOG.error("Object %s is not in the object store %s", key, self.__path__)
+            return False
+        number, offset, length, _, codec = found
+        if number not in packs:
+            packs[number] = open(self._pack_path(number), "rb")
+        pack = packs[number]
+        hasher = sha256()
+        decompressor = zlib.decompressobj() if codec == ZLIB else None
+        pack.seek(offset)
+        remaining = length
+        while remaining:
+            block = pack.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            if decompressor:
+                block = decompressor.decompress(block)
+            hasher.update(block)
+            f.write(block)
+        if decompressor:
+            block = decompressor.flush()
+            hasher.update(block)
+            f.write(block)
+        if hasher.hexdigest() != key:
+            LOG.error("Object %s in %s is damaged", key, self._pack_path(number))
+            return False
+        return True
@@ -0,0 +1,121 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import struct
+
+from .file_table import FileTable, join_strings, split_strings
+
+# first bytes of a packed index, which can't be the start of a text index
+MAGIC = b"BACKPY\x00I"
+PACKED_VERSION = 1
+VERSION = struct.Struct("<H")
+# each section is a 4 byte tag and the length of the data that follows it
+SECTION = struct.Struct("<4sQ")
+# sections of path to string mappings, e.g. quick hashes and moved files
+PAIR_SECTIONS = (b"QUIK", b"MOVE", b"OBJS", b"CHNK", b"DLTA")
+
+
+def _pairs(data):
+    """Decode a null separated buffer of keys and values into a dict."""
+    values = split_strings(data)
+    return dict(zip(values[::2], values[1::2]))
+
+
+def is_packed(path):
+    """
+    Check if a file is a packed index.
+    :param path: Path to index file.
+    :return: True if the file starts with the packed index marker.
+    """
+    try:
+        with open(path, "rb") as index:
+            return index.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+
+def write_packed(path, header, dirs, files, pairs):
+    """
+    Write an index in the packed format. The file table is saved as its raw buffers, so
+    reading it back is mostly copying bytes rather than parsing a line per file.
+    :param path: Path to index file.
+    :param header: dict of index settings, e.g. adb and hash.
+    :param dirs: Iterable of folder paths.
+    :param files: FileTable of file paths and digests.
+    :param pairs: dict of section tag, one of PAIR_SECTIONS, to dict of file path to
+    string, e.g. quick hashes or the paths files were moved from.
+    """
+    sections = [
+        (b"HEAD", join_strings("%s=%s" % item for item in header.items())),
+        (b"DIRS", join_strings(dirs)),
+    ]
+    sections.extend(files.sections())
+    for tag, values in pairs.items():
+        sections.append((tag, join_strings(x for item in values.items() for x in item)))
+    with open(path, "wb") as index:
+        index.write(MAGIC)
+        index.write(VERSION.pack(PACKED_VERSION))
+        for tag, data in sections:
+            index.write(SECTION.pack(tag, len(data)))
+            index.write(data)
+
+
+def read_packed(index):
+    """
+    Read an index written by write_packed.
+    :param index: Binary file object at the start of the index.
+    :return: Tuple of header dict, list of folders, FileTable and dict of section tag to
+    dict, for each of PAIR_SECTIONS.
+    :raise ValueError: If the file is not a packed index or is damaged.
+    """
+    sections = {}
+    if index.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a packed index")
+    try:
+        (version,) = VERSION.unpack(index.read(VERSION.size))
+        if version > PACKED_VERSION:
+            raise ValueError("Packed index version %d is newer than %d" % (version, PACKED_VERSION))
+        while True:
+            section = index.read(SECTION.size)
+            if not section:
+                break
+            tag, length = SECTION.unpack(section)
+            # read into a buffer the file table can keep, rather than copying it
+            data = bytearray(length)
+            if index.readinto(data) != length:
+                raise ValueError("Packed index is truncated")
+            # sections added by later versions are skipped
+            sections[tag] = data
+    except struct.error:
+        raise ValueError("Packed index is truncated")
+    try:
+        files = FileTable.from_sections(sections)
+        header = dict(item.split("=", 1) for item in split_strings(sections[b"HEAD"]))
+        dirs = split_strings(sections[b"DIRS"])
+    except KeyError as e:
+        raise ValueError("Packed index has no %s section" % e.args[0].decode("ascii"))
+    return header, dirs, files, {tag: _pairs(sections.get(tag)) for tag in PAIR_SECTIONS}
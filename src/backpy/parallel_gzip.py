@@ -0,0 +1,118 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# amount of data compressed by each job, large enough that the extra gzip headers and
+# the restarted compression history cost almost nothing, see benchmarks/parallel_gzip.py
+BLOCK_SIZE = 1024 * 1024
+# same default as tarfile and gzip
+DEFAULT_LEVEL = 9
+# number of blocks each job can have queued before writes wait for results
+PENDING_PER_JOB = 2
+
+
+def compress_block(data, level=DEFAULT_LEVEL):
+    """
+    Compress a block of data as a complete gzip member.
+    :param data: Bytes to compress.
+    :param level: Compression level, 1-9.
+    :return: gzip member bytes.
+    """
+    # wbits 31 writes a gzip header and trailer, with a zero timestamp
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ParallelGzipWriter:
+    """Write-only file object that gzip compresses everything written to it using a pool
+    of threads, as pigz does. Data is split into blocks and each block is compressed as a
+    separate gzip member. Members are written in order, so the file is a standard multiple
+    member gzip file that the gzip and tarfile modules can read.
+    zlib releases the GIL while compressing, so each thread can keep a core busy.
+    """
+
+    def __init__(self, path, level=None, jobs=2, block_size=BLOCK_SIZE):
+        self.name = path
+        self.__level__ = level or DEFAULT_LEVEL
+        self.__block_size__ = block_size
+        self.__buffer__ = bytearray()
+        self.__offset__ = 0
+        self.__pending__ = deque()
+        self.__max_pending__ = max(1, jobs) * PENDING_PER_JOB
+        self.__file__ = open(path, "wb")
+        self.__pool__ = ThreadPoolExecutor(max_workers=max(1, jobs))
+
+    @property
+    def closed(self):
+        return self.__file__.closed
+
+    def write(self, data):
+        """
+        Add data to the file, compressing any full blocks.
+        :param data: Bytes to write.
+        :return: Number of bytes written.
+        """
+        self.__buffer__ += data
+        self.__offset__ += len(data)
+        size = self.__block_size__
+        if len(self.__buffer__) >= size:
+            view = memoryview(self.__buffer__)
+            start = 0
+            end = size
+            while end <= len(view):
+                self._submit(bytes(view[start:end]))
+                start, end = end, end + size
+            view.release()
+            del self.__buffer__[:start]
+        return len(data)
+
+    def tell(self):
+        """Get the number of bytes written, before compression."""
+        return self.__offset__
+
+    def _submit(self, block):
+        """Queue a block for compression, writing finished blocks if the queue is full."""
+        self.__pending__.append(self.__pool__.submit(compress_block, block, self.__level__))
+        while len(self.__pending__) > self.__max_pending__:
+            self.__file__.write(self.__pending__.popleft().result())
+
+    def close(self):
+        """Compress any remaining data and close the file."""
+        if self.closed:
+            return
+        try:
+            if self.__buffer__:
+                self._submit(bytes(self.__buffer__))
+                self.__buffer__ = bytearray()
+            while self.__pending__:
+                self.__file__.write(self.__pending__.popleft().result())
+        finally:
+            self.__pool__.shutdown()
+            self.__file__.close()
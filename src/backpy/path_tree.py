@@ -0,0 +1,120 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import os
+
+from .helpers import is_windows
+
+# characters that can end a folder path, e.g. when typed with a trailing separator
+SEPARATORS = os.sep + (os.altsep or "")
+
+
+class PathTree:
+    """Folders of an index as a tree, for finding a folder by name and listing the
+    folders below a folder without searching every folder. Paths are compared ignoring
+    case for Windows. Parents of the folders added are included in the tree, so folders
+    above the root of an index can be searched too.
+    """
+
+    def __init__(self, dirs=()):
+        self.__fold__ = is_windows()
+        # folder key to set of child folder keys
+        self.__children__ = {}
+        # keys of the folders added, rather than their parents
+        self.__dirs__ = set()
+        # name key to (level, path) of the best match for each folder name
+        self.__names__ = {}
+        for path in dirs:
+            self.add(path)
+
+    def __len__(self):
+        return len(self.__dirs__)
+
+    def __contains__(self, path):
+        return self._key(path) in self.__dirs__
+
+    def _key(self, path):
+        """Get the key of a path, without any trailing separator."""
+        stripped = path.rstrip(SEPARATORS)
+        if stripped and not stripped.endswith(":"):
+            path = stripped
+        return path.lower() if self.__fold__ else path
+
+    def add(self, path):
+        """
+        Add a folder, and its parents, to the tree.
+        :param path: Full path of folder.
+        """
+        key = self._key(path)
+        if key in self.__dirs__:
+            return
+        self.__dirs__.add(key)
+        # a folder matches a name at level 0, its parent's name at level 1, and so on
+        level = 0
+        linked = False
+        child, child_key = path, key
+        while True:
+            name = os.path.basename(child)
+            name_key = name.lower() if self.__fold__ else name
+            best = self.__names__.get(name_key)
+            if best is None or (level, path) < best:
+                self.__names__[name_key] = (level, path)
+            parent = os.path.dirname(child)
+            if parent == child:
+                break
+            parent_key = self._key(parent)
+            if not linked:
+                children = self.__children__.setdefault(parent_key, set())
+                # the rest of the parents are already in the tree
+                linked = child_key in children
+                children.add(child_key)
+            child, child_key = parent, parent_key
+            level += 1
+
+    def find(self, name):
+        """
+        Find a folder by name, as get_folder_index does. Folders with the given name are
+        preferred to folders with a parent of that name, and so on up the tree. The first
+        folder in sorted order is used if there are several.
+        :param name: Folder name without its parent folders.
+        :return: Full path of folder, or None if no folder or parent has that name.
+        """
+        best = self.__names__.get(name.lower() if self.__fold__ else name)
+        return None if best is None else best[1]
+
+    def below(self, path):
+        """
+        Get a folder and all the folders below it, including parents of added folders
+        that were not added themselves.
+        :param path: Full path of folder.
+        :return: Generator of folder keys, i.e. paths in lower case for Windows.
+        """
+        pending = [self._key(path)]
+        while pending:
+            key = pending.pop()
+            yield key
+            pending.extend(self.__children__.get(key, ()))
@@ -0,0 +1,578 @@
+"""
+Copyright (c) 2012, Steffen Schneider <stes94@ymail.com>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer. Redistributions in binary
+form must reproduce the above copyright notice, this list of conditions and
+the following disclaimer in the documentation and/or other materials provided
+with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import abc
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import stat
+import struct
+import sys
+import time
+from hashlib import md5
+
+from .hash_cache import stat_key
+from .helpers import DATA_DIR, is_windows, make_directory
+from .logger import LOG_NAME
+
+JOURNAL_DIR = os.path.join(DATA_DIR, "journal")
+JOURNAL_VERSION = "1"
+# changes recorded this long before an index was generated are also returned, in case
+# the watcher had not written them to the journal when the index was made
+JOURNAL_SLACK = 2
+# rewrite the journal with one line per path when it gets this long
+JOURNAL_COMPACT_LINES = 100000
+DEFAULT_WATCH_INTERVAL = 60
+# a running watcher marks its journal as alive at least this often, in seconds. A pid
+# alone can't show the watcher is still running, as pids are reused and can't be checked
+# on Windows, so a journal is ignored once it misses this many heartbeats
+HEARTBEAT_INTERVAL = 60
+HEARTBEAT_MISSES = 3
+LOG = logging.getLogger(LOG_NAME)
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+)
+EVENT = struct.Struct("iIII")
+EVENT_BUFFER_SIZE = 64 * 1024
+
+
+def _is_running(pid):
+    """Check if a process is still running."""
+    if is_windows():
+        # os.kill can't check a process without stopping it on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _in_folder(fullname, folder):
+    """Check if a path is a folder or is inside it."""
+    folder = folder.rstrip(os.sep)
+    return fullname == folder or fullname.startswith(folder + os.sep)
+
+
+class Journal:
+    """Paths changed under a source folder, recorded by a running watcher.
+    The journal can only be trusted if the watcher was running before the index it is
+    compared to was generated, is still running, and has not missed any changes.
+    """
+
+    def __init__(self, source, path=None):
+        self.__source__ = source
+        self.__path__ = path or os.path.join(
+            JOURNAL_DIR, md5(os.path.normpath(source).encode("utf-8")).hexdigest()
+        )
+        self.__file__ = None
+        self.__lines__ = 0
+        self.__latest__ = {}
+
+    def source(self):
+        """Get the source folder of this journal."""
+        return self.__source__
+
+    def open(self):
+        """
+        Start a new journal for this source, replacing any old one.
+        :return: True if the journal was opened, False if another watcher is using it.
+        """
+        header = self._read_header()
+        pid = header.get("pid")
+        if pid and pid != os.getpid() and self._is_alive(header):
+            LOG.error("Source %s is already being watched by process %d", self.__source__, pid)
+            return False
+        folder = os.path.dirname(self.__path__)
+        if not os.path.exists(folder):
+            make_directory(folder)
+        self.__file__ = open(self.__path__, "w", encoding="utf-8", errors="surrogateescape")
+        self.__file__.write("[version=%s]\n[pid=%d]\n" % (JOURNAL_VERSION, os.getpid()))
+        self.__file__.flush()
+        self.__lines__ = 2
+        self.__latest__ = {}
+        return True
+
+    def mark_started(self, heartbeat=HEARTBEAT_INTERVAL):
+        """
+        Record that every change from now on will be recorded.
+        :param heartbeat: Longest time in seconds between calls to mark_alive.
+        """
+        if self.__file__ is None:
+            return
+        self.__file__.write("[heartbeat=%d]\n" % heartbeat)
+        self.__lines__ += 1
+        self._write_marker("started")
+
+    def mark_alive(self):
+        """Record that the watcher is still running."""
+        self._write_marker("alive")
+
+    def mark_overflow(self):
+        """Record that some changes have been missed, so the journal can't be used."""
+        LOG.warning(
+            "Changes to %s have been missed, the next backup will read all files", self.__source__
+        )
+        self._write_marker("overflow")
+
+    def close(self):
+        """Record that the watcher has stopped and close the journal."""
+        if self.__file__ is None:
+            return
+        self._write_marker("stopped")
+        self.__file__.close()
+        self.__file__ = None
+
+    def record(self, paths, when=None):
+        """
+        Add changed paths to the journal.
+        :param paths: Iterable of paths that have been created, modified, moved or deleted.
+        :param when: Time the changes were seen, defaults to now.
+        """
+        if self.__file__ is None:
+            return
+        when = time.time() if when is None else when
+        for fullname in paths:
+            if "\n" in fullname:
+                # can't be written as a journal line
+                self.mark_overflow()
+                continue
+            self.__file__.write("%.6f@@@%s\n" % (when, fullname))
+            self.__latest__[fullname] = when
+            self.__lines__ += 1
+        self.__file__.flush()
+        if self.__lines__ > JOURNAL_COMPACT_LINES and self.__lines__ > 2 * len(self.__latest__):
+            self._compact()
+
+    def changes_since(self, generated):
+        """
+        Get the paths changed since an index was generated.
+        :param generated: Time the index was generated, as seconds since the epoch.
+        :return: Set of changed paths, or None if the journal does not cover all the changes
+        since that time.
+        """
+        if generated is None:
+            LOG.debug("Index does not record when it was generated")
+            return None
+        if not os.path.exists(self.__path__):
+            LOG.info("No change journal for %s, reading all files", self.__source__)
+            return None
+        header = {}
+        changed = set()
+        since = generated - JOURNAL_SLACK
+        try:
+            with open(self.__path__, "r", encoding="utf-8", errors="surrogateescape") as f:
+                if f.readline().strip() != "[version=%s]" % JOURNAL_VERSION:
+                    LOG.debug("Change journal is out of date, ignoring")
+                    return None
+                for line in f:
+                    line = line.rstrip("\n")
+                    if line.startswith("["):
+                        key, _, value = line.strip("[]").partition("=")
+                        header[key] = value
+                        continue
+                    when, _, fullname = line.partition("@@@")
+                    try:
+                        if float(when) >= since:
+                            changed.add(fullname)
+                    except ValueError:
+                        continue
+        except OSError:
+            LOG.warning("Could not read change journal %s", self.__path__)
+            return None
+        if not self._is_complete(self._parse_header(header), generated):
+            return None
+        return changed
+
+    def _is_complete(self, header, generated):
+        """Check that a journal has recorded every change since an index was generated."""
+        if "overflow" in header:
+            LOG.info(
+                "Change journal for %s missed some changes, reading all files", self.__source__
+            )
+        elif not self._is_alive(header):
+            LOG.info("Watcher for %s is not running, reading all files", self.__source__)
+        elif header.get("started") is None or header["started"] > generated:
+            LOG.info(
+                "Watcher for %s started after the last backup, reading all files", self.__source__
+            )
+        else:
+            return True
+        return False
+
+    @staticmethod
+    def _is_alive(header):
+        """Check that the watcher writing a journal is running and has sent a heartbeat
+        recently."""
+        if "stopped" in header or not header.get("pid") or not _is_running(header["pid"]):
+            return False
+        last_seen = max(header.get("started") or 0, header.get("alive") or 0)
+        timeout = HEARTBEAT_MISSES * header.get("heartbeat", HEARTBEAT_INTERVAL)
+        return abs(time.time() - last_seen) <= timeout
+
+    def _read_header(self):
+        """Read the markers in an existing journal."""
+        header = {}
+        try:
+            with open(self.__path__, "r", encoding="utf-8", errors="surrogateescape") as f:
+                for line in f:
+                    if line.startswith("["):
+                        key, _, value = line.strip().strip("[]").partition("=")
+                        header[key] = value
+        except OSError:
+            pass
+        return self._parse_header(header)
+
+    @staticmethod
+    def _parse_header(header):
+        """Convert journal marker values to numbers."""
+        parsed = dict(header)
+        try:
+            if "pid" in header:
+                parsed["pid"] = int(header["pid"])
+            for key in ("started", "alive", "heartbeat"):
+                if key in header:
+                    parsed[key] = float(header[key])
+        except ValueError:
+            parsed["overflow"] = header
+        return parsed
+
+    def _write_marker(self, key):
+        """Add a marker line to the journal."""
+        if self.__file__ is None:
+            return
+        self.__file__.write("[%s=%.6f]\n" % (key, time.time()))
+        self.__file__.flush()
+        self.__lines__ += 1
+
+    def _compact(self):
+        """Rewrite the journal with only the latest change to each path."""
+        LOG.debug("Compacting change journal %s", self.__path__)
+        self.__file__.close()
+        header = self._read_header()
+        temp_path = "%s.tmp" % self.__path__
+        with open(temp_path, "w", encoding="utf-8", errors="surrogateescape") as f:
+            f.write("[version=%s]\n[pid=%d]\n" % (JOURNAL_VERSION, os.getpid()))
+            for key in ("heartbeat", "started", "alive", "overflow"):
+                if key in header:
+                    f.write("[%s=%s]\n" % (key, header[key]))
+            for fullname, when in self.__latest__.items():
+                f.write("%.6f@@@%s\n" % (when, fullname))
+        os.replace(temp_path, self.__path__)
+        self.__file__ = open(self.__path__, "a", encoding="utf-8", errors="surrogateescape")
+        self.__lines__ = len(self.__latest__) + len(header) + 1
+
+
+class Watcher(abc.ABC):
+    """Base class for recording changes under source folders in their journals."""
+
+    interval = 1
+
+    def __init__(self, journals):
+        self.__journals__ = journals
+        self.__last_beat__ = 0
+
+    def journals(self):
+        """Get the journals changes are recorded in."""
+        return self.__journals__
+
+    def start(self):
+        """
+        Open the journals and start watching for changes.
+        :return: True if any sources are being watched.
+        """
+        self.__journals__ = [j for j in self.__journals__ if j.open()]
+        for journal in self.__journals__:
+            LOG.info("Watching %s for changes", journal.source())
+            self.watch_folder(journal.source())
+            journal.mark_started(self.heartbeat_interval())
+        self.__last_beat__ = time.time()
+        return bool(self.__journals__)
+
+    def heartbeat_interval(self):
+        """Get the longest time in seconds between heartbeats, as a check can't be
+        interrupted to send one."""
+        return max(HEARTBEAT_INTERVAL, self.interval)
+
+    def heartbeat(self):
+        """Mark the journals as alive, if it has been long enough since the last time."""
+        now = time.time()
+        if now - self.__last_beat__ < HEARTBEAT_INTERVAL:
+            return
+        self.__last_beat__ = now
+        for journal in self.__journals__:
+            journal.mark_alive()
+
+    def close(self):
+        """Stop watching and close the journals."""
+        for journal in self.__journals__:
+            journal.close()
+
+    @abc.abstractmethod
+    def watch_folder(self, folder):
+        """Start watching a source folder."""
+
+    @abc.abstractmethod
+    def check(self, timeout=None):
+        """
+        Wait for changes and record them.
+        :param timeout: Longest time to wait in seconds, defaults to the watcher's interval.
+        """
+
+    def record(self, paths):
+        """Record changed paths in the journals of the sources they are in."""
+        if not paths:
+            return
+        when = time.time()
+        for journal in self.__journals__:
+            journal.record([p for p in paths if _in_folder(p, journal.source())], when)
+
+    def overflow(self, folder=None):
+        """Mark the journals of sources that may have missed changes."""
+        for journal in self.__journals__:
+            if folder is None or _in_folder(folder, journal.source()):
+                journal.mark_overflow()
+
+
+def _load_libc():
+    """Load the C library if it has inotify functions, otherwise return None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class InotifyWatcher(Watcher):
+    """Records changes reported by Linux inotify. Each folder needs its own watch, so
+    new folders are watched as soon as they are created."""
+
+    def __init__(self, journals, libc=None):
+        super().__init__(journals)
+        self.__libc__ = libc or _load_libc()
+        self.__fd__ = self.__libc__.inotify_init1(IN_CLOEXEC)
+        if self.__fd__ < 0:
+            raise OSError(ctypes.get_errno(), "Could not start inotify")
+        self.__watches__ = {}
+        self.__roots__ = set()
+
+    @staticmethod
+    def is_supported():
+        """Check if inotify can be used on this system."""
+        return _load_libc() is not None
+
+    def close(self):
+        super().close()
+        if self.__fd__ >= 0:
+            os.close(self.__fd__)
+            self.__fd__ = -1
+
+    def watch_folder(self, folder):
+        self.__roots__.add(folder.rstrip(os.sep) or os.sep)
+        self._add_tree(folder.rstrip(os.sep) or os.sep)
+
+    def _add_tree(self, top):
+        """Add watches to a folder and every folder below it, without following links."""
+        stack = [top]
+        while stack:
+            folder = stack.pop()
+            wd = self.__libc__.inotify_add_watch(self.__fd__, os.fsencode(folder), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    LOG.error("Out of inotify watches, increase fs.inotify.max_user_watches")
+                    self.overflow(folder)
+                    return
+                # folder deleted or can't be read, so can't be backed up either
+                continue
+            # a moved folder keeps its watch, so update the path it is watched as
+            self.__watches__[wd] = folder
+            try:
+                with os.scandir(folder) as it:
+                    stack.extend(e.path for e in it if e.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+
+    def check(self, timeout=None):
+        timeout = self.interval if timeout is None else timeout
+        ready, _, _ = select.select([self.__fd__], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.__fd__, EVENT_BUFFER_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            raise
+        changed = []
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            end = offset + length
+            name = os.fsdecode(data[offset:end].rstrip(b"\0"))
+            offset = end
+            self._handle_event(wd, mask, name, changed)
+        self.record(changed)
+
+    def _handle_event(self, wd, mask, name, changed):
+        """Add the paths changed by an inotify event."""
+        if mask & IN_Q_OVERFLOW:
+            LOG.warning("Too many changes to keep up with")
+            self.overflow()
+            return
+        folder = self.__watches__.get(wd)
+        if folder is None:
+            return
+        if mask & IN_IGNORED:
+            del self.__watches__[wd]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # changes to other folders are reported by their parent folder
+            if folder in self.__roots__:
+                self.overflow(folder)
+            return
+        if not name:
+            return
+        fullname = os.path.join(folder, name)
+        if not mask & IN_ISDIR:
+            changed.append(fullname)
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            # files may have been added before the new folder was watched, so
+            # the whole folder is recorded as changed
+            self._add_tree(fullname)
+            changed.append(fullname)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            changed.append(fullname)
+
+
+class PollingWatcher(Watcher):
+    """Records changes by comparing the stat details of every file in the source
+    folders at regular intervals, for systems without inotify."""
+
+    def __init__(self, journals, interval=DEFAULT_WATCH_INTERVAL):
+        super().__init__(journals)
+        self.interval = interval
+        self.__snapshots__ = {}
+
+    def watch_folder(self, folder):
+        self.__snapshots__[folder] = self._snapshot(folder)
+
+    def check(self, timeout=None):
+        time.sleep(self.interval if timeout is None else timeout)
+        for folder, old in self.__snapshots__.items():
+            new = self._snapshot(folder)
+            changed = [p for p, key in new.items() if old.get(p) != key]
+            changed.extend(p for p in old if p not in new)
+            self.__snapshots__[folder] = new
+            self.record(changed)
+
+    @staticmethod
+    def _snapshot(top):
+        """Get the stat details of every file and folder below a folder."""
+        snapshot = {}
+        stack = [top]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    # folder contents are checked separately
+                    snapshot[entry.path] = "dir"
+                    stack.append(entry.path)
+                else:
+                    snapshot[entry.path] = stat_key(st)
+        return snapshot
+
+
+def watch(sources, interval=DEFAULT_WATCH_INTERVAL):
+    """
+    Record changes under the source folders until interrupted, so the next backup only
+    needs to read the changed files.
+    :param sources: List of source folders.
+    :param interval: Seconds between checks if inotify can't be used.
+    """
+    journals = [Journal(source) for source in dict.fromkeys(sources)]
+    if InotifyWatcher.is_supported():
+        watcher = InotifyWatcher(journals)
+    else:
+        LOG.info("inotify not available, checking for changes every %d seconds", interval)
+        watcher = PollingWatcher(journals, interval)
+    try:
+        if not watcher.start():
+            LOG.error("No folders to watch")
+            return
+        while True:
+            watcher.check()
+            watcher.heartbeat()
+    except KeyboardInterrupt:
+        LOG.info("Stopped watching")
+    finally:
+        watcher.close()
@@ -1,12 +1,28 @@
 """Tests for backup function."""
 
 import os
+import tarfile
 import unittest
 from datetime import datetime
 
-from backpy.backpy import add_skip
-from backpy.backup import Backup
-from backpy.helpers import CONFIG_FILE, delete_temp_files, is_windows
+from backpy.backpy import add_skip, set_compression, set_delta_depth, set_storage
+from backpy.backup import (
+    Backup,
+    all_backups,
+    backup_codec,
+    index_path,
+    read_backup,
+    signature_path,
+)
+from backpy.file_index import FileIndex
+from backpy.helpers import (
+    CONFIG_FILE,
+    INDEX_COMPRESSION_KEY,
+    JOBS_KEY,
+    delete_temp_files,
+    is_windows,
+    update_config_file,
+)
 from .common import BackpyTest
 
 
@@ -181,6 +197,173 @@ class BackupTest(BackpyTest):
         self.assertEqual(zips_before, 1)
         self.assertEqual(zips_before, zips_after)
 
+    # 11. do 1, check an index copy is kept next to each backup
+    def test_backup_index_copy(self):
+        self.do_backup()
+        self.do_backup()
+
+        indexes_in_one = self.count_files(os.path.join(self.one_folder, "*.index"))
+        self.assertEqual(indexes_in_one, 1)
+        backup_path = os.path.join(self.one_folder, all_backups(self.one_folder)[0])
+        self.assertTrue(os.path.exists(index_path(backup_path)))
+
+    # 12. do 1, check the index copy and the index in the tarfile are read the same
+    def test_read_backup_index_copy(self):
+        update_config_file(CONFIG_FILE, INDEX_COMPRESSION_KEY, "gz")
+        self.do_backup()
+        backup_path = os.path.join(self.one_folder, all_backups(self.one_folder)[0])
+
+        from_copy = read_backup(backup_path).get_index()
+        os.remove(index_path(backup_path))
+        from_tar = read_backup(backup_path).get_index()
+
+        self.assertTrue(from_copy.files())
+        self.assertEqual(from_tar.files(), from_copy.files())
+        self.assertEqual(from_tar.dirs(), from_copy.dirs())
+        for fname in from_tar.files():
+            self.assertEqual(from_tar.file_hash(fname), from_copy.file_hash(fname))
+
+    # 13. do 1 with a different codec for each folder, then back up again with another
+    def test_backup_compression(self):
+        set_compression(CONFIG_FILE, "xz:1")
+        set_compression(CONFIG_FILE, "none", self.six_seven_folder)
+        self.do_backup()
+        set_compression(CONFIG_FILE, "bz2:9")
+        self.change_one_four_five("some more text")
+        self.do_backup()
+
+        self.assertEqual(1, self.count_files(os.path.join(self.one_folder, "*.tar.xz")))
+        self.assertEqual(1, self.count_files(os.path.join(self.one_folder, "*.tar.bz2")))
+        self.assertEqual(1, self.count_files(os.path.join(self.six_seven_folder, "*.tar")))
+        self.assertEqual(
+            ["bz2", "xz"], [backup_codec(name) for name in all_backups(self.one_folder)]
+        )
+        for name in all_backups(self.one_folder):
+            backup = read_backup(os.path.join(self.one_folder, name))
+            self.assertEqual(name, os.path.basename(backup.get_tarpath()))
+            self.assertTrue(backup.get_index().files())
+            self.assertTrue(backup.has_member(os.path.join(self.src_root, "one", "four", "five")))
+
+    # 14. do 1 with more than one job, so gzip archives are compressed in parallel
+    def test_backup_parallel_gzip(self):
+        update_config_file(CONFIG_FILE, JOBS_KEY, "2")
+        self.do_backup()
+
+        backup_path = os.path.join(self.one_folder, all_backups(self.one_folder)[0])
+        backup = read_backup(backup_path)
+        self.assertTrue(backup.get_index().files())
+        self.assertTrue(backup.has_member(os.path.join(self.src_root, "one", "four", "five")))
+
+    # 15. do 1 into an object store, check the tarfiles only hold the index and config
+    def test_backup_object_store(self):
+        set_storage(CONFIG_FILE, "store")
+        self.do_backup()
+
+        backup_path = os.path.join(self.one_folder, all_backups(self.one_folder)[0])
+        with tarfile.open(backup_path) as tar:
+            self.assertCountEqual([".index", ".backpy"], tar.getnames())
+        backup = read_backup(backup_path)
+        five = os.path.join(self.src_root, "one", "four", "five")
+        self.assertTrue(backup.get_index().object_key(five))
+        self.assertEqual(os.path.join(self.one_folder, ".objects"), backup.get_store_path())
+        self.assertTrue(backup.has_member(five))
+
+    # 16. back up two folders into one shared object store, check copies are stored once
+    def test_backup_shared_object_store(self):
+        shared = os.path.join(self.dest_root, "objects")
+        set_storage(CONFIG_FILE, "store:" + shared)
+        # the same file in both folders
+        with open(os.path.join(self.src_root, "one", "four", "five"), "rb") as f:
+            self.create_file(os.path.join(self.src_root, "six seven", "five"), f.read().decode())
+        self.do_backup()
+
+        one = read_backup(os.path.join(self.one_folder, all_backups(self.one_folder)[0]))
+        six_seven_path = all_backups(self.six_seven_folder)[0]
+        six_seven = read_backup(os.path.join(self.six_seven_folder, six_seven_path))
+        self.assertEqual(shared, one.get_store_path())
+        self.assertEqual(shared, six_seven.get_store_path())
+        self.assertEqual(
+            one.get_index().object_key(os.path.join(self.src_root, "one", "four", "five")),
+            six_seven.get_index().object_key(os.path.join(self.src_root, "six seven", "five")),
+        )
+
+    # 17. back up a large file and edit it between backups, check edits are added as deltas
+    # up to the delta depth, then the file is added in full again
+    def test_backup_deltas(self):
+        set_delta_depth(CONFIG_FILE, "2")
+        big = os.path.join(self.src_root, "one", "big")
+        member_name = Backup.get_member_name(big)[1]
+        with open(big, "wb") as f:
+            f.write(os.urandom(3 * 1024 * 1024))
+        sizes = []
+        bases = []
+        for i in range(4):
+            if i:
+                with open(big, "r+b") as f:
+                    f.seek(i * 500000)
+                    f.write(b"edit %d" % i)
+            self.do_backup()
+            backup_path = os.path.join(self.one_folder, all_backups(self.one_folder)[0])
+            with tarfile.open(backup_path) as tar:
+                sizes.append(tar.getmember(member_name).size)
+            bases.append(read_backup(backup_path).get_index().delta_base(big))
+            self.assertTrue(os.path.exists(signature_path(backup_path)))
+
+        names = all_backups(self.one_folder, reverse_order=False)
+        self.assertEqual([None, names[0], names[1], None], bases)
+        self.assertEqual(3 * 1024 * 1024, sizes[0])
+        self.assertLess(max(sizes[1:3]), 512 * 1024)
+        self.assertEqual(3 * 1024 * 1024, sizes[3])
+
+    # 18. back up a large file that is rewritten between backups, check it's added in full
+    def test_backup_delta_too_big(self):
+        set_delta_depth(CONFIG_FILE, "2")
+        big = os.path.join(self.src_root, "one", "big")
+        for _ in range(2):
+            with open(big, "wb") as f:
+                f.write(os.urandom(2 * 1024 * 1024))
+            self.do_backup()
+
+        backup_path = os.path.join(self.one_folder, all_backups(self.one_folder)[0])
+        self.assertIsNone(read_backup(backup_path).get_index().delta_base(big))
+        # small files never get signatures
+        six_seven_path = all_backups(self.six_seven_folder)[0]
+        self.assertFalse(
+            os.path.exists(signature_path(os.path.join(self.six_seven_folder, six_seven_path)))
+        )
+
+    # 19. index a folder in chunks mode, delete a file before writing the backup, check the
+    # other files are still backed up
+    def test_backup_chunks_file_deleted(self):
+        index = FileIndex(os.path.join(self.src_root, "one"))
+        index.gen_index()
+        self.delete_one_four_five()
+        store = os.path.join(self.one_folder, ".objects")
+        Backup(self.one_folder, index, store=store, chunking=True).write_to_disk()
+
+        backups = all_backups(self.one_folder)
+        self.assertEqual(1, len(backups))
+        backup_index = read_backup(os.path.join(self.one_folder, backups[0])).get_index()
+        self.assertIsNone(backup_index.object_key(self.get_one_four_five_path()))
+        nine_ten = os.path.join(self.src_root, "one", "nine ten")
+        self.assertTrue(backup_index.object_key(nine_ten))
+
+    # 20. put other tarfiles in the backup folder, do 1 twice, check they are not read
+    def test_backup_other_tarfiles(self):
+        for name in ("foo.tar", "old_backup.tar.gz"):
+            with tarfile.open(os.path.join(self.one_folder, name), "w"):
+                pass
+        self.do_backup()
+        self.change_one_four_five("some more text")
+        self.do_backup()
+
+        backups = all_backups(self.one_folder)
+        self.assertEqual(2, len(backups))
+        self.assertNotIn("foo.tar", backups)
+        self.assertIsNone(backup_codec("foo.tar"))
+        self.assertIsNone(backup_codec(os.path.join(self.one_folder, "old_backup.tar.gz")))
+        self.assertEqual("gz", backup_codec(os.path.join(self.one_folder, backups[0])))
+
     def test_get_timestamp(self):
         """Test timestamp method"""
         expected = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -0,0 +1,103 @@
+"""Tests for the backup catalog."""
+
+import os
+import sqlite3
+from contextlib import closing
+from unittest import mock
+
+from backpy.backpy import scan_backups, search_backup
+from backpy.backup import all_backups, open_catalog, rebuild_catalog
+from backpy.catalog import CATALOG_NAME, Catalog
+from backpy.helpers import delete_temp_files
+from .common import BackpyTest
+
+
+class CatalogTest(BackpyTest):
+    def setUp(self):
+        super(CatalogTest, self).setUp()
+        delete_temp_files(self.dest_root)
+        self.add_one_folder()
+        self.one_folder = os.path.join(self.dest_root, "one")
+
+    def make_history(self):
+        """Back up several changes to the one folder."""
+        self.do_backup()
+        self.change_one_four_five("some more text")
+        self.do_backup()
+        self.delete_one_nine_ten()
+        self.create_folder(os.path.join(self.src_root, "one", "twelve"))
+        self.create_file(os.path.join(self.src_root, "one", "twelve", "eleven"), "new file\n")
+        self.do_backup()
+        self.change_one_four_five("yet more text")
+        self.delete_files(os.path.join(self.src_root, "one", "twelve"))
+        self.do_backup()
+
+    def search(self, search, filename, exact_match):
+        files = []
+        folders = []
+        search(self.one_folder, filename, files, folders, exact_match)
+        return [b.get_tarpath() for b in files], [b.get_tarpath() for b in folders]
+
+    def test_search_matches_scan(self):
+        self.make_history()
+        names = [
+            self.get_one_four_five_path(),
+            "five",
+            os.path.join(self.src_root, "one", "nine ten"),
+            "nine ten",
+            os.path.join(self.src_root, "one", "twelve"),
+            "twelve",
+            "four",
+            "eleven",
+            "missing",
+        ]
+
+        for name in names:
+            for exact_match in (True, False):
+                self.assertEqual(
+                    self.search(scan_backups, name, exact_match),
+                    self.search(search_backup, name, exact_match),
+                    "%s exact=%s" % (name, exact_match),
+                )
+
+    def test_catalog_updated_after_each_backup(self):
+        with mock.patch("backpy.backup.rebuild_catalog") as rebuild:
+            self.make_history()
+        rebuild.assert_not_called()
+
+        with closing(Catalog(self.one_folder)) as catalog:
+            self.assertEqual(all_backups(self.one_folder, reverse_order=False), catalog.backups())
+            found = [catalog.find(self.get_one_four_five_path()), catalog.find("twelve", False)]
+        rebuild_catalog(self.one_folder)
+        with closing(Catalog(self.one_folder)) as catalog:
+            self.assertEqual(
+                found, [catalog.find(self.get_one_four_five_path()), catalog.find("twelve", False)]
+            )
+        self.assertEqual(3, len(found[0][0]))
+
+    def test_catalog_rebuilt_when_backup_deleted(self):
+        self.make_history()
+        os.remove(os.path.join(self.one_folder, all_backups(self.one_folder)[-1]))
+
+        with closing(open_catalog(self.one_folder)) as catalog:
+            self.assertEqual(all_backups(self.one_folder, reverse_order=False), catalog.backups())
+
+    def test_catalog_rebuilt_when_out_of_date(self):
+        self.do_backup()
+        with closing(sqlite3.connect(os.path.join(self.one_folder, CATALOG_NAME))) as db:
+            db.execute("PRAGMA user_version = 0")
+            db.execute("DROP TABLE versions")
+
+        with closing(open_catalog(self.one_folder)) as catalog:
+            self.assertEqual(all_backups(self.one_folder), catalog.backups())
+            self.assertEqual(1, len(catalog.find(self.get_one_four_five_path())[0]))
+
+    def test_partial_match_in_several_folders(self):
+        self.create_file(os.path.join(self.src_root, "one", "five"), "another five\n")
+        self.do_backup()
+
+        with closing(open_catalog(self.one_folder)) as catalog:
+            self.assertIsNone(catalog.find("five", False))
+        self.assertEqual(
+            self.search(scan_backups, "five", False), self.search(search_backup, "five", False)
+        )
@@ -0,0 +1,60 @@
+"""Tests for chunker module."""
+
+import io
+import os
+import random
+import unittest
+
+from backpy.chunker import Chunker
+
+
+class ChunkerTest(unittest.TestCase):
+    def setUp(self):
+        self.data = random.Random(0).randbytes(200000)
+        self.chunker = Chunker(min_size=1000, bits=8, max_size=20000)
+
+    def chunks(self, data):
+        return list(self.chunker.chunks(io.BytesIO(data)))
+
+    def test_chunks_join_to_file(self):
+        chunks = self.chunks(self.data)
+
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(self.data, b"".join(chunks))
+
+    def test_chunk_sizes(self):
+        chunks = self.chunks(self.data)
+
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), 1000)
+            self.assertLessEqual(len(chunk), 20000)
+        # no boundaries at all, so chunks are cut at the maximum size
+        zeros = self.chunks(bytes(50000))
+        self.assertEqual([20000, 20000, 10000], [len(chunk) for chunk in zeros])
+
+    def test_edit_only_changes_nearby_chunks(self):
+        chunks = self.chunks(self.data)
+        edited = self.data[:100000] + b"inserted" + self.data[100000:]
+
+        new_chunks = [chunk for chunk in self.chunks(edited) if chunk not in chunks]
+
+        self.assertLessEqual(len(new_chunks), 2)
+        self.assertEqual(edited, b"".join(self.chunks(edited)))
+
+    def test_short_reads(self):
+        class ShortReads(io.BytesIO):
+            def read(self, size=-1):
+                return super(ShortReads, self).read(3000)
+
+        chunks = list(self.chunker.chunks(ShortReads(self.data)))
+
+        self.assertEqual(self.chunks(self.data), chunks)
+
+    def test_empty_file(self):
+        self.assertEqual([], self.chunks(b""))
+        self.assertEqual([b"small"], self.chunks(b"small"))
+
+    def test_default_sizes(self):
+        data = os.urandom(1024 * 1024)
+
+        self.assertEqual(data, b"".join(Chunker().chunks(io.BytesIO(data))))
@@ -69,6 +69,16 @@ class BackpyTest(unittest.TestCase):
         cls.timestamp += 1
         return cls.timestamp
 
+    @classmethod
+    def copy_resources(cls):
+        # blank resource dir
+        res_dir = os.path.join(TEMP_DIR, "resources")
+        if os.path.exists(res_dir):
+            delete_temp_files(res_dir)
+
+        # copy resources
+        copytree(os.path.join(cls.project_dir, "resources"), res_dir)
+
     def setUp(self):
         LOG.debug("starting test %s", unittest.TestCase.id(self))
         # start test with blank config
@@ -78,13 +88,7 @@ class BackpyTest(unittest.TestCase):
         with mock.patch("backpy.backpy.version", return_value=self.get_backpy_version()):
             init(CONFIG_FILE)
 
-        # and blank resource dir
-        res_dir = os.path.join(TEMP_DIR, "resources")
-        if os.path.exists(res_dir):
-            delete_temp_files(res_dir)
-
-        # copy resources
-        copytree(os.path.join(self.project_dir, "resources"), res_dir)
+        self.copy_resources()
 
     # source dir - rel_path is just to test users adding relative path to
     # config file. should mostly use abs path (the files that were copied
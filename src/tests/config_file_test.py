@@ -9,8 +9,19 @@ from backpy.backpy import (
     delete_directory_by_index,
     delete_global_skip,
     read_directory_list,
+    set_compression,
+    set_delta_depth,
+    set_storage,
+)
+from backpy.helpers import (
+    CONFIG_FILE,
+    COMPRESSION_KEY,
+    get_config_compression,
+    get_config_delta_depth,
+    get_config_key,
+    get_config_storage,
+    SKIP_KEY,
 )
-from backpy.helpers import CONFIG_FILE, get_config_key, SKIP_KEY
 from . import common
 
 
@@ -169,3 +180,45 @@ class ConfigTest(common.BackpyTest):
         actual_skips = get_config_key(CONFIG_FILE, SKIP_KEY)
 
         self.assertCountEqual(expected_skips, actual_skips)
+
+    def test_set_compression(self):
+        dest = os.path.join(self.dest_root, "one")
+        set_compression(CONFIG_FILE, "xz:9")
+        set_compression(CONFIG_FILE, "bz2", dest)
+        # replaces the earlier settings rather than adding to them
+        set_compression(CONFIG_FILE, "none")
+        set_compression(CONFIG_FILE, "gz:1", dest)
+
+        self.assertCountEqual(
+            ["none", "{0},gz:1".format(dest)], get_config_key(CONFIG_FILE, COMPRESSION_KEY)
+        )
+        self.assertEqual(("gz", 1), get_config_compression(CONFIG_FILE, dest))
+        self.assertEqual(("none", None), get_config_compression(CONFIG_FILE, self.dest_root))
+
+    def test_set_compression_unknown(self):
+        set_compression(CONFIG_FILE, "zip")
+
+        self.assertEqual([], get_config_key(CONFIG_FILE, COMPRESSION_KEY))
+
+    def test_set_storage(self):
+        dest = os.path.join(self.dest_root, "one")
+        shared = os.path.join(self.dest_root, "objects")
+        set_storage(CONFIG_FILE, "store")
+        set_storage(CONFIG_FILE, "store:" + shared, dest)
+
+        self.assertEqual(("store", shared), get_config_storage(CONFIG_FILE, dest))
+        self.assertEqual(("store", None), get_config_storage(CONFIG_FILE, self.dest_root))
+
+    def test_set_storage_unknown(self):
+        set_storage(CONFIG_FILE, "tar:/somewhere")
+
+        self.assertEqual(("tar", None), get_config_storage(CONFIG_FILE, self.dest_root))
+
+    def test_set_delta_depth(self):
+        dest = os.path.join(self.dest_root, "one")
+        set_delta_depth(CONFIG_FILE, "3")
+        set_delta_depth(CONFIG_FILE, "10", dest)
+        set_delta_depth(CONFIG_FILE, "-1", dest)
+
+        self.assertEqual(10, get_config_delta_depth(CONFIG_FILE, dest))
+        self.assertEqual(3, get_config_delta_depth(CONFIG_FILE, self.dest_root))
@@ -0,0 +1,91 @@
+"""Tests for delta module."""
+
+import io
+import os
+import random
+import unittest
+
+from backpy.backup import TEMP_DIR
+from backpy.delta import (
+    apply_delta,
+    read_signatures,
+    signature,
+    write_delta,
+    write_signatures,
+)
+from backpy.helpers import delete_temp_files
+
+
+class DeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.data = random.Random(0).randbytes(1024 * 1024)
+
+    def delta(self, base, data):
+        out = io.BytesIO()
+        new_signature = write_delta(io.BytesIO(data), signature(io.BytesIO(base)), out)
+        return out.getvalue(), new_signature
+
+    def apply(self, base, delta):
+        out = io.BytesIO()
+        apply_delta(io.BytesIO(delta), io.BytesIO(base), out)
+        return out.getvalue()
+
+    def test_unchanged_file(self):
+        delta, new_signature = self.delta(self.data, self.data)
+
+        # one copy of the whole file
+        self.assertLess(len(delta), 100)
+        self.assertEqual(signature(io.BytesIO(self.data)), new_signature)
+        self.assertEqual(self.data, self.apply(self.data, delta))
+
+    def test_edits(self):
+        edited = bytearray(self.data)
+        edited[1000:1010] = b"edited 123"
+        edited[500000:500000] = b"inserted"
+        del edited[800000:800100]
+        edited = bytes(edited)
+
+        delta, _ = self.delta(self.data, edited)
+
+        self.assertLess(len(delta), 200 * 1024)
+        self.assertEqual(edited, self.apply(self.data, delta))
+
+    def test_different_file(self):
+        other = os.urandom(len(self.data))
+
+        delta, _ = self.delta(self.data, other)
+
+        self.assertGreater(len(delta), len(other))
+        self.assertEqual(other, self.apply(self.data, delta))
+
+    def test_empty_file(self):
+        delta, new_signature = self.delta(self.data, b"")
+
+        self.assertEqual(b"", new_signature)
+        self.assertEqual(b"", self.apply(self.data, delta))
+
+    def test_damaged_delta(self):
+        delta, _ = self.delta(self.data, self.data[1000:])
+
+        with self.assertRaises(ValueError):
+            self.apply(self.data, b"not a delta")
+        with self.assertRaises(ValueError):
+            self.apply(self.data, delta[:-5])
+        with self.assertRaises(ValueError):
+            # base is too short for the blocks copied from it
+            self.apply(self.data[:1000], delta)
+
+    def test_read_write_signatures(self):
+        path = os.path.join(TEMP_DIR, "test.sig")
+        if not os.path.exists(TEMP_DIR):
+            os.mkdir(TEMP_DIR)
+        signatures = {
+            "/a/b@c": ("abc123", 0, signature(io.BytesIO(self.data))),
+            "/d": ("def456", 2, b""),
+        }
+        try:
+            write_signatures(path, signatures)
+
+            self.assertEqual(signatures, read_signatures(path))
+        finally:
+            delete_temp_files(path)
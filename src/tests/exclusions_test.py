@@ -0,0 +1,94 @@
+"""Tests for exclusions module."""
+
+import fnmatch
+import os
+import unittest
+
+from backpy.exclusions import ExclusionRules, PrefixList
+
+
+class ExclusionRulesTest(unittest.TestCase):
+    rules = ["*.jpg", "*/cache/*", "/home/*/tmp", "*[0-9].log", "/data/one*", "*?seven*"]
+    paths = [
+        "/home/user/a.jpg",
+        "/home/user/a.JPG",
+        "/home/user/cache/x",
+        "/home/user/tmp",
+        "/home/user/tmp/x",
+        "/var/app9.log",
+        "/var/app.log",
+        "/data/one",
+        "/data/onetwo/three",
+        "/data/two",
+        "/six seven/eight",
+        "seven",
+    ]
+
+    def test_matches_same_as_fnmatchcase(self):
+        matcher = ExclusionRules(self.rules, ignore_case=False)
+        for path in self.paths:
+            expected = any(fnmatch.fnmatchcase(path, rule) for rule in self.rules)
+            self.assertEqual(expected, matcher.matches(path), path)
+
+    def test_matches_ignore_case(self):
+        matcher = ExclusionRules(self.rules, ignore_case=True)
+
+        self.assertTrue(matcher.matches("/home/user/a.JPG"))
+
+    def test_no_rules(self):
+        matcher = ExclusionRules(["", ""])
+
+        self.assertFalse(matcher)
+        self.assertFalse(matcher.matches("/home/user/a.jpg"))
+        self.assertFalse(matcher.prunes("/home/user"))
+
+    def test_prunes(self):
+        matcher = ExclusionRules(self.rules, ignore_case=False)
+
+        self.assertTrue(matcher.prunes("/data/one", "/"))
+        self.assertTrue(matcher.prunes("/data/onetwo", "/"))
+        self.assertTrue(matcher.prunes("/home/user/cache", "/"))
+        self.assertFalse(matcher.prunes("/home/user", "/"))
+        self.assertFalse(matcher.prunes("/data/two", "/"))
+
+    def test_pruned_folder_contents_all_match(self):
+        matcher = ExclusionRules(self.rules, ignore_case=False)
+        folders = sorted({os.path.dirname(path) for path in self.paths})
+        for folder in folders:
+            if matcher.prunes(folder, "/"):
+                for path in self.paths:
+                    if path.startswith(folder + "/"):
+                        self.assertTrue(matcher.matches(path), path)
+
+
+class PrefixListTest(unittest.TestCase):
+    prefixes = ["/sdcard/Android/", "/sdcard/DCIM/.thumbnails", "/sdcard/DCIM", "", "/sdcard/b"]
+
+    def test_matches_same_as_startswith(self):
+        prefix_list = PrefixList(self.prefixes)
+        paths = [
+            "/sdcard/Android",
+            "/sdcard/Android/data",
+            "/sdcard/DCIM",
+            "/sdcard/DCIM/.thumbnails/1.jpg",
+            "/sdcard/DCIMx",
+            "/sdcard/a",
+            "/sdcard/b/c",
+            "/sdcard/Music/b",
+            "/",
+        ]
+        for path in paths:
+            # note empty lines are ignored
+            expected = any(path.startswith(p) for p in self.prefixes if p)
+            self.assertEqual(expected, prefix_list.matches(path), path)
+
+    def test_covered_prefixes_removed(self):
+        prefix_list = PrefixList(self.prefixes)
+
+        self.assertEqual(3, len(prefix_list))
+
+    def test_from_file_not_found(self):
+        prefix_list = PrefixList.from_file("not a file")
+
+        self.assertFalse(prefix_list)
+        self.assertFalse(prefix_list.matches("/sdcard"))
@@ -0,0 +1,121 @@
+"""Tests for file_table module."""
+
+import unittest
+from hashlib import md5
+
+from backpy.file_table import FileTable, PathSet
+
+
+class FileTableTest(unittest.TestCase):
+    def setUp(self):
+        self.items = [
+            ("/data/one/four/five", md5(b"five").hexdigest()),
+            ("/data/one/nine ten", md5(b"nine ten").hexdigest()),
+            ("/data/three", md5(b"three").hexdigest()),
+            ("/data/one/eleven", md5(b"eleven").hexdigest()),
+        ]
+        self.table = FileTable(self.items)
+
+    def test_items_in_order_added(self):
+        self.assertEqual(self.items, list(self.table.items()))
+        self.assertEqual([p for p, _ in self.items], list(self.table))
+        self.assertEqual(4, len(self.table))
+
+    def test_get(self):
+        for path, digest in self.items:
+            self.assertIn(path, self.table)
+            self.assertEqual(digest, self.table[path])
+            self.assertEqual(digest, self.table.get(path))
+        self.assertNotIn("/data/one", self.table)
+        self.assertIsNone(self.table.get("/data/one/four"))
+        self.assertEqual("x", self.table.get("/data/missing", "x"))
+        with self.assertRaises(KeyError):
+            _ = self.table["/data/missing"]
+
+    def test_replace_keeps_order(self):
+        self.table["/data/one/nine ten"] = md5(b"changed").hexdigest()
+
+        self.assertEqual([p for p, _ in self.items], list(self.table))
+        self.assertEqual(md5(b"changed").hexdigest(), self.table["/data/one/nine ten"])
+
+    def test_digests_that_cannot_be_packed(self):
+        digests = ["not hex", "ABCDEF", "0123456789abcdef0123456789abcd", "", "c0ffee"]
+        for i, digest in enumerate(digests):
+            self.table["/data/other%d" % i] = digest
+
+        for i, digest in enumerate(digests):
+            self.assertEqual(digest, self.table["/data/other%d" % i])
+        for path, digest in self.items:
+            self.assertEqual(digest, self.table[path])
+
+    def test_first_digest_unpacked(self):
+        table = FileTable([("a", "not hex"), ("b", "c0ffee"), ("c", "0ff1ce")])
+
+        self.assertEqual([("a", "not hex"), ("b", "c0ffee"), ("c", "0ff1ce")], list(table.items()))
+
+    def test_many_files(self):
+        items = [
+            ("/data/d%d/f%d" % (i % 7, i), md5(str(i).encode()).hexdigest()) for i in range(500)
+        ]
+        table = FileTable(items)
+
+        self.assertEqual(items, list(table.items()))
+        for path, digest in items:
+            self.assertEqual(digest, table[path])
+
+    def test_names_not_in_folder(self):
+        table = FileTable([("five", "00"), ("/five", "01"), ("/data/five", "02")])
+
+        self.assertEqual(["five", "/five", "/data/five"], list(table))
+        self.assertEqual("01", table["/five"])
+        self.assertNotIn("/data/one/five", table)
+
+    def test_empty(self):
+        table = FileTable()
+
+        self.assertFalse(table)
+        self.assertEqual([], list(table))
+
+    def test_sections_round_trip(self):
+        self.table["/data/other"] = "not hex"
+        self.table["/data/\udcff"] = md5(b"bad name").hexdigest()
+
+        table = FileTable.from_sections(dict(self.table.sections()))
+
+        self.assertEqual(list(self.table.items()), list(table.items()))
+        self.assertEqual("not hex", table["/data/other"])
+        table["/data/new"] = md5(b"new").hexdigest()
+        self.assertEqual(md5(b"new").hexdigest(), table["/data/new"])
+        self.assertEqual(md5(b"five").hexdigest(), table["/data/one/four/five"])
+
+    def test_empty_sections_round_trip(self):
+        table = FileTable.from_sections(dict(FileTable().sections()))
+
+        self.assertFalse(table)
+        table["/data/five"] = "c0ffee"
+        self.assertEqual("c0ffee", table["/data/five"])
+
+    def test_sections_do_not_match(self):
+        sections = dict(self.table.sections())
+        sections[b"FTNE"] = sections[b"FTNE"][:-8]
+
+        with self.assertRaises(ValueError):
+            FileTable.from_sections(sections)
+
+
+class PathSetTest(unittest.TestCase):
+    def test_add(self):
+        paths = PathSet(["/data", "/data/one"])
+        paths.add("/data/one/four")
+        paths.update(["/data/one", "/data/six seven"])
+
+        self.assertEqual(4, len(paths))
+        self.assertEqual(["/data", "/data/one", "/data/one/four", "/data/six seven"], list(paths))
+        self.assertIn("/data/one/four", paths)
+        self.assertNotIn("/data/one/nine ten", paths)
+
+    def test_empty(self):
+        paths = PathSet()
+
+        self.assertFalse(paths)
+        self.assertNotIn("/data", paths)
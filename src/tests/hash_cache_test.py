@@ -0,0 +1,88 @@
+"""Tests for hash_cache module."""
+
+import os
+import time
+from unittest import mock
+
+from backpy.backup import TEMP_DIR
+from backpy.file_index import FileIndex
+from backpy.hash_cache import HashCache
+from backpy.helpers import get_file_hash
+from .common import BackpyTest
+
+
+class HashCacheTest(BackpyTest):
+    def setUp(self):
+        super(HashCacheTest, self).setUp()
+        self.cache_path = os.path.join(TEMP_DIR, "resources", "hash_cache")
+        # cache ignores recently modified files, so make the source files look old
+        old_time = time.time() - 3600
+        for dirname, _, filenames in os.walk(self.src_root):
+            for filename in filenames:
+                os.utime(os.path.join(dirname, filename), (old_time, old_time))
+
+    def gen_index(self, rehash=False):
+        index = FileIndex(
+            self.src_root, hash_cache=HashCache(self.src_root, rehash, self.cache_path)
+        )
+        index.gen_index()
+        return index
+
+    def test_unchanged_files_not_hashed(self):
+        expected_index = self.gen_index()
+
+        with mock.patch("backpy.file_index.get_file_hash") as mock_hash:
+            actual_index = self.gen_index()
+
+        mock_hash.assert_not_called()
+        self.assertEqual(expected_index.files(), actual_index.files())
+        for f in expected_index.files():
+            self.assertEqual(expected_index.file_hash(f), actual_index.file_hash(f))
+
+    def test_changed_file_hashed(self):
+        self.gen_index()
+        self.change_one_four_five("some more text")
+
+        index = self.gen_index()
+
+        expected_hash = get_file_hash(self.get_one_four_five_path())
+        self.assertEqual(expected_hash, index.file_hash(self.get_one_four_five_path()))
+
+    def test_rehash_ignores_cache(self):
+        self.gen_index()
+
+        with mock.patch("backpy.file_index.get_file_hash", return_value="abc") as mock_hash:
+            index = self.gen_index(rehash=True)
+
+        self.assertEqual(len(self.list_files()), mock_hash.call_count)
+        self.assertEqual("abc", index.file_hash(self.get_one_four_five_path()))
+
+    def test_recently_modified_file_not_cached(self):
+        self.change_one_four_five("some more text")
+        self.gen_index()
+
+        with mock.patch("backpy.file_index.get_file_hash") as mock_hash:
+            self.gen_index()
+
+        mock_hash.assert_called_once()
+        self.assertEqual(self.get_one_four_five_path(), mock_hash.call_args[0][0])
+
+    def test_cache_ignored_for_other_algorithm(self):
+        self.gen_index()
+
+        index = FileIndex(
+            self.src_root,
+            hash_cache=HashCache(self.src_root, path=self.cache_path),
+            algorithm="sha256",
+        )
+        index.gen_index()
+
+        expected_hash = get_file_hash(self.get_one_four_five_path(), algorithm="sha256")
+        self.assertEqual(expected_hash, index.file_hash(self.get_one_four_five_path()))
+
+    def list_files(self):
+        return [
+            os.path.join(dirname, filename)
+            for dirname, _, filenames in os.walk(self.src_root)
+            for filename in filenames
+        ]
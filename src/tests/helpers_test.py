@@ -1,19 +1,45 @@
 """Tests for helpers module."""
 
 import os
+import zlib
+from hashlib import blake2b, md5, sha256
 
 from backpy.backup import TEMP_DIR
 from backpy.helpers import (
+    COMPRESSION_KEY,
     CONFIG_FILE,
+    DEFAULT_COMPRESSION,
+    DEFAULT_MMAP_THRESHOLD,
+    DELTA_DEPTH_KEY,
+    HASH_BUFFER_SIZE,
+    HASH_KEY,
+    QUICK_BLOCK_SIZE,
+    HashStats,
+    _hash_mapped,
+    decode_path,
+    encode_path,
+    format_size,
+    get_config_compression,
+    get_config_delta_depth,
+    get_config_hash,
+    get_config_int,
     get_config_key,
+    get_config_storage,
     get_config_version,
     get_file_hash,
     get_filename_index,
     get_folder_index,
+    get_quick_hash,
     handle_arg_spaces,
+    iter_config_file,
     list_contains,
+    new_hash,
+    parse_compression,
+    parse_delta_depth,
+    parse_storage,
     read_config_file,
     SKIP_KEY,
+    STORAGE_KEY,
     string_contains,
     string_equals,
     string_startswith,
@@ -38,6 +64,13 @@ class HelpersTest(common.BackpyTest):
         if os.path.exists(cls.config_path):
             os.remove(cls.config_path)
 
+    def test_encode_path(self):
+        # name read from disk that is not valid utf-8
+        path = os.path.join("one", os.fsdecode(b"bad\xff"))
+
+        self.assertEqual(path, decode_path(encode_path(path)))
+        self.assertEqual(path, decode_path(bytearray(encode_path(path))))
+
     def test_string_equals(self):
         string_1 = "some text"
         string_2 = "some text"
@@ -166,6 +199,156 @@ class HelpersTest(common.BackpyTest):
 
         self.assertIsNone(get_file_hash(filename))
 
+    def test_get_file_hash_larger_than_buffer(self):
+        data = os.urandom(HASH_BUFFER_SIZE * 2 + 100)
+        with open(self.config_path, "wb") as f:
+            f.write(data)
+        expected_hash = md5(data).hexdigest()
+
+        actual_hash = get_file_hash(self.config_path)
+
+        self.assertEqual(expected_hash, actual_hash)
+
+    def test_get_file_hash_mmap(self):
+        data = os.urandom(HASH_BUFFER_SIZE + 100)
+        with open(self.config_path, "wb") as f:
+            f.write(data)
+        stats = HashStats()
+
+        for algorithm in ("md5", "crc32"):
+            expected_hash = get_file_hash(self.config_path, algorithm=algorithm)
+            actual_hash = get_file_hash(
+                self.config_path, algorithm=algorithm, mmap_threshold=1, stats=stats
+            )
+            self.assertEqual(expected_hash, actual_hash)
+        self.assertEqual(2 * len(data), stats.bytes)
+
+    def test_get_file_hash_mmap_size_changed(self):
+        data = os.urandom(HASH_BUFFER_SIZE + 100)
+        with open(self.config_path, "wb") as f:
+            f.write(data)
+        hasher = md5()
+
+        with open(self.config_path, "rb") as f:
+            # the file was a different size when it was opened
+            self.assertIsNone(_hash_mapped(f, hasher, len(data) + 10))
+            self.assertEqual(len(data), _hash_mapped(f, hasher, len(data)))
+        self.assertEqual(md5(data).hexdigest(), hasher.hexdigest())
+
+    def test_get_file_hash_mmap_off_by_default(self):
+        self.assertEqual(0, DEFAULT_MMAP_THRESHOLD)
+
+    def test_get_file_hash_stats(self):
+        filename = os.path.join(self.src_root, "three")
+        stats = HashStats()
+
+        get_file_hash(filename, stats=stats)
+        get_file_hash(filename, stats=stats)
+
+        self.assertEqual(2, stats.files)
+        self.assertEqual(2 * os.path.getsize(filename), stats.bytes)
+
+    def test_get_file_hash_algorithms(self):
+        filename = os.path.join(self.src_root, "three")
+        with open(filename, "rb") as f:
+            data = f.read()
+        expected_hashes = {
+            "md5": md5(data).hexdigest(),
+            "sha256": sha256(data).hexdigest(),
+            "blake2b": blake2b(data).hexdigest(),
+            "crc32": "%08x" % zlib.crc32(data),
+            "adler32": "%08x" % zlib.adler32(data),
+        }
+
+        actual_hashes = {
+            algorithm: get_file_hash(filename, algorithm=algorithm) for algorithm in expected_hashes
+        }
+
+        self.assertEqual(expected_hashes, actual_hashes)
+
+    def test_get_quick_hash(self):
+        size = QUICK_BLOCK_SIZE * 5
+        data = bytearray(os.urandom(size))
+        with open(self.config_path, "wb") as f:
+            f.write(data)
+        quick_hash = get_quick_hash(self.config_path, size)
+
+        # change a byte between the sampled blocks, quick hash should not change
+        data[QUICK_BLOCK_SIZE + 1] ^= 0xFF
+        with open(self.config_path, "wb") as f:
+            f.write(data)
+        self.assertEqual(quick_hash, get_quick_hash(self.config_path, size))
+
+        # change a byte in the middle block, quick hash should change
+        data[size // 2] ^= 0xFF
+        with open(self.config_path, "wb") as f:
+            f.write(data)
+        self.assertNotEqual(quick_hash, get_quick_hash(self.config_path, size))
+
+    def test_new_hash_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            new_hash("rot13")
+
+    def test_get_config_hash(self):
+        update_config_file(CONFIG_FILE, HASH_KEY, "blake2b")
+
+        self.assertEqual("blake2b", get_config_hash(CONFIG_FILE))
+
+    def test_get_config_hash_unknown(self):
+        update_config_file(CONFIG_FILE, HASH_KEY, "rot13")
+
+        self.assertEqual("md5", get_config_hash(CONFIG_FILE))
+
+    def test_parse_compression(self):
+        self.assertEqual(("gz", None), parse_compression("gz"))
+        self.assertEqual(("gz", 6), parse_compression("gz:6"))
+        self.assertEqual(("xz", 0), parse_compression("LZMA:0"))
+        self.assertEqual(("none", None), parse_compression("none"))
+        self.assertIsNone(parse_compression("gz:0"))
+        self.assertIsNone(parse_compression("bz2:fast"))
+        self.assertIsNone(parse_compression("none:1"))
+        self.assertIsNone(parse_compression("zip"))
+
+    def test_get_config_compression(self):
+        update_config_file(CONFIG_FILE, COMPRESSION_KEY, ["/backups/one,xz:9", "bz2", "zip"])
+
+        self.assertEqual(("xz", 9), get_config_compression(CONFIG_FILE, "/backups/one/"))
+        self.assertEqual(("bz2", None), get_config_compression(CONFIG_FILE, "/backups/two"))
+
+    def test_get_config_compression_default(self):
+        self.assertEqual(DEFAULT_COMPRESSION, get_config_compression(CONFIG_FILE, "/backups"))
+
+    def test_parse_storage(self):
+        self.assertEqual(("tar", None), parse_storage("tar"))
+        self.assertEqual(("store", None), parse_storage("Store"))
+        self.assertEqual(("store", "/backups/objects"), parse_storage("store:/backups/objects"))
+        self.assertEqual(("chunks", "/backups/objects"), parse_storage("chunks:/backups/objects"))
+        self.assertIsNone(parse_storage("tar:/backups"))
+        self.assertIsNone(parse_storage("zip"))
+
+    def test_get_config_storage(self):
+        update_config_file(CONFIG_FILE, STORAGE_KEY, ["/backups/one,store", "tar"])
+
+        self.assertEqual(("store", None), get_config_storage(CONFIG_FILE, "/backups/one"))
+        self.assertEqual(("tar", None), get_config_storage(CONFIG_FILE, "/backups/two"))
+
+    def test_parse_delta_depth(self):
+        self.assertEqual(0, parse_delta_depth("0"))
+        self.assertEqual(10, parse_delta_depth(" 10"))
+        self.assertIsNone(parse_delta_depth("-1"))
+        self.assertIsNone(parse_delta_depth("deep"))
+
+    def test_get_config_delta_depth(self):
+        self.assertEqual(0, get_config_delta_depth(CONFIG_FILE, "/backups/one"))
+        update_config_file(CONFIG_FILE, DELTA_DEPTH_KEY, ["/backups/one,5", "2"])
+
+        self.assertEqual(5, get_config_delta_depth(CONFIG_FILE, "/backups/one"))
+        self.assertEqual(2, get_config_delta_depth(CONFIG_FILE, "/backups/two"))
+
+    def test_format_size(self):
+        self.assertEqual("512.0 B", format_size(512))
+        self.assertEqual("1.5 MB", format_size(1.5 * 1024 * 1024))
+
     def test_get_config_version(self):
         expected_version = self.get_backpy_version()
 
@@ -207,6 +390,16 @@ class HelpersTest(common.BackpyTest):
 
         self.assertCountEqual(expected_value, actual_value)
 
+    def test_get_config_int(self):
+        update_config_file(CONFIG_FILE, "number", "4")
+
+        self.assertEqual(4, get_config_int(CONFIG_FILE, "number"))
+
+    def test_get_config_int_not_a_number(self):
+        update_config_file(CONFIG_FILE, "number", "four")
+
+        self.assertEqual(1, get_config_int(CONFIG_FILE, "number", 1))
+
     def test_read_config_file(self):
         expected_values = self.test_config_dict
         with open(self.config_path, "w+") as f:
@@ -216,6 +409,28 @@ class HelpersTest(common.BackpyTest):
 
         self.assertCountEqual(expected_values, actual_values)
 
+    def test_iter_config_file(self):
+        expected_values = [
+            ("adb", "False", True),
+            ("rules", "a=b", True),
+            ("default", "/folder", False),
+            ("default", "# files", False),
+            ("default", "/folder/[x]", False),
+            ("quick", None, False),
+            ("quick", "/folder/[x]@@@1:2:ab", False),
+            ("quick", "[not a header", False),
+            ("a] [b", None, False),
+        ]
+        with open(self.config_path, "w+") as f:
+            f.write(
+                "[adb=False]\n[rules=a=b]\n/folder\n# files\n/folder/[x]\n[quick]\n"
+                "/folder/[x]@@@1:2:ab\n[not a header\n[a] [b]\n"
+            )
+
+        actual_values = list(iter_config_file(self.config_path))
+
+        self.assertEqual(expected_values, actual_values)
+
     def test_read_config_file_bad_path(self):
         expected_values = {"default": []}
 
@@ -1,12 +1,26 @@
 """Tests for file_index module."""
 
 import os
+import time
+import unittest
 from pathlib import Path
+from unittest import mock
 
 from backpy.backpy import add_global_skip
 from backpy.backup import TEMP_DIR
 from backpy.file_index import FileIndex
-from backpy.helpers import CONFIG_FILE, get_file_hash, is_osx, is_windows
+from backpy.helpers import (
+    CONFIG_FILE,
+    INDEX_FORMAT_KEY,
+    JOBS_KEY,
+    QUICK_MIN_SIZE,
+    WALKERS_KEY,
+    get_file_hash,
+    is_osx,
+    is_windows,
+    update_config_file,
+)
+from backpy.packed_index import is_packed
 from .common import BackpyTest
 
 
@@ -17,7 +31,8 @@ class IndexTest(BackpyTest):
     def setUpClass(cls):
         super(IndexTest, cls).setUpClass()
 
-        # create index
+        # create index from fresh resources, not ones changed by earlier tests
+        cls.copy_resources()
         cls.index = FileIndex(cls.src_root)
         cls.index.gen_index()
 
@@ -63,6 +78,72 @@ class IndexTest(BackpyTest):
 
         self.assertCountEqual(expected_files, actual_files)
 
+    def test_list_files_with_jobs(self):
+        # files should be added in the same order whatever the number of jobs
+        expected_files = self.index.files()
+        index = FileIndex(self.src_root, jobs=4)
+        index.gen_index()
+
+        actual_files = index.files()
+
+        self.assertEqual(expected_files, actual_files)
+        for f in expected_files:
+            self.assertEqual(self.index.file_hash(f), index.file_hash(f))
+
+    def test_jobs_from_config(self):
+        update_config_file(CONFIG_FILE, JOBS_KEY, "3")
+        index = FileIndex(self.src_root)
+
+        self.assertEqual(3, index.__jobs__)
+
+    @unittest.skipIf(is_windows(), "creating links needs admin rights")
+    def test_walk_matches_os_walk(self):
+        # symlinks to folders are listed but not followed, broken links are skipped
+        os.symlink(os.path.join(self.src_root, "one"), os.path.join(self.src_root, "link"))
+        os.symlink("missing", os.path.join(self.src_root, "one", "broken"))
+        expected_files = []
+        expected_dirs = []
+        for dirname, dirnames, filenames in os.walk(self.src_root):
+            expected_dirs.extend(os.path.join(dirname, d) for d in dirnames)
+            expected_files.extend(
+                os.path.join(dirname, f)
+                for f in filenames
+                if os.path.exists(os.path.join(dirname, f))
+            )
+        index = FileIndex(self.src_root)
+
+        actual_files = [f for f, st in index.walk()]
+
+        self.assertEqual(expected_files, actual_files)
+        self.assertCountEqual([self.src_root] + expected_dirs, index.dirs())
+
+    def test_parallel_walk_order(self):
+        expected = FileIndex(self.src_root, ["*/four/*", "*eight"], walkers=1)
+        expected_files = [f for f, st in expected.walk()]
+        for pending in [0, 1, 256]:
+            with mock.patch("backpy.file_index.PENDING_PER_WALKER", pending):
+                index = FileIndex(self.src_root, ["*/four/*", "*eight"], walkers=4)
+
+                actual_files = [f for f, st in index.walk()]
+
+                self.assertEqual(expected_files, actual_files)
+                self.assertEqual(expected.dirs(), index.dirs())
+
+    def test_parallel_walk_stopped_early(self):
+        index = FileIndex(self.src_root, walkers=4)
+        walk = index.walk()
+
+        next(walk)
+        walk.close()
+
+        self.assertTrue(index.dirs())
+
+    def test_walkers_from_config(self):
+        update_config_file(CONFIG_FILE, WALKERS_KEY, "4")
+        index = FileIndex(self.src_root)
+
+        self.assertEqual(4, index.__walkers__)
+
     def test_list_dirs(self):
         expected_dirs = self.list_all_dirs()
 
@@ -108,6 +189,20 @@ class IndexTest(BackpyTest):
     def test_is_valid_no_rules(self):
         self.assertTrue(self.index.is_valid(self.get_one_four_five_path()))
 
+    def test_is_valid_android_skips(self):
+        skips_path = os.path.join(TEMP_DIR, "resources", "android_skips")
+        with open(skips_path, "w") as f:
+            f.write("/sdcard/Android/\n/sdcard/DCIM/.thumbnails\n")
+
+        with mock.patch("backpy.file_index.ANDROID_SKIPS", skips_path):
+            index = FileIndex("/sdcard", adb=True, reading=True)
+
+        self.assertFalse(index.is_valid("/sdcard/Android/data"))
+        self.assertFalse(index.is_valid("/sdcard/DCIM/.thumbnails/1.jpg"))
+        self.assertFalse(index.is_valid("/sdcard/Music/cache"))
+        self.assertTrue(index.is_valid("/sdcard/Android"))
+        self.assertTrue(index.is_valid("/sdcard/DCIM/1.jpg"))
+
     def test_is_valid_skipped_file(self):
         # create fresh index with one exclusion
         expected_rules = ["*four*"]
@@ -115,6 +210,20 @@ class IndexTest(BackpyTest):
 
         self.assertFalse(index.is_valid(self.get_one_four_five_path()))
 
+    def test_gen_index_prunes_skipped_folder(self):
+        index = FileIndex(self.src_root, exclusion_rules=[os.path.join(self.src_root, "one", "*")])
+        index.gen_index()
+
+        self.assertIn(os.path.join(self.src_root, "one"), index.dirs())
+        self.assertNotIn(os.path.join(self.src_root, "one", "four"), index.dirs())
+        self.assertCountEqual(
+            [
+                os.path.join(self.src_root, "three"),
+                os.path.join(self.src_root, "six seven", "eight"),
+            ],
+            index.files(),
+        )
+
     def test_hash_exact_path(self):
         expected_hash = get_file_hash(self.get_one_four_five_path())
 
@@ -139,6 +248,39 @@ class IndexTest(BackpyTest):
 
         self.assertIsNone(actual_hash)
 
+    def test_find_files(self):
+        index = FileIndex(self.src_root)
+        index.gen_index()
+        self.assertEqual([self.get_one_four_five_path()], index.find_files("five"))
+        self.assertEqual([], index.find_files("bad file"))
+
+        # files added after the first lookup are found too
+        other_five = os.path.join(self.src_root, "six seven", "five")
+        self.create_file(other_five, "another five\n")
+        index.gen_index()
+
+        self.assertCountEqual([self.get_one_four_five_path(), other_five], index.find_files("five"))
+        self.assertEqual(
+            index.file_hash(index.find_files("five")[0]), index.file_hash("five", False)
+        )
+
+    @unittest.skipUnless(is_windows(), "Windows only")
+    def test_find_files_ignores_case(self):
+        self.assertEqual([self.get_one_four_five_path()], self.index.find_files("FIVE"))
+
+    def test_find_folder(self):
+        self.assertEqual(os.path.join(self.src_root, "one", "four"), self.index.find_folder("four"))
+        self.assertIsNone(self.index.find_folder("bad folder"))
+
+    def test_files_under(self):
+        one = os.path.join(self.src_root, "one")
+        expected_files = [f for f in self.list_all_files() if f.startswith(one + os.sep)]
+
+        self.assertCountEqual(expected_files, self.index.files_under(one))
+        self.assertCountEqual(expected_files, self.index.files_under(one + os.sep))
+        self.assertCountEqual(self.list_all_files(), self.index.files_under(self.src_root))
+        self.assertEqual([], list(self.index.files_under(os.path.join(self.src_root, "on"))))
+
     def test_is_folder_exact_path(self):
         self.assertTrue(self.index.is_folder(self.src_root))
 
@@ -187,6 +329,103 @@ class IndexTest(BackpyTest):
 
         self.assertEqual(expected_diff, actual_diff)
 
+    def test_get_diff_moved_file(self):
+        old_path = os.path.join(self.src_root, "one", "nine ten")
+        new_path = os.path.join(self.src_root, "six seven", "nine ten")
+        os.rename(old_path, new_path)
+        new_index = FileIndex(self.src_root)
+        new_index.gen_index()
+
+        actual_diff = new_index.get_diff(self.index)
+
+        self.assertEqual([new_path], actual_diff)
+
+    def test_compare_moved_file(self):
+        old_path = os.path.join(self.src_root, "one", "nine ten")
+        new_path = os.path.join(self.src_root, "six seven", "nine ten")
+        os.rename(old_path, new_path)
+        new_index = FileIndex(self.src_root)
+        new_index.gen_index()
+
+        changes = new_index.compare(self.index)
+
+        self.assertEqual([(new_path, old_path)], changes.moved)
+        self.assertEqual([old_path], changes.removed)
+        self.assertEqual([], changes.added)
+        self.assertEqual([], changes.changed)
+
+    def test_compare_copied_file(self):
+        # one/four/five has the same contents as three
+        self.delete_one_four_five()
+        new_index = FileIndex(self.src_root)
+        new_index.gen_index()
+
+        changes = self.index.compare(new_index)
+
+        self.assertEqual(
+            [(self.get_one_four_five_path(), os.path.join(self.src_root, "three"))],
+            changes.moved,
+        )
+        self.assertEqual([], changes.changed)
+
+    def test_compare_moves_not_found_with_checksum(self):
+        old_path = os.path.join(self.src_root, "one", "nine ten")
+        new_path = os.path.join(self.src_root, "six seven", "nine ten")
+        old_index = FileIndex(self.src_root, algorithm="crc32")
+        old_index.gen_index()
+        os.rename(old_path, new_path)
+        new_index = FileIndex(self.src_root, algorithm="crc32")
+        new_index.gen_index()
+
+        changes = new_index.compare(old_index)
+
+        self.assertEqual([], changes.moved)
+        self.assertEqual([new_path], changes.added)
+
+    def test_moves_read_and_write(self):
+        moves = [("/data/new", "/data/old"), ("/data/copy", "/data/old")]
+        self.index.set_moves(moves)
+        tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
+        self.index.write_index(tmp_path)
+        self.index.set_moves([])
+        index = FileIndex(self.src_root, reading=True)
+
+        index.read_index(tmp_path)
+
+        self.assertEqual("/data/old", index.moved_from("/data/new"))
+        self.assertEqual("/data/old", index.moved_from("/data/copy"))
+        self.assertIsNone(index.moved_from("/data/old"))
+
+    def test_compare(self):
+        new_file = os.path.join(self.src_root, "one", "eleven")
+        with open(new_file, "w") as f:
+            f.write("eleven")
+        self.change_one_four_five("some text")
+        self.delete_one_nine_ten()
+        new_index = FileIndex(self.src_root)
+        new_index.gen_index()
+
+        changes = new_index.compare(self.index)
+
+        self.assertEqual([new_file], changes.added)
+        self.assertEqual([self.get_one_four_five_path()], changes.modified)
+        self.assertCountEqual([new_file, self.get_one_four_five_path()], changes.changed)
+        self.assertEqual([os.path.join(self.src_root, "one", "nine ten")], changes.removed)
+        self.assertEqual(len(new_index.files()) - 2, changes.unchanged)
+        self.assertTrue(changes)
+
+    def test_compare_no_change(self):
+        changes = self.index.compare(self.index)
+
+        self.assertFalse(changes)
+        self.assertEqual(len(self.index.files()), changes.unchanged)
+
+    def test_compare_no_index(self):
+        changes = self.index.compare()
+
+        self.assertEqual(self.index.files(), changes.added)
+        self.assertEqual([], changes.removed)
+
     def test_get_missing_no_index(self):
         expected_missing = []
 
@@ -213,7 +452,11 @@ class IndexTest(BackpyTest):
         self.assertEqual(expected_missing, actual_missing)
 
     def test_write_index(self):
-        expected_text = self.file_contents(self.index_147)
+        expected_text = self.file_contents(self.index_147).replace(
+            "[adb=False]",
+            "[adb=False]\n[hash=md5]\n[generated=%.6f]\n[rules=%s]"
+            % (self.index.generated(), self.index.__rules__),
+        )
         tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
 
         self.index.write_index(tmp_path)
@@ -240,6 +483,194 @@ class IndexTest(BackpyTest):
             actual_dirs = self.replace_index_paths(actual_dirs)
         self.assertCountEqual(expected_dirs, actual_dirs)
 
+    def test_read_index_algorithm(self):
+        tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
+        index = FileIndex(self.src_root, algorithm="sha256")
+        index.gen_index()
+        index.write_index(tmp_path)
+
+        read_index = FileIndex(self.src_root)
+        read_index.read_index(tmp_path)
+
+        self.assertEqual("sha256", read_index.algorithm())
+        self.assertEqual(
+            get_file_hash(self.get_one_four_five_path(), algorithm="sha256"),
+            read_index.file_hash(self.get_one_four_five_path()),
+        )
+
+    def test_read_packed_index(self):
+        tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
+        three = os.path.join(self.src_root, "three")
+        index = FileIndex(self.src_root)
+        index.gen_index()
+        index.set_moves([(self.get_one_four_five_path(), three)])
+        index.write_index(tmp_path, packed=True)
+
+        read_index = FileIndex(self.src_root)
+        read_index.read_index(tmp_path)
+
+        self.assertTrue(is_packed(tmp_path))
+        self.assertEqual(index.files(), read_index.files())
+        self.assertCountEqual(index.dirs(), read_index.dirs())
+        for fname in index.files():
+            self.assertEqual(index.file_hash(fname), read_index.file_hash(fname))
+            self.assertEqual(index.quick_hash(fname), read_index.quick_hash(fname))
+        self.assertEqual(index.generated(), read_index.generated())
+        self.assertEqual(index.__rules__, read_index.__rules__)
+        self.assertEqual(three, read_index.moved_from(self.get_one_four_five_path()))
+        self.assertFalse(read_index.compare(index))
+
+    def test_read_objects(self):
+        tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
+        five = self.get_one_four_five_path()
+        index = FileIndex(self.src_root)
+        index.gen_index()
+        three = os.path.join(self.src_root, "three")
+        index.set_objects({five: "ab" * 32}, ".objects", {three: ["cd" * 32, "ef" * 32]})
+        for packed in (False, True):
+            index.write_index(tmp_path, packed=packed)
+
+            read_index = FileIndex(self.src_root, reading=True)
+            read_index.read_index(tmp_path)
+
+            self.assertEqual("ab" * 32, read_index.object_key(five))
+            self.assertIsNone(read_index.object_key(three))
+            self.assertEqual(["cd" * 32, "ef" * 32], read_index.chunk_keys(three))
+            self.assertIsNone(read_index.chunk_keys(five))
+            self.assertEqual(".objects", read_index.object_store())
+        self.assertIsNone(self.index.object_store())
+
+    def test_read_object_stats(self):
+        tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
+        five = self.get_one_four_five_path()
+        three = os.path.join(self.src_root, "three")
+        index = FileIndex(self.src_root)
+        index.gen_index()
+        index.set_objects(
+            {five: "ab" * 32}, ".objects", {three: ["cd" * 32, "ef" * 32]}, {five: (0o755, 1.5)}
+        )
+        for packed in (False, True):
+            index.write_index(tmp_path, packed=packed)
+
+            read_index = FileIndex(self.src_root, reading=True)
+            read_index.read_index(tmp_path)
+
+            self.assertEqual("ab" * 32, read_index.object_key(five))
+            self.assertEqual((0o755, 1.5), read_index.object_stat(five))
+            # not recorded, as by backups made before they were kept
+            self.assertEqual(["cd" * 32, "ef" * 32], read_index.chunk_keys(three))
+            self.assertIsNone(read_index.object_stat(three))
+            self.assertIsNone(read_index.object_stat(os.path.join(self.src_root, "two")))
+
+    def test_read_deltas(self):
+        tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
+        five = self.get_one_four_five_path()
+        index = FileIndex(self.src_root)
+        index.gen_index()
+        index.set_deltas({five: "19800101120000_backup.tar.gz"})
+        for packed in (False, True):
+            index.write_index(tmp_path, packed=packed)
+
+            read_index = FileIndex(self.src_root, reading=True)
+            read_index.read_index(tmp_path)
+
+            self.assertEqual("19800101120000_backup.tar.gz", read_index.delta_base(five))
+            self.assertIsNone(read_index.delta_base(os.path.join(self.src_root, "three")))
+
+    def test_write_index_format_from_config(self):
+        tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
+        self.index.write_index(tmp_path)
+        self.assertFalse(is_packed(tmp_path))
+
+        update_config_file(CONFIG_FILE, INDEX_FORMAT_KEY, "packed")
+        self.index.write_index(tmp_path)
+        self.assertTrue(is_packed(tmp_path))
+
+    def test_read_damaged_packed_index(self):
+        tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
+        self.index.write_index(tmp_path, packed=True)
+        with open(tmp_path, "rb+") as f:
+            f.truncate(os.path.getsize(tmp_path) // 2)
+
+        read_index = FileIndex(self.src_root)
+        read_index.read_index(tmp_path)
+
+        self.assertEqual([], read_index.files())
+
+    def test_read_old_index_algorithm(self):
+        index = FileIndex(self.src_root, algorithm="sha256")
+        index.read_index(self.index_150)
+
+        self.assertEqual("md5", index.algorithm())
+
+    def test_get_diff_other_algorithm_no_change(self):
+        new_index = FileIndex(self.src_root, algorithm="crc32")
+        new_index.gen_index()
+
+        actual_diff = new_index.get_diff(self.index)
+
+        self.assertEqual([], actual_diff)
+
+    def test_get_diff_other_algorithm_changed_file(self):
+        expected_diff = [self.get_one_four_five_path()]
+        self.change_one_four_five("some text")
+        new_index = FileIndex(self.src_root, algorithm="crc32")
+        new_index.gen_index()
+
+        actual_diff = new_index.get_diff(self.index)
+
+        self.assertEqual(expected_diff, actual_diff)
+
+    def make_large_file(self):
+        large_file = os.path.join(self.src_root, "one", "large")
+        with open(large_file, "wb") as f:
+            f.write(os.urandom(QUICK_MIN_SIZE * 2))
+        old_time = time.time() - 3600
+        os.utime(large_file, (old_time, old_time))
+        return large_file
+
+    def test_quick_hash_written_to_index(self):
+        large_file = self.make_large_file()
+        tmp_path = os.path.join(TEMP_DIR, ".{}_index".format(self.timestamp))
+        index = FileIndex(self.src_root)
+        index.gen_index()
+        index.write_index(tmp_path)
+
+        read_index = FileIndex(self.src_root)
+        read_index.read_index(tmp_path)
+
+        self.assertIsNotNone(index.quick_hash(large_file))
+        self.assertIsNone(index.quick_hash(self.get_one_four_five_path()))
+        self.assertEqual(index.quick_hash(large_file), read_index.quick_hash(large_file))
+        self.assertCountEqual(index.files(), read_index.files())
+
+    def test_quick_hash_reuses_previous_hash(self):
+        large_file = self.make_large_file()
+        previous = FileIndex(self.src_root)
+        previous.gen_index()
+
+        with mock.patch("backpy.file_index.get_file_hash", return_value="abc") as mock_hash:
+            index = FileIndex(self.src_root)
+            index.gen_index(previous)
+
+        hashed = [c[0][0] for c in mock_hash.call_args_list]
+        self.assertNotIn(large_file, hashed)
+        self.assertEqual(len(self.list_all_files()), len(hashed))
+        self.assertEqual(previous.file_hash(large_file), index.file_hash(large_file))
+
+    def test_quick_hash_modified_time_changed(self):
+        large_file = self.make_large_file()
+        previous = FileIndex(self.src_root)
+        previous.gen_index()
+        os.utime(large_file)
+
+        with mock.patch("backpy.file_index.get_file_hash", return_value="abc") as mock_hash:
+            index = FileIndex(self.src_root)
+            index.gen_index(previous)
+
+        hashed = [c[0][0] for c in mock_hash.call_args_list]
+        self.assertIn(large_file, hashed)
+
     def test_read_index_not_found(self):
         # create a new index and try to read non-existant index file
         index = FileIndex(self.src_root)
@@ -0,0 +1,124 @@
+"""Tests for object_store module."""
+
+import os
+from hashlib import sha256
+from unittest import mock
+
+from backpy.backup import TEMP_DIR
+from backpy.chunker import Chunker
+from backpy.helpers import delete_temp_files
+from backpy.object_store import ObjectStore
+from .common import BackpyTest
+
+
+class ObjectStoreTest(BackpyTest):
+    def setUp(self):
+        super(ObjectStoreTest, self).setUp()
+        self.store_path = os.path.join(TEMP_DIR, "store")
+        delete_temp_files(self.store_path)
+        self.store = ObjectStore(self.store_path)
+        self.five = os.path.join(self.src_root, "one", "four", "five")
+
+    def tearDown(self):
+        self.store.close()
+        delete_temp_files(self.store_path)
+
+    def write_file(self, name, data):
+        path = os.path.join(TEMP_DIR, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def extracted(self, key):
+        path = os.path.join(TEMP_DIR, "extracted")
+        self.assertTrue(self.store.extract(key, path))
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_add_file(self):
+        key = self.store.add_file(self.five)
+
+        with open(self.five, "rb") as f:
+            data = f.read()
+        self.assertEqual(sha256(data).hexdigest(), key)
+        self.assertIn(key, self.store)
+        self.assertEqual(data, self.extracted(key))
+
+    def test_add_file_twice(self):
+        copy = self.write_file("copy", open(self.five, "rb").read())
+
+        key = self.store.add_file(self.five)
+        self.assertEqual(key, self.store.add_file(copy))
+        self.assertEqual(1, self.store.added())
+
+    def test_add_large_files(self):
+        text = self.write_file("text", b"some text\n" * 1000000)
+        noise = self.write_file("noise", os.urandom(5 * 1024 * 1024))
+
+        for path in (text, noise):
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), self.extracted(self.store.add_file(path)))
+        # text is compressed, noise is stored as it is
+        self.assertLess(
+            os.path.getsize(os.path.join(self.store_path, "pack-000000.pack")),
+            os.path.getsize(text) + os.path.getsize(noise),
+        )
+
+    def test_add_empty_file(self):
+        key = self.store.add_file(self.write_file("empty", b""))
+
+        self.assertEqual(b"", self.extracted(key))
+
+    def test_add_missing_file(self):
+        self.assertIsNone(self.store.add_file(os.path.join(TEMP_DIR, "missing")))
+
+    def test_objects_kept_after_close(self):
+        key = self.store.add_file(self.five)
+        self.store.close()
+
+        self.store = ObjectStore(self.store_path)
+        self.assertIn(key, self.store)
+        self.assertEqual(open(self.five, "rb").read(), self.extracted(key))
+
+    @mock.patch("backpy.object_store.PACK_SIZE", 10)
+    def test_new_pack_when_full(self):
+        first = self.store.add_file(self.five)
+        second = self.store.add_file(self.write_file("other", b"other contents\n" * 10))
+        self.store.close()
+        self.store = ObjectStore(self.store_path)
+        third = self.store.add_file(self.write_file("third", b"third\n"))
+
+        packs = [name for name in os.listdir(self.store_path) if name.endswith(".pack")]
+        self.assertCountEqual(["pack-000000.pack", "pack-000001.pack", "pack-000002.pack"], packs)
+        for key in (first, second, third):
+            self.assertIn(key, self.store)
+
+    def test_add_chunks(self):
+        data = os.urandom(100000)
+        chunker = Chunker(min_size=1000, bits=8, max_size=20000)
+        first = self.store.add_chunks(self.write_file("first", data), chunker)
+        added = self.store.added()
+        edited = data[:50000] + b"edited" + data[50006:]
+        second = self.store.add_chunks(self.write_file("second", edited), chunker)
+
+        self.assertGreater(len(first), 2)
+        # only the chunk with the edit is new
+        self.assertEqual(1, len(set(second) - set(first)))
+        self.assertEqual(added + 1, self.store.added())
+        path = os.path.join(TEMP_DIR, "extracted")
+        self.assertTrue(self.store.extract_chunks(second, path))
+        with open(path, "rb") as f:
+            self.assertEqual(edited, f.read())
+
+    def test_extract_missing_object(self):
+        self.assertFalse(self.store.extract("00" * 32, os.path.join(TEMP_DIR, "extracted")))
+        self.assertFalse(self.store.extract("not a key", os.path.join(TEMP_DIR, "extracted")))
+
+    def test_extract_damaged_object(self):
+        key = self.store.add_file(self.write_file("plain", os.urandom(1000)))
+        self.store.close()
+        with open(os.path.join(self.store_path, "pack-000000.pack"), "r+b") as pack:
+            pack.write(b"damaged")
+
+        self.store = ObjectStore(self.store_path)
+        self.assertFalse(self.store.extract(key, os.path.join(TEMP_DIR, "extracted")))
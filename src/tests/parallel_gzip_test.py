@@ -0,0 +1,56 @@
+"""Tests for parallel_gzip module."""
+
+import gzip
+import io
+import os
+import tarfile
+
+from backpy.backup import TEMP_DIR
+from backpy.helpers import delete_temp_files
+from backpy.parallel_gzip import ParallelGzipWriter, compress_block
+from .common import BackpyTest
+
+
+class ParallelGzipTest(BackpyTest):
+    def setUp(self):
+        super(ParallelGzipTest, self).setUp()
+        self.path = os.path.join(TEMP_DIR, "parallel.gz")
+        self.data = b"".join(b"line %d of some text\n" % i for i in range(5000)) + os.urandom(3000)
+
+    def tearDown(self):
+        delete_temp_files(self.path)
+
+    def test_compress_block(self):
+        self.assertEqual(self.data, gzip.decompress(compress_block(self.data, 1)))
+
+    def test_write_blocks(self):
+        writer = ParallelGzipWriter(self.path, 6, jobs=3, block_size=1000)
+        # writes smaller and larger than a block
+        view = memoryview(self.data)
+        while view:
+            writer.write(view[:700])
+            view = view[700:]
+        self.assertEqual(len(self.data), writer.tell())
+        writer.close()
+        writer.close()
+
+        self.assertTrue(writer.closed)
+        with gzip.open(self.path, "rb") as f:
+            self.assertEqual(self.data, f.read())
+
+    def test_write_empty(self):
+        ParallelGzipWriter(self.path).close()
+
+        with gzip.open(self.path, "rb") as f:
+            self.assertEqual(b"", f.read())
+
+    def test_write_tarfile(self):
+        writer = ParallelGzipWriter(self.path, jobs=2, block_size=4096)
+        with tarfile.open(mode="w", fileobj=writer) as tar:
+            info = tarfile.TarInfo("data")
+            info.size = len(self.data)
+            tar.addfile(info, io.BytesIO(self.data))
+        writer.close()
+
+        with tarfile.open(self.path, "r:*") as tar:
+            self.assertEqual(self.data, tar.extractfile("data").read())
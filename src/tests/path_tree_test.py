@@ -0,0 +1,57 @@
+"""Tests for path_tree module."""
+
+import os
+import unittest
+
+from backpy.helpers import get_folder_index
+from backpy.path_tree import PathTree
+
+
+class PathTreeTest(unittest.TestCase):
+    def setUp(self):
+        root = os.path.join(os.sep, "data", "source")
+        self.dirs = sorted(
+            [
+                root,
+                os.path.join(root, "one"),
+                os.path.join(root, "one", "four"),
+                os.path.join(root, "one two"),
+                os.path.join(root, "one two", "four"),
+                os.path.join(root, "six seven"),
+                os.path.join(root, "six seven", "eight", "one"),
+            ]
+        )
+        self.tree = PathTree(self.dirs)
+
+    def test_find_matches_get_folder_index(self):
+        for name in ["one", "four", "eight", "source", "data", "one two", "missing"]:
+            index = get_folder_index(name, self.dirs)
+            expected = None if index is None else self.dirs[index]
+            self.assertEqual(expected, self.tree.find(name), name)
+
+    def test_find_prefers_folder_name(self):
+        # a folder named one is better than a folder whose parent is named one
+        self.assertEqual(os.path.join(os.sep, "data", "source", "one"), self.tree.find("one"))
+
+    def test_find_parent_above_root(self):
+        # no folder in the tree is named data, so use the first folder below it
+        self.assertEqual(self.dirs[0], self.tree.find("data"))
+
+    def test_contains(self):
+        self.assertIn(self.dirs[1], self.tree)
+        self.assertIn(self.dirs[1] + os.sep, self.tree)
+        self.assertNotIn(os.path.join(os.sep, "data"), self.tree)
+        self.assertNotIn(os.path.join(os.sep, "data", "source", "two"), self.tree)
+        self.assertEqual(len(self.dirs), len(self.tree))
+
+    def test_below(self):
+        one = os.path.join(os.sep, "data", "source", "one")
+
+        self.assertCountEqual([one, os.path.join(one, "four")], self.tree.below(one))
+        # parents of added folders are listed too
+        data = os.path.join(os.sep, "data")
+        eight = os.path.join(os.sep, "data", "source", "six seven", "eight")
+        self.assertCountEqual(self.dirs + [data, eight], self.tree.below(data))
+        self.assertEqual(
+            [os.path.join(os.sep, "missing")], list(self.tree.below(os.sep + "missing"))
+        )
@@ -1,10 +1,13 @@
 """Tests for restore function."""
 
 import os
+import stat
+import tarfile
+import unittest
 
-from backpy.backpy import perform_restore
+from backpy.backpy import perform_restore, set_compression, set_delta_depth, set_storage
 from backpy.backup import Backup, TEMP_DIR
-from backpy.helpers import delete_temp_files
+from backpy.helpers import CONFIG_FILE, delete_temp_files, is_windows
 from . import common
 
 
@@ -245,3 +248,153 @@ class RestoreTest(common.BackpyTest):
         # check restored file contents
         actual_text = self.file_contents(os.path.join(restore_dir, zip_path, "eight"))
         self.assertEqual(expected_text, actual_text)
+
+    def move_nine_ten(self, folder):
+        new_path = os.path.join(folder, "nine ten")
+        os.rename(os.path.join(self.src_root, "one", "nine ten"), new_path)
+        return new_path
+
+    # move a file, backup again, then restore the moved file
+    def test_restore_moved_file(self):
+        self.do_backup()
+        new_path = self.move_nine_ten(os.path.join(self.src_root, "one", "four"))
+        self.do_backup()
+        latest = sorted(os.listdir(os.path.join(self.dest_root, "one")))[-1]
+        with tarfile.open(os.path.join(self.dest_root, "one", latest)) as tar:
+            self.assertNotIn(Backup.get_member_name(new_path)[1], tar.getnames())
+
+        os.unlink(new_path)
+        self.do_restore([new_path], 0)
+
+        self.assertEqual("more text", self.file_contents(new_path))
+
+    # move a file twice, then restore it
+    def test_restore_file_moved_twice(self):
+        self.do_backup()
+        self.move_nine_ten(os.path.join(self.src_root, "one", "four"))
+        self.do_backup()
+        new_folder = os.path.join(self.src_root, "one", "eleven")
+        self.create_folder(new_folder)
+        new_path = os.path.join(new_folder, "nine ten")
+        os.rename(os.path.join(self.src_root, "one", "four", "nine ten"), new_path)
+        self.do_backup()
+
+        os.unlink(new_path)
+        self.do_restore([new_path], 0)
+
+        self.assertEqual("more text", self.file_contents(new_path))
+
+    # rename a folder, backup again, delete everything and do a full restore
+    def test_rename_folder_and_full_restore(self):
+        self.do_backup()
+        new_folder = os.path.join(self.src_root, "one", "fourteen")
+        os.rename(os.path.join(self.src_root, "one", "four"), new_folder)
+        self.do_backup()
+
+        delete_temp_files(new_folder)
+        self.do_restore(chosen_index=0)
+
+        self.assertIn("five", os.listdir(new_folder))
+
+    # do backup 1 with one codec and backup 2 with another, delete everything, full restore
+    def test_full_restore_mixed_compression(self):
+        set_compression(CONFIG_FILE, "bz2")
+        self.do_backup()
+        set_compression(CONFIG_FILE, "none")
+        self.change_one_four_five("some more text")
+        self.do_backup()
+        self.delete_one_four()
+        self.delete_one_nine_ten()
+        self.do_restore(chosen_index=0)
+
+        self.assertIn("nine ten", self.get_files_in_one())
+        with open(self.get_one_four_five_path()) as f:
+            self.assertIn("some more text", f.read())
+
+    # do backup 1 and 2 into an object store, delete everything, full restore
+    def test_full_restore_object_store(self):
+        set_storage(CONFIG_FILE, "store")
+        self.do_backup()
+        self.change_one_four_five("some more text")
+        self.do_backup()
+        self.delete_one_four()
+        self.delete_one_nine_ten()
+        self.do_restore(chosen_index=0)
+
+        self.assertIn("nine ten", self.get_files_in_one())
+        with open(self.get_one_four_five_path()) as f:
+            self.assertIn("some more text", f.read())
+
+    # do backup 1 into an object store, delete 1 file, restore the earlier version by name
+    def test_restore_older_version_object_store(self):
+        set_storage(CONFIG_FILE, "store")
+        self.do_backup()
+        with open(self.get_one_four_five_path()) as f:
+            original = f.read()
+        self.change_one_four_five("some more text")
+        self.do_backup()
+        self.delete_one_four_five()
+        self.do_restore(["five"], 1)
+
+        with open(self.get_one_four_five_path()) as f:
+            self.assertEqual(original, f.read())
+
+    # make a file executable, do backup 1 into an object store, delete it, restore it and
+    # check its permissions and modified time
+    @unittest.skipIf(is_windows(), "*nix only")
+    def test_restore_object_store_file_mode(self):
+        set_storage(CONFIG_FILE, "store")
+        five = self.get_one_four_five_path()
+        os.chmod(five, 0o751)
+        os.utime(five, (1000000000, 1000000000))
+        self.do_backup()
+        self.delete_one_four_five()
+        self.do_restore(["five"], 0)
+
+        st = os.stat(five)
+        self.assertEqual(0o751, stat.S_IMODE(st.st_mode))
+        self.assertEqual(1000000000, st.st_mtime)
+
+    # do backup 1 in chunks, edit part of a large file, do backup 2, delete it, restore it
+    def test_restore_chunked_file(self):
+        set_storage(CONFIG_FILE, "chunks")
+        big = os.path.join(self.src_root, "one", "big")
+        data = bytearray(os.urandom(6 * 1024 * 1024))
+        with open(big, "wb") as f:
+            f.write(data)
+        self.do_backup()
+        store = os.path.join(self.dest_root, "one", ".objects")
+        size_before = self.get_file_size(os.path.join(store, "pack-000000.pack"))
+        data[3000000:3000010] = b"edited 123"
+        with open(big, "r+b") as f:
+            f.seek(3000000)
+            f.write(b"edited 123")
+        self.do_backup()
+        self.delete_files(big)
+        self.do_restore(["big"], 0)
+
+        # only the chunk holding the edit was stored again
+        added = self.get_file_size(os.path.join(store, "pack-000000.pack")) - size_before
+        self.assertLess(added, 2 * 1024 * 1024)
+        with open(big, "rb") as f:
+            self.assertEqual(bytes(data), f.read())
+
+    # do 3 backups with deltas of a large file, delete it, restore each version by name
+    def test_restore_delta_chain(self):
+        set_delta_depth(CONFIG_FILE, "5")
+        big = os.path.join(self.src_root, "one", "big")
+        data = bytearray(os.urandom(3 * 1024 * 1024))
+        versions = []
+        for i in range(3):
+            pos = i * 1000000
+            data[pos:pos] = b"inserted %d" % i
+            with open(big, "wb") as f:
+                f.write(data)
+            versions.append(bytes(data))
+            self.do_backup()
+        for i, version in enumerate(reversed(versions)):
+            self.delete_files(big)
+            self.do_restore(["big"], i)
+
+            with open(big, "rb") as f:
+                self.assertEqual(version, f.read())
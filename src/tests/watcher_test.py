@@ -0,0 +1,248 @@
+"""Tests for watcher module."""
+
+import os
+import time
+from unittest import mock, skipUnless
+
+from backpy.backup import TEMP_DIR
+from backpy.file_index import FileIndex
+from backpy.hash_cache import HashCache
+from backpy.helpers import get_file_hash
+from backpy.watcher import InotifyWatcher, Journal, PollingWatcher, Watcher
+from .common import BackpyTest
+
+
+class JournalTest(BackpyTest):
+    def setUp(self):
+        super(JournalTest, self).setUp()
+        self.journal_path = os.path.join(TEMP_DIR, "resources", "journal")
+        self.journal = Journal(self.src_root, self.journal_path)
+        self.journal.open()
+        self.journal.mark_started()
+
+    def tearDown(self):
+        self.journal.close()
+        super(JournalTest, self).tearDown()
+
+    def test_changes_since(self):
+        generated = time.time()
+        self.journal.record(["a"], generated - 10)
+        self.journal.record(["b", "c"])
+
+        changed = Journal(self.src_root, self.journal_path).changes_since(generated)
+
+        self.assertEqual({"b", "c"}, changed)
+
+    def test_started_after_index(self):
+        self.journal.record(["a"])
+
+        self.assertIsNone(self.journal.changes_since(time.time() - 10))
+
+    def test_overflow(self):
+        generated = time.time()
+        self.journal.record(["a"])
+        self.journal.mark_overflow()
+
+        self.assertIsNone(self.journal.changes_since(generated))
+
+    def test_stopped(self):
+        generated = time.time()
+        self.journal.record(["a"])
+        self.journal.close()
+
+        self.assertIsNone(self.journal.changes_since(generated))
+
+    def test_no_journal(self):
+        journal = Journal(self.src_root, os.path.join(TEMP_DIR, "missing"))
+
+        self.assertIsNone(journal.changes_since(time.time()))
+
+    def test_no_generated_time(self):
+        self.assertIsNone(self.journal.changes_since(None))
+
+    def test_compact(self):
+        generated = time.time()
+        with mock.patch("backpy.watcher.JOURNAL_COMPACT_LINES", 5):
+            for _ in range(10):
+                self.journal.record(["a", "b"])
+        self.journal.record(["c"])
+
+        with open(self.journal_path) as f:
+            lines = f.readlines()
+        self.assertLess(len(lines), 10)
+        self.assertEqual({"a", "b", "c"}, self.journal.changes_since(generated))
+
+    def test_heartbeat(self):
+        generated = time.time() + 1
+        self.journal.record(["a"])
+
+        with mock.patch("backpy.watcher.time.time", return_value=generated + 120):
+            self.journal.mark_alive()
+        with mock.patch("backpy.watcher.time.time", return_value=generated + 250):
+            self.assertEqual({"a"}, self.journal.changes_since(generated))
+
+    def test_heartbeat_stale(self):
+        generated = time.time()
+        self.journal.record(["a"])
+
+        # the pid may have been reused by another process
+        with mock.patch("backpy.watcher.time.time", return_value=generated + 600):
+            self.assertIsNone(self.journal.changes_since(generated))
+
+    def test_open_in_use(self):
+        self.journal.close()
+        with open(self.journal_path, "w") as f:
+            f.write("[version=1]\n[pid=%d]\n[started=%f]\n" % (os.getppid(), time.time()))
+
+        self.assertFalse(Journal(self.src_root, self.journal_path).open())
+
+    def test_open_heartbeat_stale(self):
+        self.journal.close()
+        with open(self.journal_path, "w") as f:
+            f.write("[version=1]\n[pid=%d]\n[started=%f]\n" % (os.getppid(), time.time() - 3600))
+
+        journal = Journal(self.src_root, self.journal_path)
+        self.assertTrue(journal.open())
+        journal.close()
+
+
+class JournalIndexTest(BackpyTest):
+    def setUp(self):
+        super(JournalIndexTest, self).setUp()
+        self.journal = Journal(self.src_root, os.path.join(TEMP_DIR, "resources", "journal"))
+        self.journal.open()
+        self.journal.mark_started()
+        self.previous = FileIndex(self.src_root)
+        self.previous.gen_index()
+
+    def tearDown(self):
+        self.journal.close()
+        super(JournalIndexTest, self).tearDown()
+
+    def gen_index(self, exclusion_rules=None):
+        index = FileIndex(self.src_root, exclusion_rules, journal=self.journal)
+        index.gen_index(self.previous)
+        return index
+
+    def test_index_from_journal(self):
+        new_folder = os.path.join(self.src_root, "one", "eleven")
+        new_file = os.path.join(new_folder, "twelve")
+        os.mkdir(new_folder)
+        with open(new_file, "w") as f:
+            f.write("twelve")
+        self.change_one_four_five("some more text")
+        self.delete_one_nine_ten()
+        self.journal.record(
+            [
+                new_folder,
+                self.get_one_four_five_path(),
+                os.path.join(self.src_root, "one", "nine ten"),
+            ]
+        )
+
+        actual = self.gen_index()
+
+        expected = FileIndex(self.src_root)
+        expected.gen_index()
+        self.assertCountEqual(expected.files(), actual.files())
+        self.assertEqual(expected.dirs(), actual.dirs())
+        for f in expected.files():
+            self.assertEqual(expected.file_hash(f), actual.file_hash(f))
+
+    def test_hash_cache_kept(self):
+        cache_path = os.path.join(TEMP_DIR, "resources", "hash_cache")
+        # cache ignores recently modified files, so make the source files look old
+        old_time = time.time() - 3600
+        for f in self.previous.files():
+            os.utime(f, (old_time, old_time))
+        FileIndex(self.src_root, hash_cache=HashCache(self.src_root, path=cache_path)).gen_index()
+        self.change_one_four_five("some more text")
+        self.journal.record([self.get_one_four_five_path()])
+
+        index = FileIndex(
+            self.src_root,
+            journal=self.journal,
+            hash_cache=HashCache(self.src_root, path=cache_path),
+        )
+        index.gen_index(self.previous)
+
+        cache = HashCache(self.src_root, path=cache_path)
+        cache.load()
+        for f in self.previous.files():
+            if f != self.get_one_four_five_path():
+                self.assertEqual((self.previous.file_hash(f), None), cache.get(f, os.stat(f)), f)
+
+    def test_unrecorded_change_not_read(self):
+        self.change_one_four_five("some more text")
+
+        index = self.gen_index()
+
+        path = self.get_one_four_five_path()
+        self.assertEqual(self.previous.file_hash(path), index.file_hash(path))
+
+    def test_rules_changed(self):
+        self.change_one_four_five("some more text")
+
+        index = self.gen_index(["*/nine*"])
+
+        path = self.get_one_four_five_path()
+        self.assertEqual(get_file_hash(path), index.file_hash(path))
+
+
+class WatcherTest(BackpyTest):
+    def setUp(self):
+        super(WatcherTest, self).setUp()
+        self.journal = Journal(self.src_root, os.path.join(TEMP_DIR, "resources", "journal"))
+
+    def make_changes(self):
+        new_folder = os.path.join(self.src_root, "one", "eleven")
+        os.mkdir(new_folder)
+        self.change_one_four_five("some more text")
+        self.delete_one_nine_ten()
+        os.rename(os.path.join(self.src_root, "six seven"), os.path.join(self.src_root, "six"))
+        return {
+            new_folder,
+            self.get_one_four_five_path(),
+            os.path.join(self.src_root, "one", "nine ten"),
+            os.path.join(self.src_root, "six seven"),
+            os.path.join(self.src_root, "six"),
+        }
+
+    def check_watcher(self, watcher, timeout):
+        self.assertTrue(watcher.start())
+        generated = time.time()
+        try:
+            expected = self.make_changes()
+            changed = set()
+            for _ in range(10):
+                watcher.check(timeout)
+                changed = self.journal.changes_since(generated)
+                if expected <= changed:
+                    break
+        finally:
+            watcher.close()
+        self.assertLessEqual(expected, changed)
+
+    @skipUnless(InotifyWatcher.is_supported(), "inotify not available")
+    def test_inotify_watcher(self):
+        self.check_watcher(InotifyWatcher([self.journal]), 0.1)
+
+    def test_polling_watcher(self):
+        self.check_watcher(PollingWatcher([self.journal]), 0)
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            Watcher([self.journal])
+
+    def test_heartbeat(self):
+        watcher = PollingWatcher([self.journal], 600)
+        self.assertTrue(watcher.start())
+        generated = time.time() + 1
+        try:
+            with mock.patch("backpy.watcher.time.time", return_value=generated + 1200):
+                watcher.heartbeat()
+                self.assertEqual(set(), self.journal.changes_since(generated))
+            with mock.patch("backpy.watcher.time.time", return_value=generated + 3100):
+                self.assertIsNone(self.journal.changes_since(generated))
+        finally:
+            watcher.close()